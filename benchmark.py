@@ -0,0 +1,310 @@
+"""Нагрузочные замеры ServerManager на синтетических наборах серверов.
+
+Работает без интерфейса, браузера и сети: каждый замер выполняется во
+временном каталоге с собственными app_settings.json и servers.json, а
+"серверы" - маленькие sh скрипты. Результат - JSON для сравнения версий:
+
+    python benchmark.py --sizes 10,100,1000,10000 --output bench.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import main
+
+# Скрипты-заменители серверов
+SCRIPTS = {
+    # Печатает вывод и выполняет команды из stdin: stop - штатное завершение, crash - падение
+    'printer': '''echo "Starting stand-in server"
+echo "Done (0.001s)! For help, type \\"help\\""
+while read -r line; do
+  case "$line" in
+    stop) echo "Stopping server"; exit 0 ;;
+    crash) echo "Crashing"; exit 1 ;;
+    *) echo "$line" ;;
+  esac
+done
+''',
+    # Не читает stdin, завершается только сигналом
+    'sleeper': 'exec sleep 3600\n',
+    # Игнорирует stdin и SIGTERM, завершается только SIGKILL
+    'stubborn': "trap '' TERM\nwhile :; do sleep 1; done\n",
+}
+
+BENCH_SETTINGS = {
+    'save_interval': 3600,
+    'kill_timeout': 1,
+    'health_probe': False,
+    'log_archive': False,
+    'telemetry_interval': 5.0
+}
+
+
+def distribution(values):
+    """Сводка распределения в миллисекундах"""
+    if not values:
+        return None
+    ordered = sorted(value * 1000 for value in values)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        'count': len(ordered),
+        'min': ordered[0],
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': ordered[-1],
+        'mean': sum(ordered) / len(ordered)
+    }
+
+
+@contextlib.contextmanager
+def workspace(settings):
+    """Временный рабочий каталог с настройками и скриптами серверов"""
+    previous = os.getcwd()
+    directory = tempfile.mkdtemp(prefix='serwhat-bench-')
+    try:
+        os.chdir(directory)
+        with open('app_settings.json', 'w', encoding='utf-8') as f:
+            json.dump({**BENCH_SETTINGS, **settings}, f)
+        for kind, text in SCRIPTS.items():
+            with open(f'{kind}.sh', 'w', encoding='utf-8') as f:
+                f.write(text)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            yield directory
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def write_fleet(size, rng):
+    """servers.json с size определениями, указывающими на скрипты-заменители"""
+    kinds = sorted(SCRIPTS)
+    servers = []
+    for server_id in range(1, size + 1):
+        servers.append(main.ServerRecord(
+            id=server_id,
+            name=f'server-{server_id:05d}-{rng.randrange(16 ** 6):06x}',
+            bat_path=os.path.abspath(f'{rng.choice(kinds)}.sh'),
+            description='x' * rng.randrange(0, 200),
+            server_port=str(20000 + server_id),
+            created_at='2024-01-01T00:00:00'
+        ).to_config())
+    main.write_file_atomic('servers.json', json.dumps({'next_id': size + 1, 'servers': servers},
+                                                      ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def timed(function, *args):
+    """Время выполнения function в секундах и ее результат"""
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def bench_fleet(size, storage, seed):
+    """Загрузка, запись и выдача списка для набора из size серверов"""
+    with workspace({'storage': storage}):
+        write_fleet(size, random.Random(seed))
+        manager = main.ServerManager()
+        try:
+            manager.servers.clear()
+            load_time, _ = timed(manager.load_servers)
+
+            for server in manager.servers.values():
+                manager.save_servers(server)
+            full_flush_time, full_written = timed(manager.store.flush)
+
+            server = manager.get_server(1)
+            manager.update_server(1, description=server.description + '!')
+            single_flush_time, single_written = timed(manager.store.flush)
+
+            get_servers_time, servers = timed(manager.get_servers)
+            payload = json.dumps(servers, ensure_ascii=False).encode('utf-8')
+        finally:
+            manager.shutdown()
+    return {
+        'size': size,
+        'storage': storage,
+        'load_servers_ms': load_time * 1000,
+        'loaded': len(servers),
+        'full_save': {'ms': full_flush_time * 1000, 'written': full_written},
+        'single_update_save': {'ms': single_flush_time * 1000, 'written': single_written},
+        # Для json - байты, для sqlite - число записанных строк
+        'written_unit': 'rows' if storage == 'sqlite' else 'bytes',
+        'get_servers_ms': get_servers_time * 1000,
+        'get_servers_payload_bytes': len(payload)
+    }
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def bench_lifecycle(processes, idle_seconds):
+    """Задержки запуска, остановки, обнаружения завершения и нагрузка в простое"""
+    with workspace({}):
+        manager = main.ServerManager()
+        first_output = {}
+        stopped_at = {}
+
+        def listener(event, payload):
+            now = time.monotonic()
+            if event == 'console_lines':
+                for item in payload:
+                    first_output.setdefault(item['server_id'], now)
+            elif event == 'server_status' and payload['status'] == 'stopped':
+                stopped_at[payload['server_id']] = now
+
+        manager.add_listener(listener)
+        try:
+            def add(kind, count, stop_timeout=1):
+                ids = []
+                for i in range(count):
+                    server = manager.add_server(f'{kind}-{i}', os.path.abspath(f'{kind}.sh'), '')['server']
+                    manager.get_server(server['id']).stop_timeout = stop_timeout
+                    ids.append(server['id'])
+                return ids
+
+            def start(ids):
+                for server_id in ids:
+                    manager.start_server(server_id)
+
+            def stop(ids):
+                entries = {server_id: manager.processes[server_id] for server_id in ids}
+                started = {}
+                for server_id in ids:
+                    started[server_id] = time.monotonic()
+                    manager.stop_server(server_id)
+                latencies = []
+                for server_id, entry in entries.items():
+                    entry.exited.wait(30)
+                    wait_for(lambda: server_id in stopped_at, 5)
+                    latencies.append(stopped_at.get(server_id, time.monotonic()) - started[server_id])
+                return latencies
+
+            printers = add('printer', processes)
+            launched = {}
+            launch_latencies = []
+            for server_id in printers:
+                launched[server_id] = time.monotonic()
+                manager.start_server(server_id)
+                launch_latencies.append(time.monotonic() - launched[server_id])
+            wait_for(lambda: len(first_output) >= len(printers), 10)
+            output_latencies = [first_output[server_id] - launched[server_id]
+                                for server_id in printers if server_id in first_output]
+
+            # Нагрузка фоновых потоков менеджера, пока все серверы работают
+            cpu_started, wall_started = time.process_time(), time.monotonic()
+            time.sleep(idle_seconds)
+            idle_cpu = (time.process_time() - cpu_started) / (time.monotonic() - wall_started)
+
+            check_latencies = []
+            for _ in range(20):
+                latency, _ = timed(manager.check_processes_status)
+                check_latencies.append(latency)
+
+            stop_latencies = stop(printers)
+
+            # Падение: время от команды crash до обнаружения завершения
+            for server_id in printers:
+                stopped_at.pop(server_id, None)
+            start(printers)
+            crash_at = {}
+            for server_id in printers:
+                stdin = manager.processes[server_id].popen.stdin
+                crash_at[server_id] = time.monotonic()
+                stdin.write(b'crash\n')
+                stdin.flush()
+            wait_for(lambda: all(server_id in stopped_at for server_id in printers), 10)
+            exit_latencies = [stopped_at[server_id] - crash_at[server_id]
+                              for server_id in printers if server_id in stopped_at]
+
+            # Эскалация: SIGTERM после stop_timeout и SIGKILL после kill_timeout
+            escalation = min(processes, 5)
+            sleepers = add('sleeper', escalation)
+            stubborn = add('stubborn', escalation)
+            start(sleepers + stubborn)
+            time.sleep(0.2)
+            sigterm_latencies = stop(sleepers)
+            sigkill_latencies = stop(stubborn)
+        finally:
+            manager.shutdown()
+    return {
+        'processes': processes,
+        'launch_ms': distribution(launch_latencies),
+        'first_output_ms': distribution(output_latencies),
+        'stop_command_ms': distribution(stop_latencies),
+        'stop_sigterm_ms': distribution(sigterm_latencies),
+        'stop_sigkill_ms': distribution(sigkill_latencies),
+        'exit_detection_ms': distribution(exit_latencies),
+        'check_processes_status_ms': distribution(check_latencies),
+        'idle_seconds': idle_seconds,
+        'idle_cpu_percent': idle_cpu * 100
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main_benchmark(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочные замеры менеджера серверов')
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='размеры наборов серверов через запятую')
+    parser.add_argument('--storage', default='json,sqlite', help='хранилища через запятую (json, sqlite)')
+    parser.add_argument('--processes', type=int, default=20,
+                        help='число запускаемых серверов для замеров задержек (0 - пропустить)')
+    parser.add_argument('--idle-seconds', type=float, default=5.0, help='длительность замера простоя')
+    parser.add_argument('--seed', type=int, default=1, help='seed генератора наборов')
+    parser.add_argument('--output', help='файл для результата (по умолчанию stdout)')
+    args = parser.parse_args(argv)
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'fleet': [],
+        'lifecycle': None
+    }
+    for size in [int(size) for size in args.sizes.split(',') if size]:
+        for storage in [storage for storage in args.storage.split(',') if storage]:
+            print(f"Набор {size} серверов, хранилище {storage}", file=sys.stderr)
+            results['fleet'].append(bench_fleet(size, storage, args.seed))
+    if args.processes > 0:
+        print(f"Жизненный цикл {args.processes} серверов", file=sys.stderr)
+        results['lifecycle'] = bench_lifecycle(args.processes, args.idle_seconds)
+
+    data = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main_benchmark())
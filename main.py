@@ -1,649 +1,4879 @@
-import eel
-import json
-import os
-import subprocess
-import psutil
-import platform
-import threading
-import time
-from datetime import datetime
-from os.path import abspath, exists
-
-# Инициализация Eel
-eel.init(abspath('web'))
-
-
-class ServerManager:
-    def __init__(self):
-        self.servers_file = 'servers.json'
-        self.settings_file = 'app_settings.json'
-        self.servers = self.load_servers()
-        self.processes = {}
-        self.process_checker_running = True
-        self.start_process_checker()
-        print("ServerManager инициализирован")
-
-    def start_process_checker(self):
-        """Запуск фоновой проверки процессов"""
-
-        def checker():
-            while self.process_checker_running:
-                try:
-                    self.check_processes_status()
-                    time.sleep(3)
-                except Exception as e:
-                    print(f"Ошибка в проверке процессов: {e}")
-
-        thread = threading.Thread(target=checker, daemon=True)
-        thread.start()
-
-    def check_processes_status(self):
-        """Проверка статуса всех процессов"""
-        for server_id, pid in list(self.processes.items()):
-            try:
-                process = psutil.Process(pid)
-                if not process.is_running():
-                    del self.processes[server_id]
-                    server = next((s for s in self.servers if s['id'] == server_id), None)
-                    if server and server['status'] == 'running':
-                        server['status'] = 'stopped'
-                        self.save_servers()
-                        print(f"Сервер {server_id} завершен")
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                if server_id in self.processes:
-                    del self.processes[server_id]
-                    server = next((s for s in self.servers if s['id'] == server_id), None)
-                    if server and server['status'] == 'running':
-                        server['status'] = 'stopped'
-                        self.save_servers()
-
-    def load_servers(self):
-        """Загрузка серверов из JSON файла"""
-        if os.path.exists(self.servers_file):
-            try:
-                with open(self.servers_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for server in data:
-                        if 'stop_method' not in server:
-                            server['stop_method'] = 'stop_command'
-                        if 'display_cmd' not in server:
-                            server['display_cmd'] = False
-                        if 'icon_position' not in server:
-                            server['icon_position'] = 'left'
-                        if 'server_ip' not in server:
-                            server['server_ip'] = 'localhost'
-                        if 'server_port' not in server:
-                            server['server_port'] = '25565'
-                    print(f"Загружено {len(data)} серверов")
-                    return data
-            except Exception as e:
-                print(f"Ошибка загрузки серверов: {e}")
-                return []
-        print("Файл серверов не найден, создаем новый")
-        return []
-
-    def save_servers(self):
-        """Сохранение серверов в JSON файл"""
-        try:
-            with open(self.servers_file, 'w', encoding='utf-8') as f:
-                json.dump(self.servers, f, ensure_ascii=False, indent=2)
-            print("Серверы сохранены")
-        except Exception as e:
-            print(f"Ошибка сохранения серверов: {e}")
-
-    def get_app_settings(self):
-        """Получение настроек приложения"""
-        default_settings = {
-            'language': 'ru',
-            'theme': 'dark'
-        }
-
-        if os.path.exists(self.settings_file):
-            try:
-                with open(self.settings_file, 'r', encoding='utf-8') as f:
-                    return {**default_settings, **json.load(f)}
-            except:
-                return default_settings
-        return default_settings
-
-    def save_app_settings(self, settings):
-        """Сохранение настроек приложения"""
-        try:
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, ensure_ascii=False, indent=2)
-            print("Настройки приложения сохранены")
-            return True
-        except Exception as e:
-            print(f"Ошибка сохранения настроек: {e}")
-            return False
-
-    def add_server(self, name, bat_path, description, icon_path=None, stop_method='stop_command', display_cmd=False,
-                   icon_position='left', server_ip='localhost', server_port='25565'):
-        """Добавление нового сервера"""
-        try:
-            print(f"Добавление сервера: {name}, {bat_path}")
-
-            # Проверяем обязательные поля
-            if not name or not bat_path:
-                return {'success': False, 'error': 'Заполните название и путь к BAT файлу'}
-
-            server_id = len(self.servers) + 1
-            server = {
-                'id': server_id,
-                'name': name,
-                'bat_path': bat_path,
-                'description': description,
-                'icon_path': icon_path,
-                'stop_method': stop_method,
-                'display_cmd': display_cmd,
-                'icon_position': icon_position,
-                'server_ip': server_ip,
-                'server_port': server_port,
-                'created_at': datetime.now().isoformat(),
-                'status': 'stopped'
-            }
-
-            self.servers.append(server)
-            self.save_servers()
-
-            print(f"Сервер успешно добавлен с ID: {server_id}")
-            return {'success': True, 'server': server}
-
-        except Exception as e:
-            print(f"Ошибка при добавлении сервера: {e}")
-            return {'success': False, 'error': str(e)}
-
-    def update_server(self, server_id, name=None, bat_path=None, description=None, icon_path=None, stop_method=None,
-                      display_cmd=None, icon_position=None, server_ip=None, server_port=None):
-        """Обновление настроек сервера"""
-        try:
-            server = next((s for s in self.servers if s['id'] == server_id), None)
-            if not server:
-                return False
-
-            updates = []
-            if name is not None and server['name'] != name:
-                server['name'] = name
-                updates.append('name')
-            if bat_path is not None and server['bat_path'] != bat_path:
-                server['bat_path'] = bat_path
-                updates.append('bat_path')
-            if description is not None and server['description'] != description:
-                server['description'] = description
-                updates.append('description')
-            if icon_path is not None and server['icon_path'] != icon_path:
-                server['icon_path'] = icon_path
-                updates.append('icon_path')
-            if stop_method is not None and server['stop_method'] != stop_method:
-                server['stop_method'] = stop_method
-                updates.append('stop_method')
-            if display_cmd is not None and server['display_cmd'] != display_cmd:
-                server['display_cmd'] = display_cmd
-                updates.append('display_cmd')
-            if icon_position is not None and server['icon_position'] != icon_position:
-                server['icon_position'] = icon_position
-                updates.append('icon_position')
-            if server_ip is not None and server['server_ip'] != server_ip:
-                server['server_ip'] = server_ip
-                updates.append('server_ip')
-            if server_port is not None and server['server_port'] != server_port:
-                server['server_port'] = server_port
-                updates.append('server_port')
-
-            if updates:
-                self.save_servers()
-                print(f"Сервер {server_id} обновлен: {', '.join(updates)}")
-
-            return True
-
-        except Exception as e:
-            print(f"Ошибка обновления сервера: {e}")
-            return False
-
-    def remove_server(self, server_id):
-        """Удаление сервера"""
-        try:
-            if server_id in self.processes:
-                self.stop_server(server_id)
-
-            initial_count = len(self.servers)
-            self.servers = [s for s in self.servers if s['id'] != server_id]
-
-            if len(self.servers) < initial_count:
-                self.save_servers()
-                print(f"Сервер {server_id} удален")
-                return True
-            else:
-                print(f"Сервер {server_id} не найден для удаления")
-                return False
-
-        except Exception as e:
-            print(f"Ошибка удаления сервера: {e}")
-            return False
-
-    def start_server(self, server_id):
-        """Запуск сервера в отдельном окне командной строки"""
-        try:
-            server = next((s for s in self.servers if s['id'] == server_id), None)
-            if not server:
-                return {'success': False, 'error': 'Сервер не найден'}
-
-            bat_path = server['bat_path']
-
-            if not exists(bat_path):
-                return {'success': False, 'error': f'BAT файл не найден: {bat_path}'}
-
-            server_dir = os.path.dirname(bat_path) or os.getcwd()
-
-            print(f"Запуск сервера {server_id}: {bat_path} в {server_dir}")
-
-            process = subprocess.Popen(
-                ['cmd.exe', '/c', bat_path],
-                cwd=server_dir,
-                creationflags=subprocess.CREATE_NEW_CONSOLE
-            )
-
-            self.processes[server_id] = process.pid
-            server['status'] = 'running'
-            server['started_at'] = datetime.now().isoformat()
-            self.save_servers()
-
-            print(f"Сервер {server_id} запущен с PID: {process.pid}")
-            return {'success': True}
-
-        except Exception as e:
-            print(f"Ошибка запуска сервера: {e}")
-            return {'success': False, 'error': str(e)}
-
-    def stop_server(self, server_id):
-        """Остановка сервера"""
-        try:
-            server = next((s for s in self.servers if s['id'] == server_id), None)
-            if not server or server_id not in self.processes:
-                return {'success': False, 'error': 'Сервер не запущен'}
-
-            pid = self.processes[server_id]
-            print(f"Остановка сервера {server_id} (PID: {pid}) методом: {server['stop_method']}")
-
-            if server['stop_method'] == 'stop_command':
-                time.sleep(2)  # Даем время для graceful shutdown
-            else:
-                # Принудительное закрытие
-                try:
-                    subprocess.run(['taskkill', '/f', '/pid', str(pid)], check=True, timeout=10)
-                except:
-                    try:
-                        process = psutil.Process(pid)
-                        process.terminate()
-                        process.wait(timeout=5)
-                    except:
-                        pass
-
-            if server_id in self.processes:
-                del self.processes[server_id]
-
-            server['status'] = 'stopped'
-            self.save_servers()
-
-            print(f"Сервер {server_id} остановлен")
-            return {'success': True}
-
-        except Exception as e:
-            print(f"Ошибка остановки сервера: {e}")
-            return {'success': False, 'error': str(e)}
-
-    def select_file_dialog(self, file_type="bat"):
-        """Диалог выбора файла"""
-        try:
-            import tkinter as tk
-            from tkinter import filedialog
-
-            root = tk.Tk()
-            root.withdraw()
-            root.attributes('-topmost', True)
-
-            if file_type == "bat":
-                file_path = filedialog.askopenfilename(
-                    title="Выберите .bat файл сервера",
-                    filetypes=[("Batch files", "*.bat"), ("All files", "*.*")]
-                )
-            else:
-                file_path = filedialog.askopenfilename(
-                    title="Выберите файл иконки",
-                    filetypes=[("Image files", "*.png *.jpg *.jpeg *.ico *.bmp"), ("All files", "*.*")]
-                )
-
-            root.destroy()
-            print(f"Выбран файл: {file_path}")
-            return file_path
-
-        except Exception as e:
-            print(f"Ошибка диалога выбора файла: {e}")
-            return ""
-
-    def get_system_info(self):
-        """Получение информации о системе"""
-        return {
-            'platform': platform.system(),
-            'platform_version': platform.version(),
-            'architecture': platform.architecture()[0],
-            'processor': platform.processor(),
-            'python_version': platform.python_version()
-        }
-
-
-# Создаем экземпляр менеджера
-manager = ServerManager()
-
-
-# Eel функции
-@eel.expose
-def get_servers():
-    print("Запрос списка серверов")
-    return manager.servers
-
-
-@eel.expose
-def add_server(name, bat_path, description, icon_path=None, stop_method='stop_command', display_cmd=False,
-               icon_position='left', server_ip='localhost', server_port='25565'):
-    print(f"Вызов add_server: {name}, {bat_path}")
-    return manager.add_server(name, bat_path, description, icon_path, stop_method, display_cmd, icon_position,
-                              server_ip, server_port)
-
-
-@eel.expose
-def update_server(server_id, name, bat_path, description, icon_path, stop_method, display_cmd, icon_position, server_ip,
-                  server_port):
-    print(f"Вызов update_server для сервера {server_id}")
-    return manager.update_server(server_id, name, bat_path, description, icon_path, stop_method, display_cmd,
-                                 icon_position, server_ip, server_port)
-
-
-@eel.expose
-def remove_server(server_id):
-    print(f"Вызов remove_server для сервера {server_id}")
-    return manager.remove_server(server_id)
-
-
-@eel.expose
-def start_server(server_id):
-    print(f"Вызов start_server для сервера {server_id}")
-    return manager.start_server(server_id)
-
-
-@eel.expose
-def stop_server(server_id):
-    print(f"Вызов stop_server для сервера {server_id}")
-    return manager.stop_server(server_id)
-
-
-@eel.expose
-def select_file(file_type):
-    print(f"Вызов select_file для типа: {file_type}")
-    return manager.select_file_dialog(file_type)
-
-
-@eel.expose
-def get_server_info(server_id):
-    server = next((s for s in manager.servers if s['id'] == server_id), None)
-    if server:
-        return {
-            'server': server,
-            'system_info': manager.get_system_info()
-        }
-    return None
-
-
-@eel.expose
-def get_app_settings():
-    return manager.get_app_settings()
-
-
-@eel.expose
-def save_app_settings(settings):
-    return manager.save_app_settings(settings)
-
-
-@eel.expose
-def get_app_version():
-    return {
-        'version': '1.2.0',
-        'credits': '0vfx, deepseek'
-    }
-
-
-if __name__ == "__main__":
-    print("=" * 50)
-    print("Запуск менеджера серверов Minecraft v1.2.0")
-    print("Разработчики: 0vfx, deepseek")
-    print("=" * 50)
-
-    try:
-        eel.start('index.html', size=(1000, 700), mode='chrome', port=8000)
-    except Exception as e:
-        print(f"Ошибка запуска: {e}")
-    finally:
-        manager.process_checker_running = False
-        print("Приложение завершено")
-    def save_servers(self):
-        """Сохранение серверов в JSON файл"""
-        with open(self.servers_file, 'w', encoding='utf-8') as f:
-            json.dump(self.servers, f, ensure_ascii=False, indent=2)
-
-    def add_server(self, name, bat_path, description, icon_path=None, stop_method='stop_command', display_cmd=False):
-        """Добавление нового сервера"""
-        server = {
-            'id': len(self.servers) + 1,
-            'name': name,
-            'bat_path': bat_path,
-            'description': description,
-            'icon_path': icon_path,
-            'stop_method': stop_method,
-            'display_cmd': display_cmd,
-            'created_at': datetime.now().isoformat(),
-            'status': 'stopped'
-        }
-        self.servers.append(server)
-        self.save_servers()
-        return server
-
-    def update_server(self, server_id, name=None, bat_path=None, description=None, icon_path=None, stop_method=None,
-                      display_cmd=None):
-        """Обновление настроек сервера"""
-        server = next((s for s in self.servers if s['id'] == server_id), None)
-        if server:
-            if name is not None:
-                server['name'] = name
-            if bat_path is not None:
-                server['bat_path'] = bat_path
-            if description is not None:
-                server['description'] = description
-            if icon_path is not None:
-                server['icon_path'] = icon_path
-            if stop_method is not None:
-                server['stop_method'] = stop_method
-            if display_cmd is not None:
-                server['display_cmd'] = display_cmd
-
-            self.save_servers()
-            return True
-        return False
-
-    def remove_server(self, server_id):
-        """Удаление сервера"""
-        if server_id in self.processes:
-            self.stop_server(server_id)
-
-        self.servers = [s for s in self.servers if s['id'] != server_id]
-        self.save_servers()
-        return True
-
-    def start_server(self, server_id):
-        """Запуск сервера в отдельном окне командной строки"""
-        server = next((s for s in self.servers if s['id'] == server_id), None)
-        if server:
-            try:
-                bat_path = server['bat_path']
-                server_dir = os.path.dirname(bat_path)
-
-                # Запуск в отдельном окне командной строки
-                process = subprocess.Popen(
-                    ['cmd.exe', '/c', bat_path],
-                    cwd=server_dir,
-                    creationflags=subprocess.CREATE_NEW_CONSOLE
-                )
-
-                self.processes[server_id] = process.pid
-                server['status'] = 'running'
-                server['started_at'] = datetime.now().isoformat()
-                self.save_servers()
-
-                return True
-            except Exception as e:
-                print(f"Ошибка запуска: {e}")
-                return False
-        return False
-
-    def stop_server(self, server_id):
-        """Остановка сервера в зависимости от выбранного метода"""
-        server = next((s for s in self.servers if s['id'] == server_id), None)
-        if not server or server_id not in self.processes:
-            return False
-
-        try:
-            pid = self.processes[server_id]
-            process = psutil.Process(pid)
-
-            if server['stop_method'] == 'stop_command':
-                # Попытка отправить команду 'stop' в процесс
-                success = self.send_stop_command(process)
-                if not success:
-                    # Если не удалось, принудительно закрываем
-                    self.force_stop_process(process)
-            else:
-                # Просто закрываем CMD
-                self.force_stop_process(process)
-
-            # Обновляем статус
-            del self.processes[server_id]
-            server['status'] = 'stopped'
-            self.save_servers()
-
-            return True
-        except Exception as e:
-            print(f"Ошибка остановки: {e}")
-            return False
-
-    def send_stop_command(self, process):
-        """Отправка команды 'stop' в процесс"""
-        try:
-            # Для Minecraft серверов команда 'stop' должна быть отправлена в консоль
-            for child in process.children(recursive=True):
-                try:
-                    # Попытка отправить команду через stdin
-                    if child.is_running():
-                        # Здесь должна быть логика отправки команды в консоль сервера
-                        pass
-                except:
-                    pass
-
-            # Даем время на graceful shutdown
-            import time
-            time.sleep(5)
-
-            # Проверяем, завершился ли процесс
-            if not process.is_running():
-                return True
-
-            # Если процесс еще жив, принудительно завершаем
-            self.force_stop_process(process)
-            return True
-
-        except Exception as e:
-            print(f"Ошибка отправки команды stop: {e}")
-            return False
-
-    def force_stop_process(self, process):
-        """Принудительная остановка процесса"""
-        try:
-            for child in process.children(recursive=True):
-                child.terminate()
-            process.terminate()
-            process.wait(timeout=10)
-        except:
-            try:
-                subprocess.run(['taskkill', '/f', '/pid', str(process.pid)])
-            except:
-                pass
-
-    def get_system_info(self):
-        """Получение информации о системе"""
-        return {
-            'platform': platform.system(),
-            'platform_version': platform.version(),
-            'architecture': platform.architecture()[0],
-            'processor': platform.processor(),
-            'python_version': platform.python_version()
-        }
-
-
-# Создаем экземпляр менеджера
-manager = ServerManager()
-
-
-# Eel функции
-@eel.expose
-def get_servers():
-    return manager.servers
-
-
-@eel.expose
-def add_server(name, bat_path, description, icon_path=None, stop_method='stop_command', display_cmd=False):
-    return manager.add_server(name, bat_path, description, icon_path, stop_method, display_cmd)
-
-
-@eel.expose
-def update_server(server_id, name, bat_path, description, icon_path, stop_method, display_cmd):
-    return manager.update_server(server_id, name, bat_path, description, icon_path, stop_method, display_cmd)
-
-
-@eel.expose
-def remove_server(server_id):
-    return manager.remove_server(server_id)
-
-
-@eel.expose
-def start_server(server_id):
-    return manager.start_server(server_id)
-
-
-@eel.expose
-def stop_server(server_id):
-    return manager.stop_server(server_id)
-
-
-@eel.expose
-def get_server_info(server_id):
-    server = next((s for s in manager.servers if s['id'] == server_id), None)
-    if server:
-        return {
-            'server': server,
-            'system_info': manager.get_system_info()
-        }
-    return None
-
-
-@eel.expose
-def get_app_version():
-    return {
-        'version': '1.0.0',
-        'credits': '0vfx, deepseek'
-    }
-
-
-if __name__ == "__main__":
-    print("Запуск менеджера серверов Minecraft...")
-    print("Версия: 1.0.0")
-    print("Разработчики: 0vfx, deepseek")
-
-    eel.start('index.html', size=(1000, 700), mode='chrome', port=8000)
+import copy
+import bisect
+import errno
+import fnmatch
+import functools
+import gzip
+import hashlib
+import ipaddress
+import heapq
+import importlib
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import select
+import selectors
+import shutil
+import signal
+import socket
+import struct
+import sqlite3
+import subprocess
+import platform
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+from os.path import abspath, exists
+from urllib.parse import parse_qsl
+
+
+class LazyModule:
+    """Модуль, импортируемый при первом обращении к его атрибутам.
+
+    Импорт main.py не загружает eel, psutil и asyncio, поэтому вызовы из
+    командной строки и встраивание менеджера не платят за их инициализацию.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+class StructuredLogger:
+    """Журнал событий: имя события, сообщение и поля (server_id, duration, ...)"""
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def _log(self, level, event, message, fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, extra={'event': event, 'fields': fields})
+
+    def debug(self, event, message, **fields):
+        self._log(logging.DEBUG, event, message, fields)
+
+    def info(self, event, message, **fields):
+        self._log(logging.INFO, event, message, fields)
+
+    def warning(self, event, message, **fields):
+        self._log(logging.WARNING, event, message, fields)
+
+    def error(self, event, message, **fields):
+        self._log(logging.ERROR, event, message, fields)
+
+
+class RateLimitFilter(logging.Filter):
+    """Не более rate записей одного события в секунду (с запасом burst).
+
+    Число пропущенных записей добавляется в поле suppressed следующей записи.
+    """
+
+    def __init__(self, rate=20, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or rate
+        self.lock = threading.Lock()
+        # событие -> [доступные записи, время последнего пополнения, пропущено]
+        self._buckets = {}
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None or not self.rate:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            bucket = self._buckets.get(event)
+            if bucket is None:
+                bucket = self._buckets[event] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Передача записей в фоновый поток без ожидания; при переполнении очереди записи отбрасываются"""
+
+    def __init__(self, queue_):
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Сообщения уже отформатированы, а поля нужны обработчикам как есть
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Запись журнала одной строкой JSON"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'event': getattr(record, 'event', None),
+            'message': record.getMessage()
+        }
+        data.update(getattr(record, 'fields', {}))
+        if getattr(record, 'suppressed', 0):
+            data['suppressed'] = record.suppressed
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def configure_logging(settings):
+    """Журнал в фоновом потоке: сообщения в консоль и JSON строки в файл с ротацией.
+
+    Возвращает QueueListener, который нужно остановить при завершении.
+    """
+    handlers = []
+    if settings['log_console']:
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter('%(message)s'))
+        handlers.append(console)
+    if settings['log_file']:
+        file_handler = logging.handlers.RotatingFileHandler(
+            settings['log_file'], maxBytes=int(settings['log_file_mb'] * 1024 * 1024),
+            backupCount=settings['log_file_backups'], encoding='utf-8')
+        file_handler.setFormatter(JsonLineFormatter())
+        handlers.append(file_handler)
+    records = queue.Queue(maxsize=settings['log_queue_size'])
+    queue_handler = DroppingQueueHandler(records)
+    queue_handler.addFilter(RateLimitFilter(settings['log_rate_limit']))
+    log.logger.setLevel(settings['log_level'])
+    log.logger.handlers = [queue_handler]
+    log.logger.propagate = False
+    listener = logging.handlers.QueueListener(records, *handlers)
+    listener.start()
+    return listener
+
+
+log = StructuredLogger('serwhat')
+
+
+asyncio = LazyModule('asyncio')
+eel = LazyModule('eel')
+futures = LazyModule('concurrent.futures')
+psutil = LazyModule('psutil')
+
+
+class ManagedProcess:
+    """Запущенный процесс сервера"""
+    __slots__ = ('server_id', 'popen', 'pid', 'create_time', 'started_monotonic', 'returncode', 'exited',
+                 'stop_requested', 'stdin_lock', 'stdin_broken')
+
+    def __init__(self, server_id, popen):
+        self.server_id = server_id
+        self.popen = popen
+        self.pid = popen.pid
+        self.started_monotonic = time.monotonic()
+        self.returncode = None
+        self.exited = threading.Event()
+        self.stop_requested = False
+        # Команды из разных потоков не должны перемешиваться в stdin
+        self.stdin_lock = threading.Lock()
+        # После частичной записи по таймауту канал непригоден: следующая команда склеилась бы с обрывком
+        self.stdin_broken = False
+        if popen.stdin is not None and os.name != 'nt':
+            # Зависший сервер не читает stdin: запись не должна блокировать поток навсегда
+            os.set_blocking(popen.stdin.fileno(), False)
+        try:
+            self.create_time = psutil.Process(popen.pid).create_time()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            self.create_time = None
+
+    def send(self, text, timeout=5, before_write=None):
+        """Строка в stdin процесса не дольше timeout секунд.
+
+        False, если канала нет, он закрыт или процесс не принял данные вовремя.
+        before_write вызывается под блокировкой канала непосредственно перед записью.
+        """
+        if self.popen.stdin is None or self.stdin_broken:
+            return False
+        deadline = time.monotonic() + timeout
+        if not self.stdin_lock.acquire(timeout=timeout):
+            return False
+        try:
+            if before_write:
+                before_write()
+            return self._write(text.encode('utf-8') + b'\n', deadline)
+        finally:
+            self.stdin_lock.release()
+
+    def _write(self, data, deadline):
+        if os.name == 'nt':
+            # Каналы Windows не бывают неблокирующими: запись в отдельном потоке с ожиданием
+            done = []
+
+            def writer():
+                try:
+                    self.popen.stdin.write(data)
+                    self.popen.stdin.flush()
+                    done.append(True)
+                except (OSError, ValueError):
+                    done.append(False)
+
+            thread = threading.Thread(target=writer, daemon=True)
+            thread.start()
+            thread.join(max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                self.stdin_broken = True
+                return False
+            return done[0]
+        fd = self.popen.stdin.fileno()
+        view = memoryview(data)
+        try:
+            while view:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([], [fd], [], remaining)[1]:
+                    if len(view) < len(data):
+                        self.stdin_broken = True
+                    return False
+                try:
+                    view = view[os.write(fd, view):]
+                except BlockingIOError:
+                    continue
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def get_ps_process(self):
+        """psutil.Process для этого процесса, если PID не был переиспользован"""
+        if self.exited.is_set():
+            return None
+        try:
+            process = psutil.Process(self.pid)
+            if self.create_time is not None and process.create_time() != self.create_time:
+                return None
+            return process
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+
+    def get_process_tree(self):
+        """Процесс и все его потомки"""
+        process = self.get_ps_process()
+        if process is None:
+            return []
+        try:
+            return [process] + process.children(recursive=True)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return [process]
+
+    def signal_tree(self, force=False):
+        """SIGTERM/SIGKILL всей группе процессов (на Windows - завершение дерева процессов)"""
+        if self.exited.is_set():
+            return
+        tree = self.get_process_tree()
+        if os.name != 'nt':
+            try:
+                # Процесс запущен в отдельной сессии, его PGID совпадает с PID
+                os.killpg(self.pid, signal.SIGKILL if force else signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                pass
+        for process in tree:
+            try:
+                if force:
+                    process.kill()
+                else:
+                    process.terminate()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+
+class ProcessSupervisor:
+    """Получение уведомлений о завершении процессов от ОС без периодического опроса.
+
+    На Linux каждый процесс отслеживается через pidfd в одном потоке с selectors,
+    на остальных платформах - отдельным потоком, блокирующимся в Popen.wait().
+    """
+
+    def __init__(self, on_exit):
+        self.on_exit = on_exit
+        self.running = True
+        self.use_pidfd = hasattr(os, 'pidfd_open')
+        self._thread = None
+        if self.use_pidfd:
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+            self._lock = threading.Lock()
+            self._pending = []
+
+    def start(self):
+        if self.use_pidfd:
+            self._thread = threading.Thread(target=self._pidfd_loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            os.write(self._wake_w, b'x')
+
+    def watch(self, entry):
+        """Начать отслеживание завершения процесса"""
+        if self.use_pidfd:
+            try:
+                fd = os.pidfd_open(entry.pid)
+            except OSError as e:
+                if e.errno == errno.ESRCH:
+                    # Процесс уже завершился до регистрации
+                    self._finish(entry)
+                    return
+                # Ядро старше 5.3 (ENOSYS) или запрет seccomp/контейнера (EPERM): процесс жив,
+                # дальше все процессы ожидаются через Popen.wait()
+                log.warning('pidfd_unavailable', f"pidfd недоступен ({e}), завершение процессов "
+                            f"отслеживается потоками", server_id=entry.server_id)
+                self.use_pidfd = False
+            else:
+                with self._lock:
+                    self._pending.append((fd, entry))
+                os.write(self._wake_w, b'x')
+                return
+        threading.Thread(target=self._wait_loop, args=(entry,), daemon=True).start()
+
+    def _wait_loop(self, entry):
+        try:
+            entry.popen.wait()
+        except Exception:
+            pass
+        self._finish(entry)
+
+    def _pidfd_loop(self):
+        while self.running:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                    with self._lock:
+                        pending, self._pending = self._pending, []
+                    for fd, entry in pending:
+                        self._selector.register(fd, selectors.EVENT_READ, entry)
+                    continue
+                self._selector.unregister(key.fd)
+                os.close(key.fd)
+                self._finish(key.data)
+
+    def _finish(self, entry):
+        try:
+            entry.returncode = entry.popen.wait(timeout=1)
+        except Exception:
+            entry.returncode = entry.popen.returncode
+        entry.exited.set()
+        try:
+            self.on_exit(entry)
+        except Exception as e:
+            log.error('exit_handler_failed', f"Ошибка обработки завершения процесса: {e}", server_id=entry.server_id)
+
+
+class ConsoleBuffer:
+    """Кольцевой буфер последних строк консоли сервера"""
+    __slots__ = ('lines', 'next_seq', 'lock', 'changed')
+
+    def __init__(self, size):
+        self.lines = deque(maxlen=size)
+        self.next_seq = 1
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def append(self, text):
+        with self.lock:
+            line = (self.next_seq, time.time(), text)
+            self.next_seq += 1
+            self.lines.append(line)
+            self.changed.notify_all()
+            return line
+
+    def wait(self, after_seq, timeout):
+        """Ожидание строки с номером больше after_seq (False по истечении timeout)"""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.next_seq - 1 > after_seq, timeout)
+
+    def tail(self, since_seq=0):
+        """Строки с номером больше since_seq и признак потери строк из-за переполнения"""
+        with self.lock:
+            if not self.lines:
+                return [], False
+            first_seq = self.lines[0][0]
+            start = max(since_seq - first_seq + 1, 0)
+            return list(itertools.islice(self.lines, start, None)), since_seq + 1 < first_seq
+
+
+class ConsoleHub:
+    """Чтение вывода серверов без блокировок и пакетная отправка новых строк.
+
+    На POSIX все каналы читаются одним потоком через selectors,
+    на Windows - отдельным потоком на каждый канал.
+    """
+    MAX_LINE = 65536
+
+    def __init__(self, on_batch, push_interval=0.25):
+        self.on_batch = on_batch
+        self.push_interval = push_interval
+        self.running = True
+        self.use_selector = os.name != 'nt'
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        if self.use_selector:
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+            self._attach_lock = threading.Lock()
+            self._attaching = []
+
+    def start(self):
+        if self.use_selector:
+            threading.Thread(target=self._select_loop, daemon=True).start()
+        threading.Thread(target=self._push_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.use_selector:
+            os.write(self._wake_w, b'x')
+
+    def attach(self, server_id, stream, buffer):
+        """Начать чтение вывода процесса в буфер сервера"""
+        if self.use_selector:
+            os.set_blocking(stream.fileno(), False)
+            with self._attach_lock:
+                self._attaching.append((server_id, stream, buffer))
+            os.write(self._wake_w, b'x')
+        else:
+            threading.Thread(target=self._read_loop, args=(server_id, stream, buffer), daemon=True).start()
+
+    def _emit(self, server_id, buffer, raw):
+        line = buffer.append(raw.decode('utf-8', errors='replace').rstrip('\r'))
+        with self._pending_lock:
+            self._pending.setdefault(server_id, []).append(line)
+
+    def _read_loop(self, server_id, stream, buffer):
+        try:
+            for raw in iter(lambda: stream.readline(self.MAX_LINE), b''):
+                self._emit(server_id, buffer, raw.rstrip(b'\n'))
+        except (OSError, ValueError):
+            pass
+        finally:
+            stream.close()
+
+    def _select_loop(self):
+        partial = {}
+        while self.running:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                    with self._attach_lock:
+                        attaching, self._attaching = self._attaching, []
+                    for server_id, stream, buffer in attaching:
+                        self._selector.register(stream, selectors.EVENT_READ, (server_id, buffer))
+                        partial[stream] = b''
+                    continue
+                stream = key.fileobj
+                server_id, buffer = key.data
+                try:
+                    chunk = os.read(stream.fileno(), 65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    chunk = b''
+                data = partial[stream] + chunk
+                *lines, rest = data.split(b'\n')
+                for raw in lines:
+                    self._emit(server_id, buffer, raw)
+                if len(rest) >= self.MAX_LINE or (not chunk and rest):
+                    self._emit(server_id, buffer, rest)
+                    rest = b''
+                partial[stream] = rest
+                if not chunk:
+                    self._selector.unregister(stream)
+                    del partial[stream]
+                    stream.close()
+
+    def _push_loop(self):
+        while self.running:
+            time.sleep(self.push_interval)
+            with self._pending_lock:
+                if not self._pending:
+                    continue
+                pending, self._pending = self._pending, {}
+            try:
+                self.on_batch(pending)
+            except Exception as e:
+                log.error('console_push_failed', f"Ошибка отправки вывода консоли: {e}")
+
+
+class GameStats:
+    """Игровые метрики одного сервера, собранные из его вывода"""
+    __slots__ = ('lines_total', 'startup_seconds', 'started_at', 'lag_events', 'lag_events_total',
+                 'lag_ticks_total', 'players', 'joins_total', 'exceptions', 'exceptions_total', 'exception_types')
+
+    def __init__(self):
+        self.lines_total = 0
+        self.startup_seconds = None
+        self.started_at = None
+        # Время событий за последнее окно для подсчета частоты
+        self.lag_events = deque()
+        self.lag_events_total = 0
+        self.lag_ticks_total = 0
+        self.players = set()
+        self.joins_total = 0
+        self.exceptions = deque()
+        self.exceptions_total = 0
+        self.exception_types = {}
+
+
+class GameLogParser:
+    """Инкрементальный разбор вывода серверов Minecraft в игровые метрики.
+
+    Пакет строк склеивается в одну строку, маркеры ищутся в ней через str.find,
+    и регулярные выражения применяются только к строкам с найденным маркером.
+    Остальные строки на уровне Python не просматриваются.
+    """
+    PATTERNS = {
+        'startup': ('Done (', re.compile(r'Done \((\d+(?:\.\d+)?)s\)!')),
+        'lag': ("Can't keep up", re.compile(r'Running (\d+)ms or (\d+) ticks behind')),
+        # Имя сразу после префикса лога, чтобы не считать строки чата вида "<игрок> X joined the game"
+        'join': (' joined the game', re.compile(r'\]: ([\w.]{1,16}) joined the game')),
+        'leave': (' left the game', re.compile(r'\]: ([\w.]{1,16}) left the game')),
+        'exception': ('Exception', re.compile(r'^(?!\s|Caused by)(?:.*?[\s:])?((?:[\w$]+\.)+[\w$]*Exception)\b')),
+    }
+    WINDOW = 60
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def start_session(self, server_id):
+        """Новый запуск сервера: время старта и список игроков начинаются заново"""
+        with self.lock:
+            stats = self.stats.setdefault(server_id, GameStats())
+            stats.startup_seconds = None
+            stats.started_at = None
+            stats.players.clear()
+
+    def end_session(self, server_id):
+        with self.lock:
+            stats = self.stats.get(server_id)
+            if stats:
+                stats.players.clear()
+
+    def feed(self, server_id, lines):
+        """Разбор пакета строк консоли (seq, время, текст)"""
+        text = '\n'.join(line[2] for line in lines)
+        hits = []
+        for kind, (marker, _) in self.PATTERNS.items():
+            position = text.find(marker)
+            while position >= 0:
+                hits.append((position, kind))
+                position = text.find(marker, position + len(marker))
+        with self.lock:
+            stats = self.stats.setdefault(server_id, GameStats())
+            stats.lines_total += len(lines)
+            if not hits:
+                return
+            # Порядок строк важен: вход и выход одного игрока в одном пакете
+            hits.sort()
+            ends = list(itertools.accumulate(len(line[2]) + 1 for line in lines))
+            seen = set()
+            for position, kind in hits:
+                index = bisect.bisect_right(ends, position)
+                if (index, kind) in seen:
+                    continue
+                seen.add((index, kind))
+                _, timestamp, line = lines[index]
+                match = self.PATTERNS[kind][1].search(line)
+                if match:
+                    self._apply(stats, kind, match, timestamp)
+
+    def _apply(self, stats, kind, match, timestamp):
+        if kind == 'startup':
+            stats.startup_seconds = float(match.group(1))
+            stats.started_at = timestamp
+        elif kind == 'lag':
+            stats.lag_events.append(timestamp)
+            stats.lag_events_total += 1
+            stats.lag_ticks_total += int(match.group(2))
+        elif kind == 'join':
+            stats.players.add(match.group(1))
+            stats.joins_total += 1
+        elif kind == 'leave':
+            stats.players.discard(match.group(1))
+        else:
+            stats.exceptions.append(timestamp)
+            stats.exceptions_total += 1
+            name = match.group(1)
+            stats.exception_types[name] = stats.exception_types.get(name, 0) + 1
+
+    def get(self, server_id):
+        """Счетчики и текущие значения метрик сервера"""
+        with self.lock:
+            stats = self.stats.get(server_id)
+            if stats is None:
+                return None
+            horizon = time.time() - self.WINDOW
+            for events in (stats.lag_events, stats.exceptions):
+                while events and events[0] < horizon:
+                    events.popleft()
+            return {
+                'lines_total': stats.lines_total,
+                'startup_seconds': stats.startup_seconds,
+                'started_at': stats.started_at,
+                'lag_events_total': stats.lag_events_total,
+                'lag_ticks_total': stats.lag_ticks_total,
+                'lag_events_per_minute': len(stats.lag_events),
+                'players_online': len(stats.players),
+                'players': sorted(stats.players),
+                'joins_total': stats.joins_total,
+                'exceptions_total': stats.exceptions_total,
+                'exceptions_per_minute': len(stats.exceptions),
+                'exception_types': dict(sorted(stats.exception_types.items(), key=lambda item: -item[1])[:10])
+            }
+
+
+class LogArchive:
+    """Архив вывода серверов: сегменты с ротацией по размеру и времени.
+
+    Закрытый сегмент сжимается блоками (каждый блок - отдельный gzip member),
+    а индекс хранит время первой строки и смещение каждого блока, поэтому
+    поиск по интервалу времени распаковывает только нужные блоки.
+    """
+    BLOCK_SIZE = 65536
+
+    def __init__(self, root, segment_bytes=16 * 1024 * 1024, segment_seconds=3600):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.lock = threading.Lock()
+        # server_id -> [файл, путь, время начала, размер, разреженный индекс [(время, смещение)]]
+        self._active = {}
+        self._sealer = futures.ThreadPoolExecutor(max_workers=1)
+        self._recovered = set()
+        # Последние сегменты упавших серверов должны быть доступны поиску сразу, а не после их нового вывода
+        if os.path.isdir(root):
+            for name in os.listdir(root):
+                if name.isdigit():
+                    self._recover(int(name))
+
+    def _server_dir(self, server_id):
+        return os.path.join(self.root, str(server_id))
+
+    def _recover(self, server_id):
+        """Сжатие сегментов, оставшихся открытыми после прошлого запуска"""
+        self._recovered.add(server_id)
+        directory = self._server_dir(server_id)
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.endswith('.log'):
+                self._sealer.submit(self._seal, os.path.join(directory, name))
+
+    def append(self, server_id, lines):
+        """Запись пачки строк (seq, время, текст) в активный сегмент"""
+        if not lines:
+            return
+        with self.lock:
+            if server_id not in self._recovered:
+                self._recover(server_id)
+            active = self._active.get(server_id)
+            first_ts = lines[0][1]
+            if active and (active[3] >= self.segment_bytes or first_ts - active[2] >= self.segment_seconds):
+                self._rotate(server_id)
+                active = None
+            if active is None:
+                directory = self._server_dir(server_id)
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, f'{int(first_ts * 1000)}.log')
+                active = self._active[server_id] = [open(path, 'ab'), path, first_ts, 0, []]
+            f, _, _, size, index = active
+            data = bytearray()
+            for _, ts, text in lines:
+                if not index or size + len(data) - index[-1][1] >= self.BLOCK_SIZE:
+                    index.append((ts, size + len(data)))
+                data += f'{ts:.3f}\t{text}\n'.encode('utf-8')
+            f.write(data)
+            active[3] = size + len(data)
+
+    def _rotate(self, server_id):
+        active = self._active.pop(server_id, None)
+        if active:
+            active[0].close()
+            self._sealer.submit(self._seal, active[1])
+
+    def rotate(self, server_id):
+        """Закрыть активный сегмент сервера (например, после остановки)"""
+        with self.lock:
+            self._rotate(server_id)
+
+    def _seal(self, path):
+        """Сжатие закрытого сегмента с построением индекса блоков"""
+        base = path[:-len('.log')]
+        try:
+            blocks = []
+            first_ts = last_ts = None
+            with open(path, 'rb') as src, open(base + '.log.gz.tmp', 'wb') as dst:
+                block = bytearray()
+                block_ts = None
+                for raw in src:
+                    ts = float(raw.split(b'\t', 1)[0])
+                    if block_ts is None:
+                        block_ts = ts
+                    first_ts = ts if first_ts is None else first_ts
+                    last_ts = ts
+                    block += raw
+                    if len(block) >= self.BLOCK_SIZE:
+                        blocks.append((block_ts, dst.tell()))
+                        dst.write(gzip.compress(bytes(block), mtime=0))
+                        block, block_ts = bytearray(), None
+                if block:
+                    blocks.append((block_ts, dst.tell()))
+                    dst.write(gzip.compress(bytes(block), mtime=0))
+            index = {'start': first_ts, 'end': last_ts, 'blocks': blocks}
+            # Индекс публикуется последним: найденный поиском индекс всегда указывает на готовый .log.gz
+            os.replace(base + '.log.gz.tmp', base + '.log.gz')
+            write_file_atomic(base + '.idx', json.dumps(index).encode('utf-8'))
+            os.remove(path)
+        except Exception as e:
+            log.error('log_seal_failed', f"Ошибка сжатия сегмента журнала {path}: {e}", path=path)
+
+    @staticmethod
+    def _sealed_segment(base):
+        """Сжатый сегмент по индексу; None, если индекса еще нет"""
+        try:
+            with open(base + '.idx', 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index['start'] is None:
+            return None
+        return index['start'], index['end'], base + '.log.gz', index['blocks'], True
+
+    def _segments(self, server_id):
+        """Сегменты сервера по возрастанию времени: (начало, конец, путь, блоки, сжат ли).
+
+        Закрытые, но еще не сжатые сегменты (очередь сжатия, остатки после
+        падения) не имеют индекса и просматриваются целиком.
+        """
+        directory = self._server_dir(server_id)
+        segments = []
+        with self.lock:
+            active = self._active.get(server_id)
+            if active:
+                active[0].flush()
+                segments.append((active[2], float('inf'), active[1], list(active[4]), False))
+        if not os.path.isdir(directory):
+            return segments
+        names = set(os.listdir(directory))
+        for name in names:
+            if name.endswith('.idx'):
+                segment = self._sealed_segment(os.path.join(directory, name[:-len('.idx')]))
+                if segment:
+                    segments.append(segment)
+            elif name.endswith('.log') and name[:-len('.log')] + '.idx' not in names:
+                path = os.path.join(directory, name)
+                if active and path == active[1]:
+                    continue
+                try:
+                    seg_start = int(name[:-len('.log')]) / 1000
+                except ValueError:
+                    continue
+                segments.append((seg_start, float('inf'), path, [], False))
+        segments.sort(key=lambda segment: segment[0])
+        return segments
+
+    @staticmethod
+    def _iter_gzip_members(f):
+        """Потоковая распаковка последовательности gzip members начиная с текущей позиции"""
+        decompressor = zlib.decompressobj(wbits=31)
+        while True:
+            chunk = f.read(65536)
+            if not chunk:
+                return
+            while chunk:
+                yield decompressor.decompress(chunk)
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(wbits=31)
+                else:
+                    chunk = b''
+
+    def search(self, server_id, start=None, end=None, pattern=None):
+        """Ленивый поиск строк (время, текст) в интервале [start, end], подходящих под pattern"""
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        regex = re.compile(pattern) if pattern else None
+        for seg_start, seg_end, path, blocks, compressed in self._segments(server_id):
+            if seg_end < start or seg_start > end:
+                continue
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                if compressed:
+                    continue
+                # Сегмент сжали между просмотром каталога и чтением
+                segment = self._sealed_segment(path[:-len('.log')])
+                if segment is None:
+                    continue
+                seg_start, seg_end, path, blocks, compressed = segment
+                if seg_end < start or seg_start > end:
+                    continue
+                f = open(path, 'rb')
+            position = bisect.bisect_right([block[0] for block in blocks], start) - 1
+            offset = blocks[position][1] if position >= 0 else 0
+            with f:
+                f.seek(offset)
+                if compressed:
+                    chunks = self._iter_gzip_members(f)
+                else:
+                    chunks = iter(lambda: f.read(65536), b'')
+                rest = b''
+                for chunk in chunks:
+                    *raw_lines, rest = (rest + chunk).split(b'\n')
+                    for raw in raw_lines:
+                        ts_text, _, text = raw.partition(b'\t')
+                        ts = float(ts_text)
+                        if ts > end:
+                            break
+                        if ts < start:
+                            continue
+                        line = text.decode('utf-8', errors='replace')
+                        if regex is None or regex.search(line):
+                            yield ts, line
+                    else:
+                        continue
+                    break
+
+    def close(self):
+        with self.lock:
+            for server_id in list(self._active):
+                self._rotate(server_id)
+        self._sealer.shutdown(wait=True)
+
+
+class MetricSeries:
+    """Временной ряд ресурсов сервера: последние замеры и агрегаты за минуту и час"""
+    COLUMNS = ('time', 'cpu_percent', 'rss', 'read_bytes', 'write_bytes', 'threads', 'fds')
+    ROLLUPS = {'1m': (60, 1440), '1h': (3600, 168)}
+
+    def __init__(self, raw_size):
+        self.raw = deque(maxlen=raw_size)
+        self.rollups = {name: deque(maxlen=size) for name, (_, size) in self.ROLLUPS.items()}
+        # Незавершенные интервалы: имя -> [начало интервала, количество, суммы, максимумы]
+        self._open = {}
+        # Поток сборщика дописывает ряд, пока интерфейс или API его читают
+        self.lock = threading.Lock()
+
+    def add(self, sample):
+        with self.lock:
+            self.raw.append(sample)
+            for name, (period, _) in self.ROLLUPS.items():
+                bucket = sample[0] - sample[0] % period
+                current = self._open.get(name)
+                if current and current[0] != bucket:
+                    self.rollups[name].append(self._close(current))
+                    current = None
+                if current is None:
+                    current = self._open[name] = [bucket, 0, [0] * (len(sample) - 1), [0] * (len(sample) - 1)]
+                current[1] += 1
+                for i, value in enumerate(sample[1:]):
+                    current[2][i] += value
+                    current[3][i] = max(current[3][i], value)
+
+    @staticmethod
+    def _close(current):
+        bucket, count, sums, maximums = current
+        return (bucket,) + tuple(total / count for total in sums) + (maximums[1],)
+
+    def get(self, resolution='raw'):
+        """Столбцы ряда; у агрегатов - средние значения и максимальный rss"""
+        with self.lock:
+            if resolution == 'raw':
+                points = list(self.raw)
+            else:
+                points = list(self.rollups[resolution])
+                if resolution in self._open:
+                    points.append(self._close(self._open[resolution]))
+        if resolution == 'raw':
+            return {'columns': list(self.COLUMNS), 'points': [list(point) for point in points]}
+        return {'columns': list(self.COLUMNS) + ['rss_max'], 'points': [list(point) for point in points]}
+
+
+class ResourceSampler:
+    """Периодический сбор CPU, памяти, IO, потоков и дескрипторов по дереву процессов каждого сервера"""
+
+    def __init__(self, manager, interval=5.0, tree_refresh_ticks=6, raw_size=720):
+        self.manager = manager
+        self.interval = interval
+        self.tree_refresh_ticks = tree_refresh_ticks
+        self.raw_size = raw_size
+        self.running = False
+        self.series = {}
+        # server_id -> (ManagedProcess, [psutil.Process], номер такта обновления дерева)
+        self._trees = {}
+        self._stop_event = threading.Event()
+        self._tick = 0
+        # Сглаженная загрузка каждого ядра (в процентах) для автоматического размещения серверов
+        self.core_load = {}
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self._stop_event.set()
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            started = time.perf_counter()
+            try:
+                self.sample()
+            except Exception as e:
+                log.error('sampler_failed', f"Ошибка сбора метрик: {e}")
+            if self.manager.metrics is not None:
+                self.manager.metrics.observe('serwhat_sampler_tick_seconds', time.perf_counter() - started)
+
+    def _get_tree(self, entry):
+        cached = self._trees.get(entry.server_id)
+        if cached and cached[0] is entry and self._tick - cached[2] < self.tree_refresh_ticks:
+            return cached[1]
+        # Переиспользуем объекты psutil.Process, иначе cpu_percent() не сможет посчитать разницу
+        known = {process.pid: process for process in cached[1]} if cached and cached[0] is entry else {}
+        tree = [known.get(process.pid, process) for process in entry.get_process_tree()]
+        self._trees[entry.server_id] = (entry, tree, self._tick)
+        # Ограничения применяются и к процессам, появившимся после запуска
+        new_processes = [process for process in tree if process.pid not in known]
+        if new_processes:
+            self.manager.apply_placement(entry.server_id, new_processes)
+        return tree
+
+    def _sample_cores(self):
+        try:
+            loads = psutil.cpu_percent(percpu=True)
+        except (AttributeError, OSError):
+            return
+        for core, load in enumerate(loads):
+            previous = self.core_load.get(core)
+            self.core_load[core] = load if previous is None else previous * 0.7 + load * 0.3
+
+    def sample(self):
+        """Один замер по всем запущенным серверам"""
+        self._tick += 1
+        now = time.time()
+        self._sample_cores()
+        processes = dict(self.manager.processes)
+        for server_id in list(self._trees):
+            if server_id not in processes:
+                del self._trees[server_id]
+        for server_id, entry in processes.items():
+            tree = self._get_tree(entry)
+            cpu = rss = read_bytes = write_bytes = threads = fds = 0
+            lost = False
+            for process in tree:
+                try:
+                    with process.oneshot():
+                        cpu += process.cpu_percent()
+                        rss += process.memory_info().rss
+                        threads += process.num_threads()
+                        fds += process.num_handles() if os.name == 'nt' else process.num_fds()
+                        if hasattr(process, 'io_counters'):
+                            io = process.io_counters()
+                            read_bytes += io.read_bytes
+                            write_bytes += io.write_bytes
+                except psutil.NoSuchProcess:
+                    lost = True
+                except psutil.AccessDenied:
+                    pass
+            if lost:
+                # Дерево процессов изменилось - перечитаем на следующем такте
+                self._trees.pop(server_id, None)
+            series = self.series.get(server_id)
+            if series is None:
+                series = self.series[server_id] = MetricSeries(self.raw_size)
+            series.add((now, cpu, rss, read_bytes, write_bytes, threads, fds))
+
+    def get(self, server_id, resolution='raw'):
+        series = self.series.get(server_id)
+        if series is None:
+            return None
+        return series.get(resolution)
+
+
+def encode_varint(value):
+    """VarInt протокола Minecraft"""
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+async def read_varint(reader):
+    result = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result
+    raise ValueError('Слишком длинный VarInt')
+
+
+def encode_packet(packet_id, payload=b''):
+    data = encode_varint(packet_id) + payload
+    return encode_varint(len(data)) + data
+
+
+def motd_text(description):
+    """Текст MOTD из строки или JSON-компонента чата"""
+    if isinstance(description, str):
+        return description
+    if isinstance(description, dict):
+        return description.get('text', '') + ''.join(motd_text(part) for part in description.get('extra', []))
+    if isinstance(description, list):
+        return ''.join(motd_text(part) for part in description)
+    return ''
+
+
+async def server_list_ping(host, port, timeout=3.0):
+    """TCP подключение и Server List Ping: версия, игроки, MOTD и задержка"""
+    started = time.monotonic()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    result = {'tcp': True, 'connect_ms': (time.monotonic() - started) * 1000, 'slp': False}
+    try:
+        host_bytes = host.encode('utf-8')
+        handshake = (encode_varint(-1) + encode_varint(len(host_bytes)) + host_bytes +
+                     struct.pack('>H', port) + encode_varint(1))
+        writer.write(encode_packet(0x00, handshake) + encode_packet(0x00))
+        await writer.drain()
+
+        async def read_status():
+            await read_varint(reader)
+            if await read_varint(reader) != 0x00:
+                raise ValueError('Неожиданный ответ на запрос статуса')
+            length = await read_varint(reader)
+            return json.loads((await reader.readexactly(length)).decode('utf-8'))
+
+        status = await asyncio.wait_for(read_status(), timeout)
+        ping_started = time.monotonic()
+        writer.write(encode_packet(0x01, struct.pack('>q', int(ping_started * 1000))))
+        await writer.drain()
+
+        async def read_pong():
+            await read_varint(reader)
+            await read_varint(reader)
+            await reader.readexactly(8)
+
+        await asyncio.wait_for(read_pong(), timeout)
+        players = status.get('players') or {}
+        result.update({
+            'slp': True,
+            'latency_ms': (time.monotonic() - ping_started) * 1000,
+            'version': (status.get('version') or {}).get('name'),
+            'protocol': (status.get('version') or {}).get('protocol'),
+            'players_online': players.get('online'),
+            'players_max': players.get('max'),
+            'motd': motd_text(status.get('description'))
+        })
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, OSError):
+        # Порт принимает подключения, но не отвечает по протоколу Minecraft
+        pass
+    finally:
+        writer.close()
+    return result
+
+
+class HealthProber:
+    """Асинхронная проверка доступности запущенных серверов по server_ip/server_port.
+
+    Пока сервер запускается, проверки идут часто, после готовности - редко.
+    """
+
+    def __init__(self, on_result, interval_starting=1.0, interval_ready=15.0, timeout=3.0, max_concurrent=256):
+        self.on_result = on_result
+        self.interval_starting = interval_starting
+        self.interval_ready = interval_ready
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self.loop = None
+        self._tasks = {}
+        self._started = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self._started.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._started.set()
+        self.loop.run_forever()
+
+    def stop(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def watch(self, entry, host, port, require_slp=True):
+        """Начать проверки процесса; прекращаются после его завершения.
+
+        require_slp=False - для серверов не Minecraft достаточно подключения к порту.
+        """
+        self.loop.call_soon_threadsafe(self._watch, entry, host, port, require_slp)
+
+    def _watch(self, entry, host, port, require_slp):
+        task = self._tasks.pop(entry.server_id, None)
+        if task:
+            task.cancel()
+        self._tasks[entry.server_id] = self.loop.create_task(self._probe_loop(entry, host, port, require_slp))
+
+    async def _probe_loop(self, entry, host, port, require_slp):
+        ready = False
+        try:
+            while not entry.exited.is_set() and not entry.stop_requested:
+                async with self._semaphore:
+                    try:
+                        result = await server_list_ping(host, port, self.timeout)
+                    except (asyncio.TimeoutError, OSError) as e:
+                        result = {'tcp': False, 'slp': False, 'error': str(e) or type(e).__name__}
+                if entry.exited.is_set() or entry.stop_requested:
+                    break
+                ready = result['slp'] if require_slp else result['tcp']
+                self.on_result(entry, result)
+                await asyncio.sleep(self.interval_ready if ready else self.interval_starting)
+        finally:
+            if self._tasks.get(entry.server_id) is asyncio.current_task():
+                del self._tasks[entry.server_id]
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы задержек с выгрузкой в текстовом формате Prometheus.
+
+    Метрика идентифицируется именем и кортежем меток ((имя, значение), ...).
+    Гистограммы хранят количество наблюдений по фиксированным границам.
+    """
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    HELP = {
+        'serwhat_calls_total': ('counter', 'Вызовы функций интерфейса и API'),
+        'serwhat_call_errors_total': ('counter', 'Вызовы, завершившиеся исключением или success=false'),
+        'serwhat_call_duration_seconds': ('histogram', 'Длительность вызовов функций интерфейса и API'),
+        'serwhat_check_duration_seconds': ('histogram', 'Длительность сверки процессов с ОС'),
+        'serwhat_sampler_tick_seconds': ('histogram', 'Длительность такта сбора ресурсов'),
+        'serwhat_store_flush_duration_seconds': ('histogram', 'Длительность записи хранилища серверов'),
+        'serwhat_store_flush_written_total': ('counter', 'Записано хранилищем (байты для json, строки для sqlite)'),
+        'serwhat_servers': ('gauge', 'Серверов в каталоге'),
+        'serwhat_processes_running': ('gauge', 'Запущенных процессов серверов')
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        # (имя, метки) -> [количества по границам + переполнение, сумма, максимум]
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        index = bisect.bisect_left(self.BUCKETS, value)
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.BUCKETS) + 1), 0.0, 0.0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] = max(histogram[2], value)
+
+    def set_gauge(self, name, value, labels=()):
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def instrument(self, name, function):
+        """Обертка, считающая вызовы, ошибки и длительность function"""
+        labels = (('function', name),)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = isinstance(result, dict) and result.get('success') is False
+                return result
+            finally:
+                self.observe('serwhat_call_duration_seconds', time.perf_counter() - started, labels)
+                self.inc('serwhat_calls_total', labels)
+                if failed:
+                    self.inc('serwhat_call_errors_total', labels)
+
+        return wrapper
+
+    def _quantile(self, counts, q):
+        """Оценка квантиля по границам гистограммы (верхняя граница интервала)"""
+        target = q * sum(counts)
+        total = 0
+        for bound, count in zip(self.BUCKETS + (float('inf'),), counts):
+            total += count
+            if total >= target:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        """Сводка для окна диагностики: счетчики и квантили задержек в миллисекундах"""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self.histograms.items()}
+            gauges = dict(self.gauges)
+        result = {'counters': [], 'histograms': [], 'gauges': []}
+        for (name, labels), value in sorted(counters.items()):
+            result['counters'].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), value in sorted(gauges.items()):
+            result['gauges'].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), (counts, total, maximum) in sorted(histograms.items()):
+            count = sum(counts)
+            result['histograms'].append({
+                'name': name,
+                'labels': dict(labels),
+                'count': count,
+                'mean_ms': total / count * 1000 if count else 0,
+                'p50_ms': min(self._quantile(counts, 0.5), maximum) * 1000,
+                'p95_ms': min(self._quantile(counts, 0.95), maximum) * 1000,
+                'p99_ms': min(self._quantile(counts, 0.99), maximum) * 1000,
+                'max_ms': maximum * 1000
+            })
+        return result
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in labels)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+    def render_prometheus(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        with self.lock:
+            samples = [(name, labels, 'value', value) for (name, labels), value in self.counters.items()]
+            samples += [(name, labels, 'value', value) for (name, labels), value in self.gauges.items()]
+            samples += [(name, labels, 'histogram', (list(value[0]), value[1]))
+                        for (name, labels), value in self.histograms.items()]
+        lines = []
+        described = set()
+        for name, labels, kind, value in sorted(samples, key=lambda sample: (sample[0], sample[1])):
+            if name not in described:
+                described.add(name)
+                metric_type, help_text = self.HELP.get(name, ('untyped', name))
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+            if kind == 'value':
+                lines.append(f'{name}{self._format_labels(labels)} {value}')
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{self._format_labels(labels, (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{self._format_labels(labels)} {total}')
+            lines.append(f'{name}_count{self._format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+class PortIndex:
+    """Индекс портов серверов: порт -> ID серверов, у которых он настроен"""
+
+    def __init__(self):
+        self.configured = {}
+
+    def add(self, server_id, port):
+        if port is not None:
+            self.configured.setdefault(port, set()).add(server_id)
+
+    def remove(self, server_id, port):
+        owners = self.configured.get(port)
+        if owners:
+            owners.discard(server_id)
+            if not owners:
+                del self.configured[port]
+
+    def conflicts(self, port, server_id=None):
+        """Другие серверы с тем же портом"""
+        return sorted(self.configured.get(port, set()) - {server_id})
+
+    @staticmethod
+    def is_bindable(port):
+        """Можно ли сейчас занять порт на всех интерфейсах"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if os.name != 'nt':
+                # Как и JVM: порт в TIME_WAIT не считается занятым
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', port))
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    @staticmethod
+    def listening():
+        """Слушающие TCP порты системы: порт -> [PID]"""
+        result = {}
+        try:
+            connections = psutil.net_connections(kind='tcp')
+        except (psutil.AccessDenied, OSError):
+            return result
+        for connection in connections:
+            if connection.status == psutil.CONN_LISTEN and connection.laddr:
+                pids = result.setdefault(connection.laddr.port, [])
+                if connection.pid is not None and connection.pid not in pids:
+                    pids.append(connection.pid)
+        return result
+
+
+class TemplateProvisioner:
+    """Создание экземпляров сервера из каталога-шаблона.
+
+    Файлы клонируются через reflink (FICLONE), если файловая система это умеет,
+    иначе неизменяемые файлы (jar, библиотеки) связываются жесткими ссылками,
+    а остальные копируются. Время создания зависит от числа файлов, а не от их размера.
+    """
+    FICLONE = 0x40049409
+    IMMUTABLE_PATTERNS = ('*.jar', 'libraries/*', 'versions/*', 'bundler/*', 'cache/*')
+
+    def __init__(self, immutable_patterns=None):
+        self.immutable_patterns = tuple(immutable_patterns or self.IMMUTABLE_PATTERNS)
+        # Выясняется при первой попытке и больше не повторяется, если не поддерживается
+        self.reflink_supported = platform.system() == 'Linux'
+
+    def scan(self, root):
+        """Каталоги и файлы шаблона: ([каталоги], [(путь, тип)]), тип - symlink, immutable или mutable"""
+        dirs, files = [], []
+        for dirpath, dirnames, filenames in os.walk(root):
+            relative = os.path.relpath(dirpath, root)
+            for name in list(dirnames):
+                path = os.path.normpath(os.path.join(relative, name))
+                if os.path.islink(os.path.join(dirpath, name)):
+                    dirnames.remove(name)
+                    files.append((path, 'symlink'))
+                else:
+                    dirs.append(path)
+            for name in filenames:
+                path = os.path.normpath(os.path.join(relative, name))
+                if os.path.islink(os.path.join(dirpath, name)):
+                    kind = 'symlink'
+                elif any(fnmatch.fnmatch(path.replace(os.sep, '/'), pattern) for pattern in self.immutable_patterns):
+                    kind = 'immutable'
+                else:
+                    kind = 'mutable'
+                files.append((path, kind))
+        return dirs, files
+
+    def _reflink(self, source, target):
+        import fcntl
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), self.FICLONE, src.fileno())
+        shutil.copystat(source, target)
+
+    def clone(self, root, target, dirs, files):
+        """Создание экземпляра в target; возвращает число файлов по способам создания"""
+        stats = {'reflink': 0, 'hardlink': 0, 'copy': 0, 'symlink': 0}
+        os.makedirs(target)
+        for path in dirs:
+            os.makedirs(os.path.join(target, path), exist_ok=True)
+        for path, kind in files:
+            source = os.path.join(root, path)
+            destination = os.path.join(target, path)
+            if kind == 'symlink':
+                os.symlink(os.readlink(source), destination)
+                stats['symlink'] += 1
+                continue
+            if self.reflink_supported:
+                try:
+                    self._reflink(source, destination)
+                    stats['reflink'] += 1
+                    continue
+                except OSError as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS):
+                        raise
+                    self.reflink_supported = False
+                    os.remove(destination)
+            if kind == 'immutable':
+                try:
+                    os.link(source, destination)
+                    stats['hardlink'] += 1
+                    continue
+                except OSError:
+                    # Другая файловая система или ссылки не поддерживаются
+                    pass
+            shutil.copy2(source, destination)
+            stats['copy'] += 1
+        return stats
+
+    @staticmethod
+    def set_property(path, key, value):
+        """Замена значения в server.properties (атомарная запись заодно разрывает жесткую ссылку)"""
+        if not os.path.exists(path):
+            return False
+        with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            lines = f.read().splitlines()
+        for i, line in enumerate(lines):
+            if line.split('=', 1)[0].strip() == key:
+                lines[i] = f'{key}={value}'
+                break
+        else:
+            lines.append(f'{key}={value}')
+        write_file_atomic(path, ('\n'.join(lines) + '\n').encode('utf-8', errors='surrogateescape'))
+        return True
+
+
+class RateLimiter:
+    """Ограничение скорости ввода-вывода в байтах в секунду (None - без ограничения)"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = rate or 0
+        self.last = time.monotonic()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate) - amount
+        self.last = now
+        if self.allowance < 0:
+            time.sleep(-self.allowance / self.rate)
+
+
+class SnapshotStore:
+    """Инкрементальные снимки каталогов серверов с дедупликацией.
+
+    Файлы с неизменными размером и mtime берутся из прошлого снимка без чтения.
+    Измененные файлы режутся на куски по содержимому: граница ставится после
+    маркера MARKER (поиск идет на скорости C), но не раньше MIN_CHUNK и не позже
+    MAX_CHUNK байт. Куски сжимаются по одному и хранятся один раз по SHA-256 в
+    chunks/, снимок - это манифест со списком кусков каждого файла.
+    """
+    MARKER = b'\x9e\x37'
+    MIN_CHUNK = 16 * 1024
+    MAX_CHUNK = 256 * 1024
+    READ_SIZE = 1024 * 1024
+    EXCLUDE = ('session.lock', '*/session.lock')
+
+    def __init__(self, root):
+        self.root = abspath(root)
+        # Снимки, восстановление и сборка мусора не выполняются одновременно
+        self.lock = threading.Lock()
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.root, 'chunks', digest[:2], digest)
+
+    def _manifest_dir(self, server_id):
+        return os.path.join(self.root, 'manifests', str(server_id))
+
+    def list(self, server_id):
+        """ID снимков сервера по возрастанию времени"""
+        directory = self._manifest_dir(server_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted((name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json')), key=int)
+
+    def load(self, server_id, snapshot_id):
+        with open(os.path.join(self._manifest_dir(server_id), f'{snapshot_id}.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _split(self, f, limiter):
+        """Потоковое разбиение файла на куски по содержимому"""
+        rest = b''
+        while True:
+            block = f.read(self.READ_SIZE)
+            limiter.consume(len(block))
+            data = rest + block
+            start = 0
+            while True:
+                position = data.find(self.MARKER, start + self.MIN_CHUNK, start + self.MAX_CHUNK)
+                if position >= 0:
+                    end = position + len(self.MARKER)
+                elif len(data) - start >= self.MAX_CHUNK:
+                    end = start + self.MAX_CHUNK
+                else:
+                    break
+                yield data[start:end]
+                start = end
+            rest = data[start:]
+            if not block:
+                if rest:
+                    yield rest
+                return
+
+    def _store_chunk(self, chunk, limiter, stats):
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._chunk_path(digest)
+        if not os.path.exists(path):
+            data = zlib.compress(chunk, 3)
+            limiter.consume(len(data))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+            stats['new_chunks'] += 1
+            stats['stored_bytes'] += len(data)
+        return digest
+
+    def _excluded(self, relative, patterns):
+        return any(fnmatch.fnmatch(relative, pattern) for pattern in patterns)
+
+    def create(self, server_id, directory, rate=None, exclude=None):
+        """Новый снимок каталога; rate - ограничение чтения и записи в байтах в секунду"""
+        directory = abspath(directory)
+        patterns = tuple(exclude or self.EXCLUDE)
+        limiter = RateLimiter(rate)
+        started = time.monotonic()
+        with self.lock:
+            previous_ids = self.list(server_id)
+            previous = self.load(server_id, previous_ids[-1])['files'] if previous_ids else {}
+            files = {}
+            stats = {'files': 0, 'unchanged': 0, 'read_bytes': 0, 'new_chunks': 0, 'stored_bytes': 0, 'errors': 0}
+            for dirpath, dirnames, filenames in os.walk(directory):
+                # Хранилище снимков может лежать внутри каталога сервера
+                dirnames[:] = [name for name in dirnames if os.path.join(dirpath, name) != self.root]
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    relative = os.path.relpath(path, directory).replace(os.sep, '/')
+                    if self._excluded(relative, patterns):
+                        continue
+                    try:
+                        st = os.lstat(path)
+                        if not os.path.isfile(path) or os.path.islink(path):
+                            continue
+                        stats['files'] += 1
+                        known = previous.get(relative)
+                        if known and known['size'] == st.st_size and known['mtime_ns'] == st.st_mtime_ns:
+                            files[relative] = known
+                            stats['unchanged'] += 1
+                            continue
+                        with open(path, 'rb') as f:
+                            chunks = [self._store_chunk(chunk, limiter, stats) for chunk in self._split(f, limiter)]
+                        stats['read_bytes'] += st.st_size
+                        files[relative] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                                           'mode': st.st_mode & 0o7777, 'chunks': chunks}
+                    except OSError as e:
+                        # Файл удален или заблокирован во время снимка
+                        stats['errors'] += 1
+                        log.warning('snapshot_file_failed', f"Файл {relative} пропущен в снимке: {e}",
+                                    server_id=server_id)
+            snapshot_id = str(int(time.time() * 1000))
+            if previous_ids and int(snapshot_id) <= int(previous_ids[-1]):
+                snapshot_id = str(int(previous_ids[-1]) + 1)
+            stats['elapsed'] = time.monotonic() - started
+            manifest = {'id': snapshot_id, 'server_id': server_id, 'created_at': datetime.now().isoformat(),
+                        'directory': directory, 'stats': stats, 'files': files}
+            os.makedirs(self._manifest_dir(server_id), exist_ok=True)
+            write_file_atomic(os.path.join(self._manifest_dir(server_id), f'{snapshot_id}.json'),
+                              json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+        return manifest
+
+    def restore(self, server_id, snapshot_id, target, rate=None, clean=False):
+        """Восстановление снимка в target; clean - удалить файлы, которых нет в снимке"""
+        target = abspath(target)
+        limiter = RateLimiter(rate)
+        with self.lock:
+            manifest = self.load(server_id, snapshot_id)
+            for relative, info in manifest['files'].items():
+                path = os.path.normpath(os.path.join(target, relative))
+                if os.path.commonpath([path, target]) != target:
+                    raise ValueError(f'Путь вне каталога восстановления: {relative}')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + '.restore', 'wb') as f:
+                    for digest in info['chunks']:
+                        with open(self._chunk_path(digest), 'rb') as chunk_file:
+                            data = chunk_file.read()
+                        limiter.consume(len(data))
+                        chunk = zlib.decompress(data)
+                        limiter.consume(len(chunk))
+                        f.write(chunk)
+                os.chmod(path + '.restore', info['mode'])
+                os.utime(path + '.restore', ns=(info['mtime_ns'], info['mtime_ns']))
+                os.replace(path + '.restore', path)
+            removed = 0
+            if clean:
+                for dirpath, dirnames, filenames in os.walk(target):
+                    dirnames[:] = [name for name in dirnames if os.path.join(dirpath, name) != self.root]
+                    for name in filenames:
+                        relative = os.path.relpath(os.path.join(dirpath, name), target).replace(os.sep, '/')
+                        if relative not in manifest['files'] and not self._excluded(relative, self.EXCLUDE):
+                            os.remove(os.path.join(dirpath, name))
+                            removed += 1
+        return {'files': len(manifest['files']), 'removed': removed}
+
+    def prune(self, server_id, keep_last):
+        """Удаление старых снимков сервера и кусков, на которые больше никто не ссылается"""
+        with self.lock:
+            snapshot_ids = self.list(server_id)
+            doomed = snapshot_ids[:max(0, len(snapshot_ids) - keep_last)]
+            for snapshot_id in doomed:
+                os.remove(os.path.join(self._manifest_dir(server_id), f'{snapshot_id}.json'))
+            referenced = set()
+            manifests_root = os.path.join(self.root, 'manifests')
+            for owner in (os.listdir(manifests_root) if os.path.isdir(manifests_root) else []):
+                for snapshot_id in self.list(owner):
+                    for info in self.load(owner, snapshot_id)['files'].values():
+                        referenced.update(info['chunks'])
+            freed_chunks = freed_bytes = 0
+            chunks_root = os.path.join(self.root, 'chunks')
+            for dirpath, _, filenames in os.walk(chunks_root):
+                for name in filenames:
+                    if name not in referenced:
+                        path = os.path.join(dirpath, name)
+                        freed_bytes += os.path.getsize(path)
+                        os.remove(path)
+                        freed_chunks += 1
+        return {'removed_snapshots': doomed, 'freed_chunks': freed_chunks, 'freed_bytes': freed_bytes}
+
+
+class NodeClient:
+    """Подключение к агенту на другой машине (менеджеру в режиме --headless на TCP порту).
+
+    Вызовы идут через пул постоянных keep-alive соединений, пакет команд - одним
+    запросом /batch. Отдельный поток держит long polling /events и применяет
+    изменения серверов агента к локальной копии каталога. После обрыва связи
+    каталог сохраняется, а поток переподключается с нарастающей паузой и
+    догоняет пропущенное через get_changes. Каталог и поток событий привязаны
+    к сессии агента: после перезапуска агента каталог загружается заново.
+    """
+    POLL_TIMEOUT = 25
+
+    def __init__(self, name, host, port, token=None, pool_size=4, timeout=10, on_event=None):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self.on_event = on_event
+        self.lock = threading.Lock()
+        # Копия каталога агента: server_id -> данные сервера
+        self.servers = {}
+        self.version = 0
+        # Сессия агента, к которой относятся version и last_seq
+        self.session = None
+        self.events_session = None
+        self.last_seq = 0
+        self.status = 'connecting'
+        self.error = None
+        self.connected_at = None
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._follow, name=f'node-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _connect(self, timeout):
+        import http.client
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _exchange(self, connection, method, path, body):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        connection.request(method, path, data, headers)
+        response = connection.getresponse()
+        result = json.loads(response.read().decode('utf-8'))
+        if response.status == 401:
+            raise PermissionError(result.get('error', 'Доступ запрещен'))
+        return result, response.will_close
+
+    def request(self, method, path, body=None):
+        """Запрос к агенту через пул соединений (OSError, если агент недоступен)"""
+        import http.client
+
+        with self._slots:
+            try:
+                connection, reused = self._pool.get_nowait(), True
+            except queue.Empty:
+                connection, reused = self._connect(self.timeout), False
+            try:
+                result, will_close = self._exchange(connection, method, path, body)
+            except PermissionError:
+                connection.close()
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                if not reused:
+                    raise OSError(str(e)) from e
+                # Агент мог закрыть простаивавшее keep-alive соединение - повтор на новом
+                connection = self._connect(self.timeout)
+                try:
+                    result, will_close = self._exchange(connection, method, path, body)
+                except (OSError, http.client.HTTPException) as e:
+                    connection.close()
+                    raise OSError(str(e)) from e
+            if will_close:
+                connection.close()
+            else:
+                self._pool.put(connection)
+            return result
+
+    def call(self, function, *args):
+        """Вызов функции агента: {'result': ...} или {'error': ...}"""
+        try:
+            return self.request('POST', f'/call/{function}', list(args))
+        except OSError as e:
+            return {'error': f'Узел {self.name} недоступен: {e}'}
+
+    def batch(self, calls):
+        """Пакет вызовов {"method", "args", "kwargs"} одним запросом"""
+        try:
+            return self.request('POST', '/batch', calls)
+        except OSError as e:
+            return [{'error': f'Узел {self.name} недоступен: {e}'} for _ in calls]
+
+    def _apply_changes(self, changes):
+        with self.lock:
+            if changes['full']:
+                self.servers = {server['id']: server for server in changes['servers']}
+            else:
+                for server in changes['added'] + changes['modified']:
+                    self.servers[server['id']] = server
+                for server_id in changes['removed']:
+                    self.servers.pop(server_id, None)
+            self.version = changes['version']
+            self.session = changes['session']
+
+    def _resync(self):
+        """Догоняющая синхронизация каталога (после подключения или пропуска событий)"""
+        response = self.call('get_changes', self.version, self.session)
+        if 'error' in response:
+            raise OSError(response['error'])
+        self._apply_changes(response['result'])
+
+    def _set_status(self, status, error=None):
+        changed = status != self.status
+        self.status = status
+        self.error = error
+        if status == 'online' and changed:
+            self.connected_at = datetime.now().isoformat()
+        if changed and self.on_event:
+            self.on_event(self.name, 'node_status', {'status': status, 'error': error})
+
+    def _follow(self):
+        """Поток событий агента с переподключением"""
+        import http.client
+
+        delay = 1
+        connection = None
+        while self._running:
+            try:
+                if self.status != 'online':
+                    self._resync()
+                    self._set_status('online')
+                    delay = 1
+                if connection is None:
+                    connection = self._connect(self.POLL_TIMEOUT + self.timeout)
+                response, will_close = self._exchange(
+                    connection, 'GET', f'/events?since={self.last_seq}&timeout={self.POLL_TIMEOUT}', None)
+                if will_close:
+                    connection.close()
+                    connection = None
+                if response['session'] != self.events_session:
+                    # Первое подключение или агент перезапущен: нумерация событий началась заново.
+                    # События ответа пропускаются, а все, что в них было, догоняется синхронизацией
+                    # (в той же сессии каталога - только разница, после перезапуска - полностью)
+                    self.events_session = response['session']
+                    self.last_seq = response['last_seq']
+                    self._resync()
+                    continue
+                self.last_seq = response['last_seq']
+                if response['truncated']:
+                    self._resync()
+                for _, _, event, payload in response['events']:
+                    if event == 'changes':
+                        if payload.get('session') == self.session and payload.get('since_version') == self.version:
+                            self._apply_changes(payload)
+                        else:
+                            self._resync()
+                    if self.on_event:
+                        self.on_event(self.name, event, payload)
+            except (OSError, ValueError, KeyError, http.client.HTTPException) as e:
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                if not self._running:
+                    break
+                if self.status != 'offline':
+                    log.warning('node_disconnected', f"Связь с узлом {self.name} потеряна: {e}", node=self.name)
+                self._set_status('offline', str(e))
+                time.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, 30)
+        if connection is not None:
+            connection.close()
+
+    def info(self):
+        with self.lock:
+            servers = len(self.servers)
+        return {'name': self.name, 'host': self.host, 'port': self.port, 'status': self.status,
+                'error': self.error, 'connected_at': self.connected_at, 'servers': servers,
+                'version': self.version}
+
+
+class ScheduledCall:
+    """Отложенный вызов TaskScheduler; cancel() отменяет его до срабатывания"""
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TaskScheduler:
+    """Все таймеры менеджера в одном потоке: куча вызовов по времени срабатывания.
+
+    Поток спит на Condition до ближайшего срока и в простое не просыпается.
+    Отмена ленивая: отмененный вызов остается в куче и пропускается.
+    Обратные вызовы выполняются в небольшом пуле, чтобы долгая задача
+    не задерживала остальные таймеры.
+    """
+
+    def __init__(self, max_workers=8):
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scheduler')
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._loop, name='scheduler', daemon=True).start()
+
+    def stop(self):
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+        self._executor.shutdown(wait=False)
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(time.monotonic() + max(0, delay), callback, *args)
+
+    def call_at(self, when, callback, *args):
+        """Вызов callback(*args) в момент when по time.monotonic()"""
+        call = ScheduledCall(when, callback, args)
+        with self._condition:
+            heapq.heappush(self._heap, (when, next(self._counter), call))
+            # Поток будится, только если новый вызов стал ближайшим
+            if self._heap[0][2] is call:
+                self._condition.notify()
+        return call
+
+    def _loop(self):
+        with self._condition:
+            while self.running:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                call = heapq.heappop(self._heap)[2]
+                if not call.cancelled:
+                    self._executor.submit(self._run, call)
+
+    @staticmethod
+    def _run(call):
+        try:
+            call.callback(*call.args)
+        except Exception as e:
+            log.error('scheduled_call_failed', f"Ошибка отложенного вызова {call.callback.__name__}: {e}")
+
+
+class CronSchedule:
+    """Расписание cron: "минута час день месяц день_недели" (*, списки, диапазоны, шаг; 0 и 7 - воскресенье)"""
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'В расписании cron должно быть 5 полей: {expression}')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES))
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(','):
+            body, _, step = part.partition('/')
+            try:
+                step = int(step) if step else 1
+                if body == '*':
+                    start, end = low, high
+                elif '-' in body:
+                    start, end = map(int, body.split('-'))
+                else:
+                    start = int(body)
+                    end = high if step > 1 else start
+            except ValueError:
+                raise ValueError(f'Некорректное поле cron: {field}') from None
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError(f'Некорректное поле cron: {field}')
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        weekday = (moment.weekday() + 1) % 7
+        if self.any_day:
+            return self.any_weekday or weekday in self.weekdays
+        if self.any_weekday:
+            return moment.day in self.days
+        # Как в cron: если заданы оба поля, достаточно совпадения любого
+        return moment.day in self.days or weekday in self.weekdays
+
+    def next_after(self, moment):
+        """Ближайшее время срабатывания строго после moment"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f'Расписание никогда не срабатывает: {self.expression}')
+
+
+class LaunchPreflight:
+    """Проверки перед запуском сервера: скрипт, Java, jar и EULA.
+
+    Результаты запоминаются по отпечатку файла (путь, mtime, размер) и
+    пересчитываются только после его изменения. Одновременные запуски серверов
+    с общей JDK ждут одного вызова java -version, а не запускают каждый свой.
+    """
+    JAVA_RE = re.compile(r'(?i)("[^"\r\n]*?javaw?(?:\.exe)?"|[^\s"]*?\bjavaw?(?:\.exe)?)(?=\s|$)')
+    # Признак того, что после java идут аргументы JVM, а не просто слово в echo
+    JVM_ARGS_RE = re.compile(r'(?:^|\s)(?:-jar|-X|-D|-cp|-classpath|@)')
+    JAR_RE = re.compile(r'-jar\s+(?:"([^"]+)"|(\S+))')
+    XMX_RE = re.compile(r'-Xmx(\d+)([kKmMgG]?)(?=\s|$)')
+    VERSION_RE = re.compile(r'version "([^"]+)"')
+    EULA_RE = re.compile(r'(?im)^\s*eula\s*=\s*true\s*$')
+    # Запуск Forge/NeoForge через файлы аргументов: java @libraries/net/minecraftforge/.../unix_args.txt
+    MODDED_ARGS_RE = re.compile(r'@\S*(?:minecraftforge|neoforged)')
+    # Главные классы серверов Minecraft, которым нужна принятая EULA (у прокси Velocity/BungeeCord ее нет)
+    MINECRAFT_MAIN_CLASSES = ('net.minecraft.', 'net.minecraftforge.', 'net.neoforged.', 'net.fabricmc.',
+                              'org.quiltmc.', 'io.papermc.', 'org.bukkit.', 'org.spigotmc.', 'org.purpurmc.')
+    COMMENT_PREFIXES = ('rem ', '::', '#')
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        # (вид, путь) -> (отпечаток, результат)
+        self.cache = {}
+        self.lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(path):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _cached(self, kind, path, compute):
+        """Результат compute(path) из кэша или вычисленный один раз на версию файла"""
+        key = (kind, path)
+        fingerprint = self.fingerprint(path)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached and cached[0] == fingerprint:
+                self.hits += 1
+                return cached[1]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                cached = self.cache.get(key)
+                if cached and cached[0] == fingerprint:
+                    self.hits += 1
+                    return cached[1]
+                self.misses += 1
+            value = compute(path)
+            with self.lock:
+                self.cache[key] = (fingerprint, value)
+        return value
+
+    def _parse_script(self, path):
+        """Команда java и jar из скрипта запуска"""
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                stripped = line.strip()
+                if not stripped or stripped.lower().startswith(self.COMMENT_PREFIXES):
+                    continue
+                for match in self.JAVA_RE.finditer(stripped):
+                    rest = stripped[match.end():]
+                    if not self.JVM_ARGS_RE.search(rest):
+                        continue
+                    jar = self.JAR_RE.search(rest)
+                    xmx = self.XMX_RE.search(rest)
+                    heap_mb = None
+                    if xmx:
+                        scale = {'': 1 / (1024 * 1024), 'k': 1 / 1024, 'm': 1, 'g': 1024}[xmx.group(2).lower()]
+                        heap_mb = int(int(xmx.group(1)) * scale)
+                    return {'java': match.group(1).strip('"'), 'jar': (jar.group(1) or jar.group(2)) if jar else None,
+                            'heap_mb': heap_mb, 'modded_args': bool(self.MODDED_ARGS_RE.search(rest))}
+        return {'java': None, 'jar': None, 'heap_mb': None, 'modded_args': False}
+
+    def script(self, bat_path):
+        """Разобранный скрипт запуска: java, jar и -Xmx в мегабайтах"""
+        return self._cached('script', abspath(bat_path), self._parse_script)
+
+    def _java_version(self, path):
+        try:
+            result = subprocess.run([path, '-version'], capture_output=True, text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return {'error': f'Не удалось запустить {path}: {e}'}
+        match = self.VERSION_RE.search(result.stderr + result.stdout)
+        if match is None:
+            return {'error': f'Не удалось определить версию Java: {path}'}
+        version = match.group(1)
+        parts = version.split('.')
+        # 1.8.0_392 -> 8, 17.0.2 -> 17, 21-ea -> 21
+        major = int(parts[1]) if parts[0] == '1' and len(parts) > 1 else int(re.match(r'\d+', version).group())
+        return {'version': version, 'major': major}
+
+    def _jar_requirements(self, path):
+        """Главный класс jar и минимальная версия Java по его байткоду"""
+        try:
+            with zipfile.ZipFile(path) as jar:
+                manifest = jar.read('META-INF/MANIFEST.MF').decode('utf-8', errors='replace')
+                match = re.search(r'(?m)^Main-Class:\s*(\S+)', manifest)
+                if match is None:
+                    return {'error': f'В {os.path.basename(path)} не указан Main-Class'}
+                main_class = match.group(1)
+                header = jar.read(main_class.replace('.', '/') + '.class')[:8]
+        except (OSError, KeyError, zipfile.BadZipFile) as e:
+            return {'error': f'Поврежденный jar {os.path.basename(path)}: {e}'}
+        if len(header) < 8 or header[:4] != b'\xca\xfe\xba\xbe':
+            return {'error': f'Некорректный главный класс {main_class}'}
+        return {'main_class': main_class, 'required_java': struct.unpack('>H', header[6:8])[0] - 44}
+
+    def _eula_accepted(self, path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return bool(self.EULA_RE.search(f.read()))
+
+    def _resolve(self, token, directory, search_path=False):
+        """Путь к файлу из скрипта; None, если в нем остались нераскрытые переменные"""
+        expanded = os.path.expanduser(os.path.expandvars(token))
+        if '$' in expanded or '%' in expanded:
+            return None
+        if search_path and os.sep not in expanded and '/' not in expanded:
+            found = shutil.which(expanded, path=os.pathsep.join([directory, os.environ.get('PATH', '')]))
+            return found or expanded
+        return os.path.normpath(os.path.join(directory, expanded))
+
+    def check(self, bat_path, directory):
+        """Отчет о проверках: errors - запуск невозможен, warnings - проверить не удалось"""
+        report = {'errors': [], 'warnings': [], 'java': None, 'java_version': None, 'jar': None,
+                  'required_java': None, 'eula': None, 'eula_required': False}
+        script = self.script(bat_path)
+        if script['java'] is None:
+            return report
+        java = self._resolve(script['java'], directory, search_path=True)
+        if java is None:
+            report['warnings'].append(f"Путь к Java задан через переменную: {script['java']}")
+        elif not os.path.isfile(java):
+            report['errors'].append(f'Java не найдена: {java}')
+        else:
+            report['java'] = java
+            detected = self._cached('java', os.path.realpath(java), self._java_version)
+            if 'error' in detected:
+                report['errors'].append(detected['error'])
+            else:
+                report['java_version'] = detected['version']
+        if script['jar']:
+            jar = self._resolve(script['jar'], directory)
+            if jar is None:
+                report['warnings'].append(f"Путь к jar задан через переменную: {script['jar']}")
+            elif not os.path.isfile(jar):
+                report['errors'].append(f'Jar файл не найден: {jar}')
+            else:
+                report['jar'] = jar
+                requirements = self._cached('jar', jar, self._jar_requirements)
+                if 'error' in requirements:
+                    report['errors'].append(requirements['error'])
+                else:
+                    report['required_java'] = requirements['required_java']
+                    report['eula_required'] = requirements['main_class'].startswith(self.MINECRAFT_MAIN_CLASSES)
+                    major = detected.get('major') if report['java_version'] else None
+                    if major is not None and major < requirements['required_java']:
+                        report['errors'].append(f"Jar требует Java {requirements['required_java']}, "
+                                                f"а найдена Java {major}")
+        # EULA обязательна только серверу Minecraft: его выдает главный класс jar, файлы аргументов
+        # Forge или server.properties рядом со скриптом. Прокси запускаются и без eula.txt
+        report['eula_required'] = (report['eula_required'] or script['modded_args'] or
+                                   os.path.isfile(os.path.join(directory, 'server.properties')))
+        eula_path = os.path.join(directory, 'eula.txt')
+        report['eula'] = os.path.isfile(eula_path) and self._cached('eula', eula_path, self._eula_accepted)
+        if not report['eula']:
+            if report['eula_required']:
+                report['errors'].append('EULA не принята: укажите eula=true в eula.txt')
+            else:
+                report['warnings'].append('EULA не принята (для прокси Velocity/BungeeCord это нормально)')
+        return report
+
+
+class ServerRecord:
+    """Запись о сервере (компактная замена словаря)"""
+    FIELDS = ('id', 'name', 'bat_path', 'description', 'icon_path', 'stop_method', 'stop_timeout', 'display_cmd',
+              'icon_position', 'server_ip', 'server_port', 'launch_mode', 'depends_on', 'restart_policy', 'restart_max',
+              'restart_window', 'cpu_affinity', 'cpu_cores', 'nice', 'io_priority', 'memory_limit_mb',
+              'open_files_limit', 'probe_protocol', 'created_at', 'status', 'started_at', 'health', 'time_to_ready',
+              'probe', 'placement')
+    DEFAULTS = {
+        'description': '',
+        'icon_path': None,
+        'stop_method': 'stop_command',
+        'stop_timeout': 30,
+        'display_cmd': False,
+        'icon_position': 'left',
+        'server_ip': 'localhost',
+        'server_port': '25565',
+        'launch_mode': 'console',
+        'depends_on': [],
+        # never, on-failure (код завершения не 0) или always
+        'restart_policy': 'never',
+        'restart_max': 5,
+        'restart_window': 600,
+        # None - все ядра, список номеров ядер или 'auto' (cpu_cores наименее загруженных ядер)
+        'cpu_affinity': None,
+        'cpu_cores': 1,
+        'nice': None,
+        # Уровень best-effort класса ionice: 0 (высший) - 7
+        'io_priority': None,
+        # Через cgroup v2 (memory.max), если она доступна, иначе это RLIMIT_AS - предел адресного
+        # пространства, который JVM должен превышать -Xmx с большим запасом
+        'memory_limit_mb': None,
+        'open_files_limit': None,
+        # minecraft - сервер готов после ответа на Server List Ping, tcp - после подключения к порту
+        'probe_protocol': 'minecraft',
+        'created_at': None,
+        'status': 'stopped',
+        'started_at': None,
+        'health': None,
+        'time_to_ready': None,
+        'probe': None,
+        'placement': None
+    }
+    # Поля состояния во время работы, в файл конфигурации не записываются
+    VOLATILE_FIELDS = ('status', 'started_at', 'health', 'time_to_ready', 'probe', 'placement')
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, fields.pop(field, copy.copy(self.DEFAULTS.get(field))))
+        # Неизвестные поля сохраняются как есть, чтобы не терять их при записи
+        self.extra = fields
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        if data['started_at'] is None:
+            del data['started_at']
+        data.update(self.extra)
+        return data
+
+    def to_config(self):
+        """Словарь для сохранения без полей состояния"""
+        data = self.to_dict()
+        for field in self.VOLATILE_FIELDS:
+            data.pop(field, None)
+        return data
+
+
+def write_file_atomic(path, data):
+    """Атомарная запись файла: временный файл + fsync + rename"""
+    directory = os.path.dirname(abspath(path))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if os.name != 'nt':
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class JsonServerStore:
+    """Хранение серверов в JSON файле с отложенной пакетной записью.
+
+    Изменения только помечают состояние как грязное, фоновый поток
+    записывает файл не чаще раза в flush_interval секунд.
+    """
+
+    WRITTEN_UNIT = 'bytes'
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.metrics = None
+        self.snapshot = None
+        self.running = False
+        self._dirty = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def load(self):
+        """Чтение файла, возвращает (next_id, список словарей серверов)"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Старый формат файла - просто список серверов
+        if isinstance(data, list):
+            data = {'servers': data}
+        return data.get('next_id', 1), data.get('servers', [])
+
+    def start(self, snapshot):
+        """Запуск фоновой записи; snapshot() возвращает (next_id, список серверов)"""
+        self.snapshot = snapshot
+        self.running = True
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, server=None):
+        self._dirty.set()
+
+    def mark_removed(self, server_id):
+        self._dirty.set()
+
+    def _flush_loop(self):
+        while self.running:
+            self._dirty.wait()
+            if not self.running:
+                break
+            # Собираем все изменения за интервал в одну запись
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Немедленная запись, если есть несохраненные изменения"""
+        if self.metrics is None:
+            return self._write()
+        started = time.perf_counter()
+        written = self._write()
+        if written:
+            self.metrics.observe('serwhat_store_flush_duration_seconds', time.perf_counter() - started)
+            self.metrics.inc('serwhat_store_flush_written_total', (('unit', self.WRITTEN_UNIT),), written)
+        return written
+
+    def _write(self):
+        """Запись всего списка серверов; возвращает число записанных байт"""
+        with self._flush_lock:
+            if not self._dirty.is_set() or self.snapshot is None:
+                return 0
+            self._dirty.clear()
+            next_id, servers = self.snapshot()
+            data = json.dumps({'next_id': next_id, 'servers': [server.to_config() for server in servers]},
+                              ensure_ascii=False, indent=2).encode('utf-8')
+            try:
+                write_file_atomic(self.path, data)
+            except Exception:
+                self._dirty.set()
+                raise
+            return len(data)
+
+    def close(self):
+        """Остановка фонового потока с финальной записью"""
+        self.running = False
+        self._dirty.set()
+        self.flush()
+        self._dirty.clear()
+
+
+class SqliteServerStore(JsonServerStore):
+    """Хранение серверов в SQLite (WAL) с построчными обновлениями.
+
+    При первом открытии переносит серверы из servers.json.
+    """
+    WRITTEN_UNIT = 'rows'
+
+    def __init__(self, path, json_path, flush_interval=1.0):
+        super().__init__(path, flush_interval)
+        self.json_path = json_path
+        self._dirty_servers = {}
+        self._removed = set()
+        self._db_lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS servers '
+                            '(id INTEGER PRIMARY KEY, name TEXT, server_port TEXT, data TEXT NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS idx_servers_name ON servers(name)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS idx_servers_port ON servers(server_port)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._migrate_from_json()
+
+    def _get_meta(self, key, default=None):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def _migrate_from_json(self):
+        """Одноразовый перенос серверов из JSON файла"""
+        with self._db_lock:
+            if self._get_meta('migrated_from_json'):
+                return
+            loaded = JsonServerStore(self.json_path).load()
+            with self.db:
+                if loaded:
+                    next_id, items = loaded
+                    rows = []
+                    for item in items:
+                        config = ServerRecord.from_dict(item).to_config()
+                        rows.append((config['id'], config['name'], str(config['server_port']),
+                                     json.dumps(config, ensure_ascii=False)))
+                    self.db.executemany('INSERT OR REPLACE INTO servers (id, name, server_port, data) '
+                                        'VALUES (?, ?, ?, ?)', rows)
+                    self._set_meta('next_id', next_id)
+                    log.info('store_migrated', f"Перенесено {len(rows)} серверов из {self.json_path} в {self.path}",
+                             count=len(rows))
+                self._set_meta('migrated_from_json', True)
+
+    def load(self):
+        with self._db_lock:
+            rows = self.db.execute('SELECT data FROM servers ORDER BY id').fetchall()
+            return self._get_meta('next_id', 1), [json.loads(row[0]) for row in rows]
+
+    def mark_dirty(self, server=None):
+        with self._db_lock:
+            if server is not None:
+                self._dirty_servers[server.id] = server
+                self._removed.discard(server.id)
+        self._dirty.set()
+
+    def mark_removed(self, server_id):
+        with self._db_lock:
+            self._dirty_servers.pop(server_id, None)
+            self._removed.add(server_id)
+        self._dirty.set()
+
+    def _write(self):
+        """Запись измененных и удаление удаленных строк; возвращает их число"""
+        with self._flush_lock:
+            if not self._dirty.is_set() or self.snapshot is None:
+                return 0
+            self._dirty.clear()
+            next_id, _ = self.snapshot()
+            with self._db_lock:
+                dirty, self._dirty_servers = self._dirty_servers, {}
+                removed, self._removed = self._removed, set()
+                rows = []
+                for server in dirty.values():
+                    config = server.to_config()
+                    rows.append((server.id, server.name, str(server.server_port),
+                                 json.dumps(config, ensure_ascii=False)))
+                with self.db:
+                    self.db.executemany('INSERT OR REPLACE INTO servers (id, name, server_port, data) '
+                                        'VALUES (?, ?, ?, ?)', rows)
+                    self.db.executemany('DELETE FROM servers WHERE id = ?', [(i,) for i in removed])
+                    self._set_meta('next_id', next_id)
+            return len(rows) + len(removed)
+
+    def close(self):
+        super().close()
+        with self._db_lock:
+            self.db.close()
+
+
+def load_app_settings(path='app_settings.json'):
+    """Настройки приложения из файла поверх значений по умолчанию"""
+    default_settings = {
+        'language': 'ru',
+        'theme': 'dark',
+        'save_interval': 1.0,
+        'storage': 'json',
+        'console_buffer_lines': 2000,
+        'kill_timeout': 10,
+        'telemetry_interval': 5.0,
+        'changelog_size': 1000,
+        'health_probe': True,
+        'probe_interval_starting': 1.0,
+        'probe_interval_ready': 15.0,
+        'probe_timeout': 3.0,
+        'log_archive': True,
+        'log_segment_mb': 16,
+        'log_segment_hours': 1,
+        'metrics': True,
+        # Порт /metrics на 127.0.0.1 при работе с интерфейсом (None - не открывать)
+        'metrics_port': 9765,
+        'port_range_start': 25565,
+        'port_range_end': 25665,
+        'instances_dir': 'instances',
+        'scheduler_workers': 8,
+        # Каталог cgroup v2 с делегированным контроллером memory (None - собственная cgroup процесса)
+        'cgroup_root': None,
+        'command_write_timeout': 5,
+        'preflight': True,
+        'snapshots_dir': 'snapshots',
+        'snapshot_io_rate_mb': None,
+        'snapshot_quiesce_seconds': 5,
+        'restart_backoff_base': 2.0,
+        'restart_backoff_max': 300.0,
+        'log_level': 'INFO',
+        'log_console': True,
+        'log_file': 'serwhat.log',
+        'log_file_mb': 10,
+        'log_file_backups': 5,
+        'log_rate_limit': 20,
+        'log_queue_size': 10000,
+        'api_socket': 'serwhat.sock',
+        'api_host': '127.0.0.1',
+        'api_port': 8765,
+        'api_token': None,
+        # Агенты на других машинах: [{"name", "host", "port", "token"}]
+        'nodes': [],
+        'node_pool_size': 4,
+        'node_timeout': 10
+    }
+
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return {**default_settings, **json.load(f)}
+        except:
+            return default_settings
+    return default_settings
+
+
+class ServerManager:
+    def __init__(self):
+        self.servers_file = 'servers.json'
+        self.servers_db_file = 'servers.db'
+        self.settings_file = 'app_settings.json'
+        self.templates_file = 'templates.json'
+        self.schedules_file = 'schedules.json'
+        settings = self.get_app_settings()
+        self.servers = {}
+        self.next_id = 1
+        self.processes = {}
+        # Серверы, запуск которых выполняется прямо сейчас
+        self.starting = set()
+        self.listeners = []
+        self.consoles = {}
+        self.lock = threading.RLock()
+        self.state_changed = threading.Condition(self.lock)
+        self.operation_counter = itertools.count(1)
+        # Отправленные команды консоли: server_id -> deque[(command_id, номер последней строки до команды, команда)]
+        self.command_counter = itertools.count(1)
+        self.command_write_timeout = settings['command_write_timeout']
+        self.commands = {}
+        self.console_buffer_lines = settings['console_buffer_lines']
+        self.kill_timeout = settings['kill_timeout']
+        # Версия состояния и журнал изменений для синхронизации интерфейса
+        self.state_version = 1
+        # Номера версий начинаются заново в каждом процессе, поэтому клиент присылает и сессию
+        self.session_id = uuid.uuid4().hex
+        self.change_log = deque(maxlen=settings['changelog_size'])
+        self.change_log_base = self.state_version
+        self.pushed_version = self.state_version
+        self.changes_pending = threading.Event()
+        self.metrics = MetricsRegistry() if settings['metrics'] else None
+        self.restart_backoff_base = settings['restart_backoff_base']
+        self.restart_backoff_max = settings['restart_backoff_max']
+        # Автоперезапуск: время перезапусков, отложенные перезапуски и незакрытые инциденты падений
+        self.restart_history = {}
+        self.restart_timers = {}
+        self.scheduler = TaskScheduler(settings['scheduler_workers'])
+        # Снимки идут минутами и не должны занимать потоки планировщика
+        self.snapshot_executor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+        # server_id -> [(процесс, вызов)], выполняемые после завершения этого процесса
+        self.exit_callbacks = {}
+        # Расписания задач и их ближайшие запланированные срабатывания
+        self.schedules = self.load_schedules()
+        self.schedule_calls = {}
+        self.open_incidents = {}
+        self.incidents = {}
+        # server_id -> ядра, выделенные запущенному серверу
+        self.placements = {}
+        self.port_index = PortIndex()
+        # Группа cgroup v2 для memory_limit_mb определяется при первом лимите, а не при старте:
+        # без лимитов менеджер не трогает cgroup.subtree_control
+        self.cgroup_root = settings['cgroup_root']
+        self.cgroup_base = None
+        self._cgroup_detected = False
+        self.preflight = LaunchPreflight() if settings['preflight'] else None
+        self.port_range = (settings['port_range_start'], settings['port_range_end'])
+        self.instances_dir = settings['instances_dir']
+        self.templates = self.load_templates()
+        self.snapshots = SnapshotStore(settings['snapshots_dir'])
+        self.snapshot_io_rate_mb = settings['snapshot_io_rate_mb']
+        self.snapshot_quiesce_seconds = settings['snapshot_quiesce_seconds']
+        self.nodes = {node['name']: NodeClient(node['name'], node['host'], node['port'], node.get('token'),
+                                               settings['node_pool_size'], settings['node_timeout'],
+                                               self._on_node_event)
+                      for node in settings['nodes']}
+
+        self.store = self.create_store(settings)
+        self.store.metrics = self.metrics
+        self.load_servers()
+        self.store.start(self._snapshot_servers)
+        self.game_logs = GameLogParser()
+        self.console_hub = ConsoleHub(self._on_console_batch)
+        self.sampler = ResourceSampler(self, settings['telemetry_interval'])
+        self.supervisor = ProcessSupervisor(self.on_process_exit)
+        self.log_archive = None
+        if settings['log_archive']:
+            self.log_archive = LogArchive('logs', int(settings['log_segment_mb'] * 1024 * 1024),
+                                          settings['log_segment_hours'] * 3600)
+        self.prober = None
+        if settings['health_probe']:
+            self.prober = HealthProber(self.on_probe_result, settings['probe_interval_starting'],
+                                       settings['probe_interval_ready'], settings['probe_timeout'])
+
+        self.process_checker_running = True
+        if self.prober:
+            self.prober.start()
+        self.console_hub.start()
+        self.sampler.start()
+        self.scheduler.start()
+        for schedule in list(self.schedules.values()):
+            self._arm_schedule(schedule)
+        threading.Thread(target=self._push_changes_loop, daemon=True).start()
+        self.start_process_checker()
+        for node in self.nodes.values():
+            node.start()
+        log.info('manager_started', "ServerManager инициализирован")
+
+    def start_process_checker(self):
+        """Запуск наблюдения за завершением процессов"""
+        self.supervisor.start()
+        self.check_processes_status()
+
+    def shutdown(self):
+        """Остановка фоновых потоков менеджера"""
+        self.process_checker_running = False
+        with self.lock:
+            for timer in self.restart_timers.values():
+                timer.cancel()
+            self.restart_timers.clear()
+        self.changes_pending.set()
+        self.scheduler.stop()
+        self.snapshot_executor.shutdown(wait=False)
+        for node in self.nodes.values():
+            node.stop()
+        self.supervisor.stop()
+        self.console_hub.stop()
+        if self.log_archive:
+            self.log_archive.close()
+        self.sampler.stop()
+        if self.prober:
+            self.prober.stop()
+        try:
+            self.store.close()
+        except Exception as e:
+            log.error('store_save_failed', f"Ошибка сохранения серверов: {e}")
+
+    def on_process_exit(self, entry):
+        """Обработка завершения процесса сервера (вызывается супервизором)"""
+        with self.lock:
+            if self.processes.get(entry.server_id) is not entry:
+                return
+            del self.processes[entry.server_id]
+            self.placements.pop(entry.server_id, None)
+            self._release_memory_cgroup(entry.server_id)
+            for waiting_entry, callback in self.exit_callbacks.pop(entry.server_id, []):
+                if waiting_entry is entry:
+                    self.scheduler.call_later(0, callback)
+            self.game_logs.end_session(entry.server_id)
+            server = self.servers.get(entry.server_id)
+            if server:
+                server.placement = None
+            if server and server.status in ('running', 'stopping'):
+                server.health = None
+                status = 'stopped'
+                if not entry.stop_requested:
+                    status = self._handle_unexpected_exit(server, entry)
+                self._set_status(server, status)
+        log.info('process_exited', f"Сервер {entry.server_id} завершен (код {entry.returncode})",
+                 server_id=entry.server_id, returncode=entry.returncode,
+                 duration=time.monotonic() - entry.started_monotonic)
+
+    def _handle_unexpected_exit(self, server, entry):
+        """Учет падения и решение о перезапуске по политике сервера; возвращает новое состояние"""
+        crashed = entry.returncode != 0
+        if crashed:
+            incident = self.open_incidents.get(server.id)
+            if incident is None:
+                incident = self.open_incidents[server.id] = {
+                    'crashed_at': time.time(), 'returncode': entry.returncode, 'crashes': 0, 'restarts': 0,
+                    'recovered_at': None, 'time_to_recovery': None
+                }
+                self.incidents.setdefault(server.id, deque(maxlen=50)).append(incident)
+            incident['crashes'] += 1
+            incident['returncode'] = entry.returncode
+            log.warning('server_crashed', f"Сервер {server.id} упал (код {entry.returncode})",
+                        server_id=server.id, returncode=entry.returncode)
+        if server.restart_policy == 'always' or (server.restart_policy == 'on-failure' and crashed):
+            return self._schedule_restart(server)
+        return 'stopped'
+
+    def _schedule_restart(self, server):
+        """Отложенный перезапуск с экспоненциальной задержкой или переход в crash_looping"""
+        now = time.monotonic()
+        history = self.restart_history.setdefault(server.id, deque())
+        while history and now - history[0] > server.restart_window:
+            history.popleft()
+        if len(history) >= server.restart_max:
+            log.error('server_crash_looping',
+                      f"Сервер {server.id} перезапускался {len(history)} раз за {server.restart_window} с, "
+                      f"автоперезапуск остановлен", server_id=server.id)
+            self.emit('server_crash_looping', {'server_id': server.id, 'restarts': len(history)})
+            return 'crash_looping'
+        delay = min(self.restart_backoff_max, self.restart_backoff_base * 2 ** len(history))
+        # Случайная половина задержки, чтобы упавшие вместе серверы не перезапускались одновременно
+        delay = random.uniform(delay / 2, delay)
+        self.restart_timers[server.id] = self.scheduler.call_later(delay, self._restart, server.id)
+        log.info('server_restart_scheduled', f"Перезапуск сервера {server.id} через {delay:.1f} с",
+                 server_id=server.id, duration=delay, attempt=len(history) + 1)
+        return 'restarting'
+
+    def _restart(self, server_id):
+        with self.lock:
+            server = self.servers.get(server_id)
+            if self.restart_timers.pop(server_id, None) is None or server is None or server.status != 'restarting':
+                return
+            self.restart_history.setdefault(server_id, deque()).append(time.monotonic())
+            incident = self.open_incidents.get(server_id)
+            if incident:
+                incident['restarts'] += 1
+        result = self.start_server(server_id, restart=True)
+        if not result['success']:
+            with self.lock:
+                if server.status == 'restarting':
+                    self._set_status(server, self._schedule_restart(server))
+
+    def _cancel_restart(self, server_id):
+        """Отмена отложенного перезапуска; True, если он был запланирован"""
+        with self.lock:
+            timer = self.restart_timers.pop(server_id, None)
+            if timer is None:
+                return False
+            timer.cancel()
+            self.open_incidents.pop(server_id, None)
+            server = self.servers.get(server_id)
+            if server and server.status == 'restarting':
+                self._set_status(server, 'stopped')
+            return True
+
+    def _resolve_incident(self, server_id):
+        """Закрытие инцидента падения, когда сервер снова готов"""
+        with self.lock:
+            incident = self.open_incidents.pop(server_id, None)
+            if incident is None:
+                return
+            incident['recovered_at'] = time.time()
+            incident['time_to_recovery'] = incident['recovered_at'] - incident['crashed_at']
+        log.info('server_recovered', f"Сервер {server_id} восстановлен через {incident['time_to_recovery']:.1f} с",
+                 server_id=server_id, duration=incident['time_to_recovery'], restarts=incident['restarts'])
+        self.emit('server_recovered', {'server_id': server_id, 'incident': incident})
+
+    def _available_cores(self):
+        if hasattr(os, 'sched_getaffinity'):
+            return sorted(os.sched_getaffinity(0))
+        return list(range(os.cpu_count() or 1))
+
+    def _choose_cores(self, server):
+        """Ядра для сервера с cpu_affinity='auto': наименьшая наблюдаемая загрузка и число размещенных серверов"""
+        cores = self._available_cores()
+        assigned = {core: 0 for core in cores}
+        for other_id, other_cores in self.placements.items():
+            if other_id != server.id:
+                for core in other_cores:
+                    if core in assigned:
+                        assigned[core] += 1
+        count = max(1, min(int(server.cpu_cores or 1), len(cores)))
+        # Каждый уже размещенный сервер считается полностью загружающим свое ядро
+        ranked = sorted(cores, key=lambda core: (self.sampler.core_load.get(core, 0) + 100 * assigned[core], core))
+        return sorted(ranked[:count])
+
+    def _plan_placement(self, server):
+        """Выбор ядер для запускаемого сервера (None - без ограничения)"""
+        with self.lock:
+            if server.cpu_affinity == 'auto':
+                cores = self._choose_cores(server)
+            elif server.cpu_affinity:
+                available = set(self._available_cores())
+                cores = sorted(core for core in server.cpu_affinity if core in available) or None
+            else:
+                cores = None
+            if cores:
+                self.placements[server.id] = cores
+            else:
+                self.placements.pop(server.id, None)
+            server.placement = cores
+            return cores
+
+    CGROUP_MOUNT = '/sys/fs/cgroup'
+    # Адресное пространство JVM сверх кучи: сжатое пространство классов, кэш кода, стеки потоков
+    JVM_RESERVE_MB = 1536
+
+    def _memory_cgroup_base(self):
+        """Каталог cgroup v2 для лимитов памяти (определяется один раз); None - ограничение через RLIMIT_AS"""
+        with self.lock:
+            if not self._cgroup_detected:
+                self._cgroup_detected = True
+                self.cgroup_base = self._detect_cgroup_base(self.cgroup_root)
+            return self.cgroup_base
+
+    def _detect_cgroup_base(self, configured):
+        """Каталог cgroup v2, в котором можно создавать группы серверов с контроллером memory"""
+        if os.name == 'nt' or not os.path.exists(os.path.join(self.CGROUP_MOUNT, 'cgroup.controllers')):
+            log.warning('cgroup_unavailable', "cgroup v2 не найдена, memory_limit_mb будет ограничивать "
+                        "адресное пространство (RLIMIT_AS)")
+            return None
+        base = configured
+        if base is None:
+            try:
+                with open('/proc/self/cgroup', 'r', encoding='utf-8') as f:
+                    relative = next(line[3:].strip() for line in f if line.startswith('0::'))
+            except (OSError, StopIteration):
+                log.warning('cgroup_unavailable', "Не удалось определить cgroup менеджера, memory_limit_mb будет "
+                            "ограничивать адресное пространство (RLIMIT_AS)")
+                return None
+            base = os.path.join(self.CGROUP_MOUNT, relative.lstrip('/'))
+        try:
+            control = os.path.join(base, 'cgroup.subtree_control')
+            with open(control, 'r', encoding='utf-8') as f:
+                enabled = f.read().split()
+            if 'memory' not in enabled:
+                # Не получится, если в самой группе есть процессы (правило cgroup v2 "no internal processes")
+                with open(control, 'w', encoding='utf-8') as f:
+                    f.write('+memory')
+        except OSError as e:
+            log.warning('cgroup_unavailable', f"cgroup v2 {base} недоступна ({e}), memory_limit_mb будет "
+                        f"ограничивать адресное пространство (RLIMIT_AS)")
+            return None
+        return base
+
+    def _apply_memory_cgroup(self, server_id, processes, limit):
+        path = os.path.join(self.cgroup_base, f'serwhat-server-{server_id}')
+        try:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, 'memory.max'), 'w', encoding='utf-8') as f:
+                f.write(str(limit))
+            for process in processes:
+                # Процессы, запущенные позже, наследуют группу родителя
+                with open(os.path.join(path, 'cgroup.procs'), 'w', encoding='utf-8') as f:
+                    f.write(str(process.pid))
+        except OSError as e:
+            log.warning('placement_failed', f"Не удалось применить memory.max к серверу {server_id}: {e}",
+                        server_id=server_id)
+
+    def _release_memory_cgroup(self, server_id):
+        if self.cgroup_base:
+            try:
+                os.rmdir(os.path.join(self.cgroup_base, f'serwhat-server-{server_id}'))
+            except OSError:
+                pass
+
+    def _check_address_space_limit(self, server):
+        """Предупреждение, если RLIMIT_AS меньше того, что JVM зарезервирует при -Xmx из скрипта"""
+        if not server.memory_limit_mb or self._memory_cgroup_base():
+            return
+        try:
+            heap_mb = (self.preflight or LaunchPreflight()).script(server.bat_path)['heap_mb']
+        except OSError:
+            return
+        if heap_mb and int(server.memory_limit_mb) < heap_mb + self.JVM_RESERVE_MB:
+            log.warning('memory_limit_too_low', f"memory_limit_mb={server.memory_limit_mb} ограничивает адресное "
+                        f"пространство (cgroup v2 недоступна), а JVM с -Xmx{heap_mb}M нужно не меньше "
+                        f"{heap_mb + self.JVM_RESERVE_MB} МБ: сервер может не запуститься",
+                        server_id=server.id)
+
+    def apply_placement(self, server_id, processes):
+        """Привязка к ядрам, приоритеты и лимиты ресурсов для процессов сервера"""
+        server = self.servers.get(server_id)
+        if server is None:
+            return
+        cores = self.placements.get(server_id)
+        limits = []
+        if server.memory_limit_mb:
+            if self._memory_cgroup_base():
+                self._apply_memory_cgroup(server_id, processes, int(server.memory_limit_mb) * 1024 * 1024)
+            else:
+                limits.append(('RLIMIT_AS', int(server.memory_limit_mb) * 1024 * 1024))
+        if server.open_files_limit:
+            limits.append(('RLIMIT_NOFILE', int(server.open_files_limit)))
+        for process in processes:
+            try:
+                if cores and hasattr(process, 'cpu_affinity'):
+                    process.cpu_affinity(cores)
+                if server.nice is not None:
+                    process.nice(int(server.nice))
+                if server.io_priority is not None and hasattr(psutil, 'IOPRIO_CLASS_BE'):
+                    process.ionice(psutil.IOPRIO_CLASS_BE, int(server.io_priority))
+                if hasattr(process, 'rlimit'):
+                    for name, value in limits:
+                        process.rlimit(getattr(psutil, name), (value, value))
+            except psutil.NoSuchProcess:
+                continue
+            except (psutil.AccessDenied, ValueError, OSError) as e:
+                log.warning('placement_failed', f"Не удалось применить ограничения к процессу {process.pid} "
+                            f"сервера {server_id}: {e}", server_id=server_id, pid=process.pid)
+
+    def get_incidents(self, server_id):
+        """Падения сервера: время, код завершения, число перезапусков и время восстановления"""
+        with self.lock:
+            return [dict(incident) for incident in self.incidents.get(server_id, ())]
+
+    def _set_status(self, server, status):
+        """Смена состояния сервера с уведомлением интерфейса"""
+        with self.lock:
+            server.status = status
+            self.state_changed.notify_all()
+            self._record_change(server.id, 'modified')
+        self.emit('server_status', {'server_id': server.id, 'status': status})
+
+    def _record_change(self, server_id, kind):
+        """Запись изменения сервера в журнал (kind: added, modified, removed)"""
+        with self.lock:
+            if len(self.change_log) == self.change_log.maxlen:
+                self.change_log_base = self.change_log[0][0]
+            self.state_version += 1
+            self.change_log.append((self.state_version, server_id, kind))
+        self.changes_pending.set()
+
+    def get_changes(self, since_version, session=None):
+        """Изменения серверов после since_version или полный список, если клиент слишком отстал.
+
+        session - сессия из прошлого ответа; версия из другой сессии (другого
+        процесса менеджера) ничего не говорит о состоянии, поэтому в этом
+        случае тоже отдается полный список.
+        """
+        with self.lock:
+            version = self.state_version
+            if session != self.session_id or since_version < self.change_log_base or since_version > version:
+                return {'session': self.session_id, 'version': version, 'full': True, 'servers': self.get_servers()}
+            touched = {}
+            for entry_version, server_id, kind in reversed(self.change_log):
+                if entry_version <= since_version:
+                    break
+                # Идем от новых к старым, поэтому в конце остается самое раннее изменение
+                touched[server_id] = kind
+            added, modified, removed = [], [], []
+            for server_id, first_kind in touched.items():
+                server = self.servers.get(server_id)
+                if server is not None:
+                    (added if first_kind == 'added' else modified).append(server.to_dict())
+                elif first_kind != 'added':
+                    removed.append(server_id)
+            return {'session': self.session_id, 'version': version, 'full': False, 'added': added,
+                    'modified': modified, 'removed': removed}
+
+    def _push_changes_loop(self):
+        """Отправка изменений в интерфейс без опроса с его стороны"""
+        while self.process_checker_running:
+            self.changes_pending.wait()
+            if not self.process_checker_running:
+                break
+            # Небольшая пауза, чтобы собрать изменения в один пакет
+            time.sleep(0.1)
+            self.changes_pending.clear()
+            since_version = self.pushed_version
+            changes = self.get_changes(since_version, self.session_id)
+            if changes['version'] == since_version:
+                continue
+            changes['since_version'] = since_version
+            self.pushed_version = changes['version']
+            self.emit('changes', changes)
+
+    def _is_ready(self, server):
+        """Готов ли сервер принимать зависимые от него серверы"""
+        if server.status != 'running':
+            return False
+        return server.health in (None, 'ready')
+
+    def on_probe_result(self, entry, result):
+        """Результат проверки доступности (вызывается из потока HealthProber)"""
+        with self.lock:
+            server = self.servers.get(entry.server_id)
+            if server is None or self.processes.get(entry.server_id) is not entry:
+                return
+            # Vanilla и Paper открывают порт до загрузки мира: готов только ответивший на Server List Ping
+            if result['slp'] if server.probe_protocol == 'minecraft' else result['tcp']:
+                health = 'ready'
+                if server.time_to_ready is None:
+                    server.time_to_ready = time.monotonic() - entry.started_monotonic
+                    log.info('server_ready', f"Сервер {server.id} готов через {server.time_to_ready:.1f} с",
+                             server_id=server.id, duration=server.time_to_ready)
+                    self._resolve_incident(server.id)
+            else:
+                health = 'starting' if server.time_to_ready is None else 'unreachable'
+            previous = server.probe
+            server.probe = result
+            changed = health != server.health
+            server.health = health
+            if changed or (previous or {}).get('players_online') != result.get('players_online'):
+                self.state_changed.notify_all()
+                self._record_change(server.id, 'modified')
+        if changed:
+            self.emit('server_health', {'server_id': server.id, 'health': health, 'probe': result})
+
+    def wait_ready(self, server_id, timeout):
+        """Ожидание готовности сервера (False, если он остановился или истекло время)"""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while True:
+                server = self.servers.get(server_id)
+                if server is None or server.status in ('stopped', 'stopping', 'crash_looping'):
+                    return False
+                if self._is_ready(server):
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.state_changed.wait(remaining)
+
+    def add_listener(self, callback):
+        """Подписка на события менеджера: callback(event, payload)"""
+        self.listeners.append(callback)
+
+    def emit(self, event, payload):
+        """Рассылка события подписчикам (интерфейсу и т.п.)"""
+        for callback in list(self.listeners):
+            try:
+                callback(event, payload)
+            except Exception as e:
+                log.error('listener_failed', f"Ошибка обработки события {event}: {e}", listener_event=event)
+
+    def _on_console_batch(self, pending):
+        for server_id, lines in pending.items():
+            self.game_logs.feed(server_id, lines)
+        if self.log_archive:
+            for server_id, lines in pending.items():
+                try:
+                    self.log_archive.append(server_id, lines)
+                except Exception as e:
+                    log.error('log_archive_failed', f"Ошибка записи архива журнала: {e}", server_id=server_id)
+        self.emit('console_lines', [
+            {'server_id': server_id, 'lines': [list(line) for line in lines]}
+            for server_id, lines in pending.items()
+        ])
+
+    def get_console_tail(self, server_id, since_seq=0):
+        """Новые строки консоли сервера после since_seq"""
+        buffer = self.consoles.get(server_id)
+        if buffer is None:
+            return {'lines': [], 'last_seq': 0, 'truncated': False}
+        lines, truncated = buffer.tail(since_seq)
+        return {
+            'lines': [list(line) for line in lines],
+            'last_seq': lines[-1][0] if lines else since_seq,
+            'truncated': truncated
+        }
+
+    def get_game_metrics(self, server_id):
+        """Метрики из вывода сервера: время запуска, лаги, игроки, исключения"""
+        return self.game_logs.get(server_id)
+
+    def get_server_metrics(self, server_id, resolution='raw'):
+        """Временной ряд ресурсов сервера (resolution: raw, 1m или 1h)"""
+        if resolution not in ('raw',) + tuple(MetricSeries.ROLLUPS):
+            return None
+        return self.sampler.get(server_id, resolution)
+
+    def search_logs(self, server_id, start=None, end=None, pattern=None):
+        """Ленивый поиск по архиву вывода сервера; start/end - unix-время или ISO строка"""
+        if self.log_archive is None:
+            return iter(())
+
+        def to_timestamp(value):
+            if isinstance(value, str):
+                return datetime.fromisoformat(value).timestamp()
+            return value
+
+        return self.log_archive.search(server_id, to_timestamp(start), to_timestamp(end), pattern)
+
+    def check_processes_status(self):
+        """Сверка отслеживаемых процессов с ОС (PID проверяется вместе с create_time)"""
+        started = time.perf_counter()
+        for server_id, entry in list(self.processes.items()):
+            if entry.popen.poll() is None and entry.get_ps_process() is not None:
+                continue
+            entry.returncode = entry.popen.returncode
+            entry.exited.set()
+            self.on_process_exit(entry)
+        with self.lock:
+            for server in self.servers.values():
+                if server.status == 'running' and server.id not in self.processes:
+                    server.status = 'stopped'
+        if self.metrics is not None:
+            self.metrics.observe('serwhat_check_duration_seconds', time.perf_counter() - started)
+
+    def instrument_functions(self, functions):
+        """Функции интерфейса с замером вызовов; без метрик возвращаются как есть"""
+        if self.metrics is None:
+            return dict(functions)
+        return {name: self.metrics.instrument(name, function) for name, function in functions.items()}
+
+    def _update_gauges(self):
+        self.metrics.set_gauge('serwhat_servers', len(self.servers))
+        self.metrics.set_gauge('serwhat_processes_running', len(self.processes))
+
+    def get_diagnostics(self):
+        """Сводка метрик для окна диагностики"""
+        if self.metrics is None:
+            return {'enabled': False}
+        self._update_gauges()
+        return {'enabled': True, **self.metrics.snapshot()}
+
+    def render_metrics(self):
+        """Метрики в текстовом формате Prometheus (пустая строка, если они выключены)"""
+        if self.metrics is None:
+            return ''
+        self._update_gauges()
+        return self.metrics.render_prometheus()
+
+    @staticmethod
+    def _parse_port(value):
+        try:
+            port = int(value)
+        except (TypeError, ValueError):
+            return None
+        return port if 0 < port < 65536 else None
+
+    def get_server(self, server_id):
+        """Поиск сервера по ID за O(1)"""
+        return self.servers.get(server_id)
+
+    def get_servers(self):
+        """Список серверов в формате для интерфейса"""
+        return [server.to_dict() for server in self.servers.values()]
+
+    def allocate_port(self, start=None, end=None):
+        """Первый порт диапазона, не настроенный ни у одного сервера и свободный в системе"""
+        start = start or self.port_range[0]
+        end = end or self.port_range[1]
+        with self.lock:
+            for port in range(start, end + 1):
+                if port not in self.port_index.configured and PortIndex.is_bindable(port):
+                    return port
+        return None
+
+    def get_port_map(self):
+        """Настроенные порты и слушающие порты наших процессов и чужих процессов в диапазоне"""
+        listening = PortIndex.listening()
+        with self.lock:
+            owners = {}
+            for server_id, entry in self.processes.items():
+                for process in entry.get_process_tree():
+                    owners[process.pid] = server_id
+            ports = set(self.port_index.configured)
+            ports.update(port for port, pids in listening.items()
+                         if self.port_range[0] <= port <= self.port_range[1] or any(pid in owners for pid in pids))
+            return {
+                port: {
+                    'configured': sorted(self.port_index.configured.get(port, ())),
+                    'listening': [{'pid': pid, 'server_id': owners.get(pid)} for pid in listening.get(port, [])]
+                }
+                for port in sorted(ports)
+            }
+
+    def check_port(self, server):
+        """Проверка перед запуском: порт не занят запущенным сервером или другим процессом"""
+        port = self._parse_port(server.server_port)
+        if port is None:
+            return None
+        for other_id in self.port_index.conflicts(port, server.id):
+            if other_id in self.processes:
+                return f'Порт {port} уже использует запущенный сервер {other_id}'
+        if not PortIndex.is_bindable(port):
+            pids = PortIndex.listening().get(port)
+            holder = f' (PID {", ".join(map(str, pids))})' if pids else ''
+            return f'Порт {port} занят другим процессом{holder}'
+        return None
+
+    def preflight_server(self, server_id):
+        """Проверки перед запуском без запуска: скрипт, Java, jar, EULA и порт"""
+        server = self.servers.get(server_id)
+        if server is None:
+            return {'success': False, 'error': 'Сервер не найден'}
+        if not exists(server.bat_path):
+            return {'success': False, 'error': f'BAT файл не найден: {server.bat_path}'}
+        report = (self.preflight or LaunchPreflight()).check(server.bat_path,
+                                                             os.path.dirname(server.bat_path) or os.getcwd())
+        port_error = self.check_port(server)
+        if port_error:
+            report['errors'].append(port_error)
+        return {'success': not report['errors'], **report}
+
+    def _select_servers(self, selector, running=False):
+        """ID серверов по селектору: None - все, список ID или шаблон имени (fnmatch)"""
+        with self.lock:
+            pool = self.processes if running else self.servers
+            if selector is None:
+                return list(pool)
+            if isinstance(selector, str):
+                return [server_id for server_id in pool if fnmatch.fnmatch(self.servers[server_id].name, selector)]
+            return [server_id for server_id in selector if server_id in pool]
+
+    def load_schedules(self):
+        """Расписания задач: ID -> описание"""
+        if not os.path.exists(self.schedules_file):
+            return {}
+        try:
+            with open(self.schedules_file, 'r', encoding='utf-8') as f:
+                return {schedule['id']: schedule for schedule in json.load(f)}
+        except Exception as e:
+            log.error('schedules_load_failed', f"Ошибка загрузки расписаний: {e}")
+            return {}
+
+    def _save_schedules(self):
+        write_file_atomic(self.schedules_file,
+                          json.dumps(list(self.schedules.values()), ensure_ascii=False, indent=2).encode('utf-8'))
+
+    SCHEDULE_ACTIONS = ('restart', 'start', 'stop', 'command', 'snapshot')
+
+    def add_schedule(self, name, action, target=None, cron=None, interval=None, jitter=0, command=None):
+        """Новое расписание задачи.
+
+        target - селектор серверов (None - все, список ID или шаблон имени),
+        cron - выражение cron или interval - период в секундах. Каждый сервер
+        получает свою случайную задержку до jitter секунд, чтобы сотни серверов
+        не выполняли задачу в одну секунду.
+        """
+        if action not in self.SCHEDULE_ACTIONS:
+            return {'success': False, 'error': f'Неизвестное действие: {action}'}
+        if (cron is None) == (interval is None):
+            return {'success': False, 'error': 'Укажите cron или interval'}
+        if action == 'command' and not command:
+            return {'success': False, 'error': 'Не указана команда'}
+        try:
+            if cron is not None:
+                CronSchedule(cron)
+            elif interval <= 0:
+                raise ValueError('Период должен быть положительным')
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}
+        with self.lock:
+            schedule_id = max(self.schedules, default=0) + 1
+            schedule = {'id': schedule_id, 'name': name, 'action': action, 'target': target, 'cron': cron,
+                        'interval': interval, 'jitter': jitter, 'command': command, 'enabled': True,
+                        'last_run': None, 'next_run': None}
+            self.schedules[schedule_id] = schedule
+            self._arm_schedule(schedule)
+            self._save_schedules()
+        log.info('schedule_added', f"Расписание {schedule_id} ({name}): {action}, {cron or f'каждые {interval} с'}",
+                 schedule_id=schedule_id)
+        return {'success': True, 'schedule': schedule}
+
+    def remove_schedule(self, schedule_id):
+        with self.lock:
+            if self.schedules.pop(schedule_id, None) is None:
+                return False
+            call = self.schedule_calls.pop(schedule_id, None)
+            if call:
+                call.cancel()
+            self._save_schedules()
+        return True
+
+    def set_schedule_enabled(self, schedule_id, enabled):
+        with self.lock:
+            schedule = self.schedules.get(schedule_id)
+            if schedule is None:
+                return {'success': False, 'error': 'Расписание не найдено'}
+            schedule['enabled'] = bool(enabled)
+            self._arm_schedule(schedule)
+            self._save_schedules()
+            return {'success': True, 'schedule': schedule}
+
+    def get_schedules(self):
+        with self.lock:
+            return [dict(schedule) for schedule in self.schedules.values()]
+
+    def _arm_schedule(self, schedule, fired_at=None):
+        """Планирование следующего срабатывания расписания; fired_at - срок только что сработавшего"""
+        with self.lock:
+            call = self.schedule_calls.pop(schedule['id'], None)
+            if call:
+                call.cancel()
+            if not schedule['enabled']:
+                schedule['next_run'] = None
+                return
+            now = time.time()
+            if schedule['cron']:
+                # Таймер идет по monotonic и может сработать чуть раньше срока по часам:
+                # следующий запуск считается не раньше сработавшего, иначе он повторился бы
+                moment = datetime.fromtimestamp(max(now, fired_at or now))
+                when = CronSchedule(schedule['cron']).next_after(moment).timestamp()
+            else:
+                # Пропущенное за время простоя срабатывание выполняется сразу
+                when = max(now, (schedule['last_run'] or now) + schedule['interval'])
+            schedule['next_run'] = when
+            self.schedule_calls[schedule['id']] = self.scheduler.call_later(when - now, self._fire_schedule,
+                                                                             schedule['id'])
+
+    def _fire_schedule(self, schedule_id):
+        with self.lock:
+            schedule = self.schedules.get(schedule_id)
+            if schedule is None or not schedule['enabled']:
+                return
+            early = schedule['next_run'] - time.time()
+            if early > 1:
+                # За долгое ожидание monotonic и настенные часы разошлись - досыпаем до срока
+                self.schedule_calls[schedule_id] = self.scheduler.call_later(early, self._fire_schedule, schedule_id)
+                return
+            schedule['last_run'] = time.time()
+            self._arm_schedule(schedule, fired_at=schedule['next_run'])
+            self._save_schedules()
+            targets = self._select_servers(schedule['target'])
+        log.info('schedule_fired', f"Расписание {schedule_id} ({schedule['name']}): {len(targets)} серверов",
+                 schedule_id=schedule_id, targets=len(targets))
+        for server_id in targets:
+            self.scheduler.call_later(random.uniform(0, schedule['jitter'] or 0), self._run_scheduled_action,
+                                      schedule, server_id)
+
+    def _run_scheduled_action(self, schedule, server_id):
+        action = schedule['action']
+        running = server_id in self.processes
+        if action == 'start':
+            result = self.start_server(server_id) if not running else {'success': True}
+        elif action == 'snapshot':
+            done = self.snapshot_executor.submit(self.create_snapshot, server_id)
+            done.add_done_callback(lambda done: self._report_scheduled_action(schedule, server_id, done.result()))
+            return
+        elif not running:
+            # Остальные действия имеют смысл только для запущенного сервера
+            result = {'success': True}
+        elif action == 'stop':
+            result = self.stop_server(server_id)
+        elif action == 'command':
+            result = self.send_command(server_id, schedule['command'])
+        else:
+            # Запуск продолжится из обработки завершения процесса, поток планировщика не ждет остановки
+            with self.lock:
+                entry = self.processes.get(server_id)
+                callback = functools.partial(self._finish_scheduled_restart, schedule, server_id)
+                if entry is not None:
+                    self.exit_callbacks.setdefault(server_id, []).append((entry, callback))
+            result = self.stop_server(server_id)
+            if not result['success']:
+                with self.lock:
+                    waiting = self.exit_callbacks.get(server_id, [])
+                    if (entry, callback) in waiting:
+                        waiting.remove((entry, callback))
+        self._report_scheduled_action(schedule, server_id, result)
+
+    def _finish_scheduled_restart(self, schedule, server_id):
+        self._report_scheduled_action(schedule, server_id, self.start_server(server_id))
+
+    def _report_scheduled_action(self, schedule, server_id, result):
+        if not result.get('success'):
+            log.warning('scheduled_action_failed', f"Задача {schedule['action']} расписания {schedule['id']} "
+                        f"для сервера {server_id} не выполнена: {result.get('error')}", server_id=server_id,
+                        schedule_id=schedule['id'])
+
+    def load_templates(self):
+        """Зарегистрированные шаблоны серверов"""
+        if not os.path.exists(self.templates_file):
+            return {}
+        try:
+            with open(self.templates_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            log.error('templates_load_failed', f"Ошибка загрузки шаблонов: {e}")
+            return {}
+
+    def _save_templates(self):
+        write_file_atomic(self.templates_file,
+                          json.dumps(self.templates, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    def register_template(self, name, path, bat_name, immutable_patterns=None):
+        """Регистрация каталога сервера как шаблона; bat_name - скрипт запуска относительно каталога"""
+        path = abspath(path)
+        if not name or not os.path.isdir(path):
+            return {'success': False, 'error': f'Каталог шаблона не найден: {path}'}
+        if not exists(os.path.join(path, bat_name)):
+            return {'success': False, 'error': f'BAT файл не найден в шаблоне: {bat_name}'}
+        template = {
+            'name': name,
+            'path': path,
+            'bat_name': bat_name,
+            'immutable_patterns': list(immutable_patterns or TemplateProvisioner.IMMUTABLE_PATTERNS)
+        }
+        with self.lock:
+            self.templates[name] = template
+            self._save_templates()
+        log.info('template_registered', f"Шаблон {name} зарегистрирован: {path}", template=name)
+        return {'success': True, 'template': template}
+
+    def remove_template(self, name):
+        """Удаление шаблона из списка (файлы и созданные экземпляры не затрагиваются)"""
+        with self.lock:
+            if self.templates.pop(name, None) is None:
+                return False
+            self._save_templates()
+        return True
+
+    def get_templates(self):
+        with self.lock:
+            return list(self.templates.values())
+
+    def provision_from_template(self, template_name, count=1, max_parallel=4):
+        """Создание count экземпляров шаблона, каждый со своим портом и записью в менеджере"""
+        template = self.templates.get(template_name)
+        if template is None:
+            return {'success': False, 'error': 'Шаблон не найден'}
+        started = time.monotonic()
+        provisioner = TemplateProvisioner(template['immutable_patterns'])
+        dirs, files = provisioner.scan(template['path'])
+        # Записи создаются заранее, чтобы порты выделялись атомарно
+        instances = []
+        for _ in range(count):
+            with self.lock:
+                # Под блокировкой следующий ID достанется именно этому экземпляру
+                target = abspath(os.path.join(self.instances_dir, f'{template_name}-{self.next_id}'))
+                result = self.add_server(os.path.basename(target), os.path.join(target, template['bat_name']),
+                                         f"Экземпляр шаблона {template_name}")
+            if not result['success']:
+                break
+            instances.append((result['server']['id'], target, result['server']['server_port']))
+
+        def clone(instance):
+            server_id, target, port = instance
+            try:
+                stats = provisioner.clone(template['path'], target, dirs, files)
+                TemplateProvisioner.set_property(os.path.join(target, 'server.properties'), 'server-port', port)
+                return {'success': True, 'server_id': server_id, 'path': target, 'port': port, 'files': stats}
+            except Exception as e:
+                shutil.rmtree(target, ignore_errors=True)
+                self.remove_server(server_id)
+                return {'success': False, 'server_id': server_id, 'error': str(e)}
+
+        with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+            results = list(executor.map(clone, instances))
+        elapsed = time.monotonic() - started
+        log.info('template_provisioned', f"Создано {sum(r['success'] for r in results)} экземпляров "
+                 f"шаблона {template_name} за {elapsed:.2f} с", template=template_name, duration=elapsed)
+        return {
+            'success': len(results) == count and all(result['success'] for result in results),
+            'elapsed': elapsed,
+            'instances': results
+        }
+
+    def destroy_instance(self, server_id):
+        """Удаление экземпляра: записи сервера и его каталога внутри instances_dir"""
+        server = self.servers.get(server_id)
+        if server is None:
+            return False
+        directory = os.path.dirname(abspath(server.bat_path))
+        root = abspath(self.instances_dir)
+        if os.path.commonpath([directory, root]) != root or directory == root:
+            return False
+        if not self.remove_server(server_id):
+            return False
+        entry = self.processes.get(server_id)
+        if entry:
+            entry.exited.wait(server.stop_timeout + 2 * self.kill_timeout + 1)
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+
+    def send_command(self, server_id, command, timeout=0, until=None, quiet=0.3):
+        """Команда в консоль сервера; при timeout > 0 - ожидание ответа.
+
+        Ответом считаются строки, пришедшие после команды и до следующей команды
+        этому серверу. Ожидание заканчивается совпадением строки с регулярным
+        выражением until, паузой quiet после первой строки ответа (если until не
+        задан) или по истечении timeout.
+        """
+        entry = self.processes.get(server_id)
+        buffer = self.consoles.get(server_id)
+        if entry is None or buffer is None or entry.popen.stdin is None:
+            return {'success': False, 'error': 'Сервер не принимает команды'}
+        command_id = next(self.command_counter)
+
+        def record():
+            with buffer.lock:
+                start_seq = buffer.next_seq - 1
+            with self.lock:
+                self.commands.setdefault(server_id, deque(maxlen=256)).append((command_id, start_seq, command))
+
+        if not entry.send(command, self.command_write_timeout, record):
+            return {'success': False, 'error': 'Сервер не принял команду (канал закрыт или не читается)'}
+        log.debug('command_sent', f"Команда серверу {server_id}: {command}", server_id=server_id,
+                  command_id=command_id)
+        result = {'success': True, 'server_id': server_id, 'command_id': command_id}
+        if timeout > 0:
+            result.update(self.wait_command_reply(server_id, command_id, timeout, until, quiet))
+        return result
+
+    def _command_bounds(self, server_id, command_id):
+        """Номера строк ответа команды: (после start_seq, не позже end_seq или без границы)"""
+        with self.lock:
+            records = list(self.commands.get(server_id, ()))
+        for index, (recorded_id, start_seq, _) in enumerate(records):
+            if recorded_id == command_id:
+                end_seq = records[index + 1][1] if index + 1 < len(records) else None
+                return start_seq, end_seq
+        return None
+
+    def get_command_reply(self, server_id, command_id):
+        """Уже полученные строки ответа команды"""
+        bounds = self._command_bounds(server_id, command_id)
+        buffer = self.consoles.get(server_id)
+        if bounds is None or buffer is None:
+            return {'lines': [], 'error': 'Команда не найдена'}
+        start_seq, end_seq = bounds
+        lines, truncated = buffer.tail(start_seq)
+        return {'lines': [list(line) for line in lines if end_seq is None or line[0] <= end_seq],
+                'truncated': truncated}
+
+    def wait_command_reply(self, server_id, command_id, timeout, until=None, quiet=0.3):
+        """Ожидание ответа команды (см. send_command); reason: matched, quiet, timeout или exited"""
+        deadline = time.monotonic() + timeout
+        pattern = re.compile(until) if until else None
+        buffer = self.consoles.get(server_id)
+        entry = self.processes.get(server_id)
+        bounds = self._command_bounds(server_id, command_id)
+        if buffer is None or bounds is None:
+            return {'reply': [], 'reason': 'unknown'}
+        seen = bounds[0]
+        reply = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                reason = 'timeout'
+                break
+            # Смерть процесса не дает новых строк, поэтому ждем порциями
+            arrived = buffer.wait(seen, min(remaining, quiet if reply and pattern is None else 0.5))
+            bounds = self._command_bounds(server_id, command_id)
+            end_seq = bounds[1] if bounds else None
+            if arrived:
+                lines, _ = buffer.tail(seen)
+                lines = [line for line in lines if end_seq is None or line[0] <= end_seq]
+                if lines:
+                    seen = lines[-1][0]
+                    reply.extend(lines)
+                    if pattern and any(pattern.search(line[2]) for line in lines):
+                        reason = 'matched'
+                        break
+                if end_seq is not None and seen >= end_seq:
+                    reason = 'superseded'
+                    break
+                continue
+            if reply and pattern is None:
+                reason = 'quiet'
+                break
+            if entry is None or entry.exited.is_set():
+                reason = 'exited'
+                break
+        return {'reply': [list(line) for line in reply], 'reason': reason}
+
+    def broadcast(self, command, selector=None, timeout=0, until=None, max_parallel=64):
+        """Команда многим серверам сразу.
+
+        selector: None - все запущенные, список ID или шаблон имени (fnmatch).
+        Сначала команда параллельно отправляется всем, затем параллельно
+        собираются ответы с общим сроком timeout.
+        """
+        targets = self._select_servers(selector, running=True)
+        if not targets:
+            return {'success': True, 'results': {}}
+        with futures.ThreadPoolExecutor(max_workers=min(max_parallel, len(targets))) as pool:
+            sent = dict(zip(targets, pool.map(lambda server_id: self.send_command(server_id, command), targets)))
+        if timeout > 0:
+            waiting = [server_id for server_id, result in sent.items() if result['success']]
+            if waiting:
+                with futures.ThreadPoolExecutor(max_workers=min(len(waiting), 256)) as pool:
+                    replies = pool.map(lambda server_id: self.wait_command_reply(
+                        server_id, sent[server_id]['command_id'], timeout, until), waiting)
+                    for server_id, reply in zip(waiting, replies):
+                        sent[server_id].update(reply)
+        failed = sum(1 for result in sent.values() if not result['success'])
+        log.info('command_broadcast', f"Команда {command!r} отправлена {len(sent) - failed} серверам, "
+                 f"ошибок: {failed}", targets=len(sent), failed=failed)
+        return {'success': True, 'results': sent}
+
+    def create_snapshot(self, server_id, io_rate_mb=None):
+        """Снимок каталога сервера; запущенный сервер на время снимка перестает сохранять мир"""
+        server = self.servers.get(server_id)
+        if server is None:
+            return {'success': False, 'error': 'Сервер не найден'}
+        directory = os.path.dirname(abspath(server.bat_path))
+        rate_mb = io_rate_mb if io_rate_mb is not None else self.snapshot_io_rate_mb
+        quiesced = server.stop_method == 'stop_command' and self.send_command(server_id, 'save-off')['success']
+        try:
+            if quiesced:
+                self.send_command(server_id, 'save-all flush', self.snapshot_quiesce_seconds, until='Saved the game')
+            manifest = self.snapshots.create(server_id, directory, rate_mb * 1024 * 1024 if rate_mb else None)
+        except Exception as e:
+            log.error('snapshot_failed', f"Ошибка снимка сервера {server_id}: {e}", server_id=server_id)
+            return {'success': False, 'error': str(e)}
+        finally:
+            if quiesced:
+                self.send_command(server_id, 'save-on')
+        stats = manifest['stats']
+        log.info('snapshot_created', f"Снимок {manifest['id']} сервера {server_id}: {stats['files']} файлов, "
+                 f"{stats['unchanged']} без изменений, {stats['new_chunks']} новых кусков",
+                 server_id=server_id, duration=stats['elapsed'], stored_bytes=stats['stored_bytes'])
+        return {'success': True, 'server_id': server_id, 'snapshot_id': manifest['id'], 'stats': stats}
+
+    def list_snapshots(self, server_id):
+        """Снимки сервера: ID, время создания и статистика"""
+        result = []
+        for snapshot_id in self.snapshots.list(server_id):
+            manifest = self.snapshots.load(server_id, snapshot_id)
+            result.append({'id': snapshot_id, 'created_at': manifest['created_at'], 'stats': manifest['stats']})
+        return result
+
+    def restore_snapshot(self, server_id, snapshot_id, target=None, clean=False, io_rate_mb=None):
+        """Восстановление снимка в каталог сервера (сервер должен быть остановлен) или в target"""
+        server = self.servers.get(server_id)
+        if server is None:
+            return {'success': False, 'error': 'Сервер не найден'}
+        if target is None:
+            if server_id in self.processes:
+                return {'success': False, 'error': 'Остановите сервер перед восстановлением'}
+            target = os.path.dirname(abspath(server.bat_path))
+        rate_mb = io_rate_mb if io_rate_mb is not None else self.snapshot_io_rate_mb
+        try:
+            result = self.snapshots.restore(server_id, snapshot_id, target,
+                                            rate_mb * 1024 * 1024 if rate_mb else None, clean)
+        except Exception as e:
+            log.error('snapshot_restore_failed', f"Ошибка восстановления снимка {snapshot_id}: {e}",
+                      server_id=server_id)
+            return {'success': False, 'error': str(e)}
+        log.info('snapshot_restored', f"Снимок {snapshot_id} сервера {server_id} восстановлен в {target}",
+                 server_id=server_id)
+        return {'success': True, 'target': target, **result}
+
+    def prune_snapshots(self, server_id, keep_last=5):
+        """Оставить keep_last последних снимков сервера"""
+        try:
+            result = self.snapshots.prune(server_id, keep_last)
+        except Exception as e:
+            log.error('snapshot_prune_failed', f"Ошибка очистки снимков: {e}", server_id=server_id)
+            return {'success': False, 'error': str(e)}
+        return {'success': True, **result}
+
+    def _on_node_event(self, node, event, payload):
+        """Событие агента пересылается подписчикам с именем узла"""
+        self.emit('node_event', {'node': node, 'event': event, 'payload': payload})
+
+    def _split_global_id(self, global_id):
+        """'узел:id' -> (узел, id); локальные серверы - (None, id)"""
+        if isinstance(global_id, str) and ':' in global_id:
+            node, _, server_id = global_id.rpartition(':')
+            return node, int(server_id)
+        return None, int(global_id)
+
+    def get_nodes(self):
+        return [node.info() for node in self.nodes.values()]
+
+    def get_catalogue(self):
+        """Серверы всех узлов; id удаленных серверов имеют вид 'узел:id'"""
+        catalogue = [{**server, 'node': None, 'global_id': server['id']} for server in self.get_servers()]
+        for name, node in self.nodes.items():
+            with node.lock:
+                servers = list(node.servers.values())
+            catalogue.extend({**server, 'node': name, 'global_id': f"{name}:{server['id']}",
+                              'node_status': node.status} for server in servers)
+        return catalogue
+
+    def federated_batch(self, commands, functions):
+        """Пакет команд {"server" | "node", "method", "args"} для разных узлов.
+
+        Команды одного узла уходят одним запросом /batch, узлы опрашиваются
+        параллельно, локальные команды выполняются через functions. В "server"
+        передается глобальный id, он подставляется первым аргументом.
+        """
+        groups = {}
+        for index, command in enumerate(commands):
+            node, args = command.get('node'), list(command.get('args') or [])
+            if 'server' in command:
+                node, server_id = self._split_global_id(command['server'])
+                args.insert(0, server_id)
+            groups.setdefault(node, []).append((index, {'method': command.get('method'), 'args': args,
+                                                        'kwargs': command.get('kwargs')}))
+        results = [None] * len(commands)
+
+        def run_group(node, items):
+            calls = [call for _, call in items]
+            if node is None:
+                replies = []
+                for call in calls:
+                    function = functions.get(call['method'])
+                    if function is None:
+                        replies.append({'error': f"Неизвестная функция: {call['method']}"})
+                        continue
+                    try:
+                        replies.append({'result': function(*call['args'], **(call['kwargs'] or {}))})
+                    except Exception as e:
+                        replies.append({'error': str(e)})
+            elif node not in self.nodes:
+                replies = [{'error': f'Неизвестный узел: {node}'}] * len(calls)
+            else:
+                replies = self.nodes[node].batch(calls)
+            for (index, _), reply in zip(items, replies):
+                results[index] = reply
+
+        with futures.ThreadPoolExecutor(max_workers=max(1, len(groups))) as pool:
+            for done in [pool.submit(run_group, node, items) for node, items in groups.items()]:
+                done.result()
+        return results
+
+    def create_store(self, settings):
+        """Выбор хранилища серверов: JSON (по умолчанию) или SQLite"""
+        if settings.get('storage') == 'sqlite':
+            return SqliteServerStore(self.servers_db_file, self.servers_file, settings['save_interval'])
+        return JsonServerStore(self.servers_file, settings['save_interval'])
+
+    def load_servers(self):
+        """Загрузка серверов из хранилища"""
+        try:
+            loaded = self.store.load()
+            if loaded is None:
+                log.info('store_missing', "Файл серверов не найден, создаем новый")
+                return
+            next_id, items = loaded
+            for item in items:
+                server = ServerRecord.from_dict(item)
+                # Состояние прошлого запуска не восстанавливаем
+                server.status = 'stopped'
+                server.started_at = None
+                self.servers[server.id] = server
+                self.port_index.add(server.id, self._parse_port(server.server_port))
+            self.next_id = max([next_id] + [server_id + 1 for server_id in self.servers])
+            log.info('servers_loaded', f"Загружено {len(self.servers)} серверов", count=len(self.servers))
+        except Exception as e:
+            log.error('servers_load_failed', f"Ошибка загрузки серверов: {e}")
+
+    def _snapshot_servers(self):
+        with self.lock:
+            return self.next_id, list(self.servers.values())
+
+    def save_servers(self, server=None):
+        """Пометка серверов для сохранения (запись выполняется пакетно в фоне)"""
+        self.store.mark_dirty(server)
+
+    def flush_servers(self):
+        """Немедленная запись несохраненных изменений"""
+        try:
+            self.store.flush()
+        except Exception as e:
+            log.error('store_save_failed', f"Ошибка сохранения серверов: {e}")
+
+    def get_app_settings(self):
+        """Получение настроек приложения"""
+        return load_app_settings(self.settings_file)
+
+    def save_app_settings(self, settings):
+        """Сохранение настроек приложения: переданные ключи поверх файла.
+
+        Интерфейс знает не все настройки (storage, api_token, nodes...), остальные
+        ключи файла сохраняются как есть.
+        """
+        try:
+            with self.lock:
+                stored = {}
+                if os.path.exists(self.settings_file):
+                    with open(self.settings_file, 'r', encoding='utf-8') as f:
+                        stored = json.load(f)
+                stored.update(settings)
+                write_file_atomic(self.settings_file,
+                                  json.dumps(stored, ensure_ascii=False, indent=2).encode('utf-8'))
+            log.info('settings_saved', "Настройки приложения сохранены")
+            return True
+        except Exception as e:
+            log.error('settings_save_failed', f"Ошибка сохранения настроек: {e}")
+            return False
+
+    def add_server(self, name, bat_path, description, icon_path=None, stop_method='stop_command', display_cmd=False,
+                   icon_position='left', server_ip='localhost', server_port=None, launch_mode='console',
+                   depends_on=None, restart_policy='never', cpu_affinity=None, cpu_cores=1, nice=None,
+                   io_priority=None, memory_limit_mb=None, open_files_limit=None, probe_protocol='minecraft'):
+        """Добавление нового сервера (без server_port порт выделяется автоматически)"""
+        try:
+            log.debug('server_adding', f"Добавление сервера: {name}, {bat_path}")
+
+            # Проверяем обязательные поля
+            if not name or not bat_path:
+                return {'success': False, 'error': 'Заполните название и путь к BAT файлу'}
+
+            with self.lock:
+                if server_port is None:
+                    port = self.allocate_port()
+                    if port is None:
+                        return {'success': False, 'error': 'Нет свободных портов в диапазоне'}
+                    server_port = str(port)
+                port = self._parse_port(server_port)
+                conflicts = self.port_index.conflicts(port)
+                if port is not None and conflicts:
+                    return {'success': False, 'error': f'Порт {port} уже настроен у сервера {conflicts[0]}',
+                            'suggested_port': self.allocate_port()}
+                server_id = self.next_id
+                self.next_id += 1
+                server = ServerRecord(
+                    id=server_id,
+                    name=name,
+                    bat_path=bat_path,
+                    description=description,
+                    icon_path=icon_path,
+                    stop_method=stop_method,
+                    display_cmd=display_cmd,
+                    icon_position=icon_position,
+                    server_ip=server_ip,
+                    server_port=server_port,
+                    launch_mode=launch_mode,
+                    depends_on=list(depends_on or []),
+                    restart_policy=restart_policy,
+                    cpu_affinity=cpu_affinity,
+                    cpu_cores=cpu_cores,
+                    nice=nice,
+                    io_priority=io_priority,
+                    memory_limit_mb=memory_limit_mb,
+                    open_files_limit=open_files_limit,
+                    probe_protocol=probe_protocol,
+                    created_at=datetime.now().isoformat(),
+                    status='stopped'
+                )
+
+                self.servers[server_id] = server
+                self.port_index.add(server_id, port)
+                self._record_change(server_id, 'added')
+                self.save_servers(server)
+
+            log.info('server_added', f"Сервер успешно добавлен с ID: {server_id}", server_id=server_id)
+            return {'success': True, 'server': server.to_dict()}
+
+        except Exception as e:
+            log.error('server_add_failed', f"Ошибка при добавлении сервера: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def update_server(self, server_id, name=None, bat_path=None, description=None, icon_path=None, stop_method=None,
+                      display_cmd=None, icon_position=None, server_ip=None, server_port=None, launch_mode=None,
+                      depends_on=None, restart_policy=None, restart_max=None, restart_window=None,
+                      cpu_affinity=None, cpu_cores=None, nice=None, io_priority=None, memory_limit_mb=None,
+                      open_files_limit=None, probe_protocol=None):
+        """Обновление настроек сервера"""
+        try:
+            server = self.servers.get(server_id)
+            if not server:
+                return False
+
+            values = {
+                'name': name,
+                'bat_path': bat_path,
+                'description': description,
+                'icon_path': icon_path,
+                'stop_method': stop_method,
+                'display_cmd': display_cmd,
+                'icon_position': icon_position,
+                'server_ip': server_ip,
+                'server_port': server_port,
+                'launch_mode': launch_mode,
+                'depends_on': list(depends_on) if depends_on is not None else None,
+                'restart_policy': restart_policy,
+                'restart_max': restart_max,
+                'restart_window': restart_window,
+                'cpu_affinity': cpu_affinity,
+                'cpu_cores': cpu_cores,
+                'nice': nice,
+                'io_priority': io_priority,
+                'memory_limit_mb': memory_limit_mb,
+                'open_files_limit': open_files_limit,
+                'probe_protocol': probe_protocol
+            }
+            updates = []
+            with self.lock:
+                old_port = self._parse_port(server.server_port)
+                new_port = self._parse_port(server_port) if server_port is not None else old_port
+                conflicts = self.port_index.conflicts(new_port, server_id)
+                if new_port != old_port and new_port is not None and conflicts:
+                    log.warning('port_conflict', f"Порт {new_port} уже настроен у сервера {conflicts[0]}",
+                                server_id=server_id, port=new_port)
+                    return False
+                for field, value in values.items():
+                    if value is not None and getattr(server, field) != value:
+                        setattr(server, field, value)
+                        updates.append(field)
+                if 'server_port' in updates:
+                    self.port_index.remove(server_id, old_port)
+                    self.port_index.add(server_id, self._parse_port(server.server_port))
+                if updates:
+                    self._record_change(server_id, 'modified')
+
+            if updates:
+                self.save_servers(server)
+                log.info('server_updated', f"Сервер {server_id} обновлен: {', '.join(updates)}",
+                         server_id=server_id, fields=updates)
+
+            return True
+
+        except Exception as e:
+            log.error('server_update_failed', f"Ошибка обновления сервера: {e}", server_id=server_id)
+            return False
+
+    def remove_server(self, server_id):
+        """Удаление сервера"""
+        try:
+            self._cancel_restart(server_id)
+            if server_id in self.processes:
+                self.stop_server(server_id)
+
+            with self.lock:
+                removed = self.servers.pop(server_id, None)
+                if removed:
+                    self.port_index.remove(server_id, self._parse_port(removed.server_port))
+                    self._record_change(server_id, 'removed')
+
+            if removed:
+                self.store.mark_removed(server_id)
+                log.info('server_removed', f"Сервер {server_id} удален", server_id=server_id)
+                return True
+            else:
+                log.warning('server_remove_missing', f"Сервер {server_id} не найден для удаления", server_id=server_id)
+                return False
+
+        except Exception as e:
+            log.error('server_remove_failed', f"Ошибка удаления сервера: {e}", server_id=server_id)
+            return False
+
+    def start_server(self, server_id, restart=False):
+        """Запуск сервера в отдельном окне командной строки или без окна с захватом вывода.
+
+        restart=True - автоматический перезапуск после падения; ручной запуск
+        отменяет ожидающий перезапуск и сбрасывает счетчик перезапусков.
+        """
+        started = time.monotonic()
+        reserved = False
+        try:
+            server = self.servers.get(server_id)
+            if not server:
+                return {'success': False, 'error': 'Сервер не найден'}
+            with self.lock:
+                # Процесс, который еще работает или останавливается, нельзя потерять, запустив второй поверх него
+                entry = self.processes.get(server_id)
+                if entry is not None or server_id in self.starting:
+                    if entry is not None and entry.stop_requested:
+                        error = 'Сервер еще останавливается'
+                    else:
+                        error = 'Сервер уже запущен'
+                    return {'success': False, 'error': error, 'status': server.status}
+                self.starting.add(server_id)
+                reserved = True
+            if not restart:
+                with self.lock:
+                    timer = self.restart_timers.pop(server_id, None)
+                    if timer:
+                        timer.cancel()
+                    self.restart_history.pop(server_id, None)
+
+            bat_path = server.bat_path
+
+            if not exists(bat_path):
+                return {'success': False, 'error': f'BAT файл не найден: {bat_path}'}
+
+            server_dir = os.path.dirname(bat_path) or os.getcwd()
+
+            port_error = self.check_port(server)
+            if port_error:
+                return {'success': False, 'error': port_error}
+            if self.preflight:
+                report = self.preflight.check(bat_path, server_dir)
+                if report['errors']:
+                    log.warning('preflight_failed', f"Сервер {server_id} не прошел проверку перед запуском: "
+                                f"{'; '.join(report['errors'])}", server_id=server_id)
+                    return {'success': False, 'error': '; '.join(report['errors']), 'preflight': report}
+
+            log.info('server_starting', f"Запуск сервера {server_id}: {bat_path} в {server_dir}", server_id=server_id)
+
+            # Без окна консоли (и всегда вне Windows) вывод читается менеджером
+            headless = server.launch_mode == 'headless' or os.name != 'nt'
+            if os.name == 'nt':
+                process = subprocess.Popen(
+                    ['cmd.exe', '/c', bat_path],
+                    cwd=server_dir,
+                    stdin=subprocess.PIPE if headless else None,
+                    stdout=subprocess.PIPE if headless else None,
+                    stderr=subprocess.STDOUT if headless else None,
+                    creationflags=subprocess.CREATE_NO_WINDOW if headless else subprocess.CREATE_NEW_CONSOLE
+                )
+            else:
+                process = subprocess.Popen(
+                    ['sh', bat_path],
+                    cwd=server_dir,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True
+                )
+
+            entry = ManagedProcess(server_id, process)
+            self._check_address_space_limit(server)
+            self._plan_placement(server)
+            self.apply_placement(server_id, entry.get_process_tree())
+            with self.lock:
+                self.processes[server_id] = entry
+                server.started_at = datetime.now().isoformat()
+                server.time_to_ready = None
+                server.probe = None
+                port = self._parse_port(server.server_port)
+                server.health = 'starting' if self.prober and port else None
+                self._set_status(server, 'running')
+                buffer = self.consoles.get(server_id)
+                if buffer is None:
+                    buffer = self.consoles[server_id] = ConsoleBuffer(self.console_buffer_lines)
+            self.game_logs.start_session(server_id)
+            if headless:
+                self.console_hub.attach(server_id, process.stdout, buffer)
+            self.supervisor.watch(entry)
+            if server.health == 'starting':
+                self.prober.watch(entry, server.server_ip or 'localhost', port, server.probe_protocol == 'minecraft')
+            else:
+                # Без проверки доступности сервер считается восстановленным сразу после запуска
+                self._resolve_incident(server_id)
+
+            log.info('server_started', f"Сервер {server_id} запущен с PID: {process.pid}", server_id=server_id,
+                     pid=process.pid, duration=time.monotonic() - started)
+            return {'success': True}
+
+        except Exception as e:
+            log.error('server_start_failed', f"Ошибка запуска сервера: {e}", server_id=server_id)
+            return {'success': False, 'error': str(e)}
+        finally:
+            if reserved:
+                with self.lock:
+                    self.starting.discard(server_id)
+
+    def stop_server(self, server_id):
+        """Остановка сервера (выполняется в фоне, интерфейс сразу получает состояние stopping)"""
+        try:
+            with self.lock:
+                server = self.servers.get(server_id)
+                entry = self.processes.get(server_id)
+                if server and not entry and self._cancel_restart(server_id):
+                    return {'success': True, 'status': 'stopped'}
+                if not server or not entry:
+                    return {'success': False, 'error': 'Сервер не запущен'}
+                if entry.stop_requested:
+                    return {'success': True, 'status': 'stopping'}
+                entry.stop_requested = True
+                self._set_status(server, 'stopping')
+
+            log.info('server_stopping',
+                     f"Остановка сервера {server_id} (PID: {entry.pid}) методом: {server.stop_method}",
+                     server_id=server_id, pid=entry.pid)
+            thread = threading.Thread(target=self._stop_worker,
+                                      args=(entry, server.stop_method, server.stop_timeout), daemon=True)
+            thread.start()
+            return {'success': True, 'status': 'stopping'}
+
+        except Exception as e:
+            log.error('server_stop_failed', f"Ошибка остановки сервера: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def _stop_worker(self, entry, stop_method, stop_timeout):
+        """Команда stop -> ожидание -> SIGTERM группе -> SIGKILL группе"""
+        started = time.monotonic()
+        try:
+            # Запись команды входит в stop_timeout, чтобы зависший сервер не задерживал эскалацию
+            if stop_method == 'stop_command' and entry.send('stop', timeout=stop_timeout):
+                entry.exited.wait(max(0, stop_timeout - (time.monotonic() - started)))
+
+            if not entry.exited.is_set():
+                entry.signal_tree()
+                if not entry.exited.wait(self.kill_timeout):
+                    log.warning('server_kill', f"Сервер {entry.server_id} не завершился, принудительное завершение",
+                                server_id=entry.server_id)
+                    entry.signal_tree(force=True)
+                    entry.exited.wait(self.kill_timeout)
+
+            if entry.exited.is_set():
+                log.info('server_stopped', f"Сервер {entry.server_id} остановлен", server_id=entry.server_id,
+                         duration=time.monotonic() - started)
+            else:
+                log.error('server_stop_timeout', f"Не удалось остановить сервер {entry.server_id}",
+                          server_id=entry.server_id)
+            self.emit('server_stopped', {'server_id': entry.server_id, 'success': entry.exited.is_set(),
+                                         'returncode': entry.returncode})
+        except Exception as e:
+            log.error('server_stop_failed', f"Ошибка остановки сервера: {e}")
+
+    def start_many(self, server_ids=None, max_parallel=4, stagger=0, ready_timeout=120, on_progress=None):
+        """Запуск нескольких серверов с учетом зависимостей (depends_on)"""
+        with self.lock:
+            server_ids = list(server_ids) if server_ids is not None else list(self.servers)
+            deps = {}
+            for server_id in server_ids:
+                server = self.servers.get(server_id)
+                deps[server_id] = set(server.depends_on) if server else set()
+
+        def start_one(server_id):
+            server = self.servers.get(server_id)
+            if server is None:
+                return {'success': False, 'error': 'Сервер не найден'}
+            # Зависимости вне запускаемого набора должны быть уже готовы
+            for dep_id in server.depends_on:
+                if dep_id not in deps and not self.wait_ready(dep_id, 0):
+                    return {'success': False, 'error': f'Зависимость {dep_id} не запущена'}
+            if server_id in self.processes:
+                return {'success': True, 'already_running': True}
+            started = time.monotonic()
+            result = self.start_server(server_id)
+            result['launch_latency'] = time.monotonic() - started
+            if result['success']:
+                if self.wait_ready(server_id, ready_timeout):
+                    result['ready_latency'] = time.monotonic() - started
+                else:
+                    result = {**result, 'success': False, 'error': 'Сервер не стал готов вовремя'}
+            return result
+
+        return self._run_ordered('start', deps, start_one, max_parallel, stagger, on_progress)
+
+    def stop_many(self, server_ids=None, max_parallel=16, stagger=0, on_progress=None):
+        """Остановка нескольких серверов в порядке, обратном зависимостям"""
+        with self.lock:
+            server_ids = list(server_ids) if server_ids is not None else list(self.servers)
+            # Сервер останавливается после всех серверов, которые от него зависят
+            deps = {server_id: set() for server_id in server_ids}
+            for server_id in server_ids:
+                server = self.servers.get(server_id)
+                for dep_id in (server.depends_on if server else []):
+                    if dep_id in deps:
+                        deps[dep_id].add(server_id)
+
+        def stop_one(server_id):
+            entry = self.processes.get(server_id)
+            if entry is None:
+                self._cancel_restart(server_id)
+                return {'success': True, 'already_stopped': True}
+            server = self.servers.get(server_id)
+            started = time.monotonic()
+            result = self.stop_server(server_id)
+            if result['success']:
+                timeout = (server.stop_timeout if server else 0) + 2 * self.kill_timeout + 1
+                if not entry.exited.wait(timeout):
+                    result = {'success': False, 'error': 'Сервер не остановился'}
+            result['stop_latency'] = time.monotonic() - started
+            return result
+
+        return self._run_ordered('stop', deps, stop_one, max_parallel, stagger, on_progress)
+
+    def _run_ordered(self, operation, deps, worker, max_parallel, stagger, on_progress):
+        """Выполнение worker для серверов после их зависимостей, не более max_parallel одновременно"""
+        operation_id = next(self.operation_counter)
+        started = time.monotonic()
+        results = {}
+        pending = {server_id: {dep_id for dep_id in server_deps if dep_id in deps}
+                   for server_id, server_deps in deps.items()}
+        next_launch = [started]
+        launch_lock = threading.Lock()
+
+        def run(server_id):
+            # Разносим запуски во времени, чтобы серверы не прогревались одновременно
+            with launch_lock:
+                delay = next_launch[0] - time.monotonic()
+                next_launch[0] = max(next_launch[0], time.monotonic()) + stagger
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                return worker(server_id)
+            except Exception as e:
+                return {'success': False, 'error': str(e)}
+
+        def report(server_id, result):
+            results[server_id] = result
+            progress = {'operation_id': operation_id, 'operation': operation, 'server_id': server_id,
+                        'result': result, 'done': len(results), 'total': len(deps)}
+            if on_progress:
+                on_progress(progress)
+            self.emit('bulk_progress', progress)
+
+        with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+            running = {}
+            while pending or running:
+                for server_id in [s for s, waiting in pending.items() if not waiting]:
+                    del pending[server_id]
+                    running[executor.submit(run, server_id)] = server_id
+                if not running:
+                    # Остались только серверы с циклическими зависимостями
+                    for server_id in list(pending):
+                        del pending[server_id]
+                        report(server_id, {'success': False, 'error': 'Циклическая зависимость'})
+                    break
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    server_id = running.pop(future)
+                    result = future.result()
+                    report(server_id, result)
+                    if result['success']:
+                        for waiting in pending.values():
+                            waiting.discard(server_id)
+                        continue
+                    # Неудача пропускает всех, кто зависит от сервера хотя бы косвенно (обход в ширину)
+                    failed = deque([server_id])
+                    while failed:
+                        failed_id = failed.popleft()
+                        for other_id, waiting in list(pending.items()):
+                            if failed_id in waiting:
+                                del pending[other_id]
+                                report(other_id, {'success': False, 'skipped': True,
+                                                  'error': f'Пропущен: не выполнено для зависимости {failed_id}'})
+                                failed.append(other_id)
+        return {
+            'operation_id': operation_id,
+            'success': all(result['success'] for result in results.values()),
+            'elapsed': time.monotonic() - started,
+            'results': results
+        }
+
+    def select_file_dialog(self, file_type="bat"):
+        """Диалог выбора файла"""
+        try:
+            import tkinter as tk
+            from tkinter import filedialog
+
+            root = tk.Tk()
+            root.withdraw()
+            root.attributes('-topmost', True)
+
+            if file_type == "bat":
+                file_path = filedialog.askopenfilename(
+                    title="Выберите .bat файл сервера",
+                    filetypes=[("Batch files", "*.bat"), ("All files", "*.*")]
+                )
+            else:
+                file_path = filedialog.askopenfilename(
+                    title="Выберите файл иконки",
+                    filetypes=[("Image files", "*.png *.jpg *.jpeg *.ico *.bmp"), ("All files", "*.*")]
+                )
+
+            root.destroy()
+            log.debug('file_selected', f"Выбран файл: {file_path}")
+            return file_path
+
+        except Exception as e:
+            log.error('file_dialog_failed', f"Ошибка диалога выбора файла: {e}")
+            return ""
+
+    def get_system_info(self):
+        """Получение информации о системе"""
+        return {
+            'platform': platform.system(),
+            'platform_version': platform.version(),
+            'architecture': platform.architecture()[0],
+            'processor': platform.processor(),
+            'python_version': platform.python_version()
+        }
+
+
+class ApiServer:
+    """Локальный HTTP/JSON API менеджера на asyncio (Unix сокет или порт на localhost).
+
+    POST /call/<функция> - тело: список позиционных или словарь именованных аргументов;
+    POST /batch - список вызовов {"method", "args", "kwargs"}, выполняемых по порядку;
+    GET /methods - доступные функции;
+    GET /events?since=N&timeout=T - события менеджера после N (long polling);
+    GET /metrics - метрики в текстовом формате Prometheus.
+    Соединения keep-alive, запросы одного соединения обрабатываются по очереди.
+    Если задан token, каждый запрос должен нести заголовок Authorization: Bearer <token>.
+    metrics_only=True оставляет только GET /metrics (слушатель для Prometheus в режиме с интерфейсом).
+    """
+    MAX_HEADER = 65536
+    MAX_BODY = 16 * 1024 * 1024
+    REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 413: 'Payload Too Large',
+               431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+
+    def __init__(self, manager, functions, socket_path=None, host='127.0.0.1', port=8765, events_size=10000,
+                 max_workers=16, token=None, metrics_only=False):
+        self.manager = manager
+        self.token = token
+        self.metrics_only = metrics_only
+        self.functions = functions
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.loop = None
+        # (seq, время, событие, данные)
+        self.events = deque(maxlen=events_size)
+        self.next_event_seq = 1
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._new_event = None
+        self._stopped = None
+
+    @staticmethod
+    def is_loopback(host):
+        """Доступен ли адрес только с этой машины"""
+        if host == 'localhost':
+            return True
+        try:
+            return ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            return False
+
+    async def serve(self):
+        """Обслуживание запросов до вызова stop()"""
+        if not self.socket_path and not self.token and not self.is_loopback(self.host):
+            # API позволяет запускать произвольные скрипты, открывать его в сеть без токена нельзя
+            raise PermissionError(f'Для API на адресе {self.host} нужен api_token в настройках')
+        self.loop = asyncio.get_running_loop()
+        self._new_event = asyncio.Event()
+        self._stopped = asyncio.Event()
+        if not self.metrics_only:
+            self.manager.add_listener(self._on_manager_event)
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            server = await asyncio.start_unix_server(self._handle, self.socket_path, limit=self.MAX_HEADER)
+            os.chmod(self.socket_path, 0o600)
+            log.info('api_listening', f"API доступен через сокет {self.socket_path}")
+        else:
+            server = await asyncio.start_server(self._handle, self.host, self.port, limit=self.MAX_HEADER)
+            log.info('api_listening', f"API доступен на http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            if not self.metrics_only:
+                self.manager.listeners.remove(self._on_manager_event)
+            self._executor.shutdown(wait=False)
+            if self.socket_path and os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def stop(self):
+        """Остановка сервера (можно вызывать из любого потока)"""
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def _on_manager_event(self, event, payload):
+        try:
+            self.loop.call_soon_threadsafe(self._append_event, event, payload)
+        except RuntimeError:
+            # Цикл событий уже закрыт
+            pass
+
+    def _append_event(self, event, payload):
+        self.events.append((self.next_event_seq, time.time(), event, payload))
+        self.next_event_seq += 1
+        # Будим всех ожидающих и заводим новое событие для следующих
+        self._new_event.set()
+        self._new_event = asyncio.Event()
+
+    async def _wait_events(self, since, timeout):
+        # since больше последнего номера - клиент из прошлой сессии, отвечаем сразу
+        if since == self.next_event_seq - 1 and timeout > 0:
+            try:
+                await asyncio.wait_for(self._new_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        events = [list(event) for event in self.events if event[0] > since]
+        first_seq = self.events[0][0] if self.events else self.next_event_seq
+        return {
+            'session': self.manager.session_id,
+            'events': events,
+            'last_seq': events[-1][0] if events else self.next_event_seq - 1,
+            'truncated': since + 1 < first_seq
+        }
+
+    def _call(self, name, args=None, kwargs=None):
+        function = self.functions.get(name)
+        if function is None:
+            return {'error': f'Неизвестная функция: {name}'}
+        try:
+            return {'result': function(*(args or []), **(kwargs or {}))}
+        except Exception as e:
+            return {'error': str(e)}
+
+    def _call_batch(self, calls):
+        return [self._call(call.get('method'), call.get('args'), call.get('kwargs')) for call in calls]
+
+    async def _dispatch(self, method, target, body):
+        path, _, query = target.partition('?')
+        if self.metrics_only and path != '/metrics':
+            return 404, {'error': 'Не найдено'}
+        if method == 'GET' and path == '/methods':
+            return 200, sorted(self.functions)
+        if method == 'GET' and path == '/metrics':
+            return 200, self.manager.render_metrics().encode('utf-8')
+        if method == 'GET' and path == '/events':
+            params = dict(parse_qsl(query))
+            return 200, await self._wait_events(int(params.get('since', 0)), float(params.get('timeout', 0)))
+        if method == 'POST' and path.startswith('/call/'):
+            name = path[len('/call/'):]
+            if name not in self.functions:
+                return 404, {'error': f'Неизвестная функция: {name}'}
+            args = json.loads(body) if body else []
+            if isinstance(args, dict):
+                call = (name, None, args)
+            else:
+                call = (name, args if isinstance(args, list) else [args], None)
+            result = await self.loop.run_in_executor(self._executor, self._call, *call)
+            return (500 if 'error' in result else 200), result
+        if method == 'POST' and path == '/batch':
+            calls = json.loads(body)
+            if not isinstance(calls, list) or not all(isinstance(call, dict) for call in calls):
+                return 400, {'error': 'Ожидается список вызовов'}
+            return 200, await self.loop.run_in_executor(self._executor, self._call_batch, calls)
+        return 404, {'error': 'Не найдено'}
+
+    def _respond(self, writer, status, result, keep_alive):
+        if isinstance(result, bytes):
+            data, content_type = result, 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            data = json.dumps(result, ensure_ascii=False, default=str).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        writer.write((f'HTTP/1.1 {status} {self.REASONS[status]}\r\n'
+                      f'Content-Type: {content_type}\r\n'
+                      f'Content-Length: {len(data)}\r\n'
+                      f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n').encode('latin-1') + data)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    self._respond(writer, 431, {'error': 'Слишком большой заголовок'}, False)
+                    break
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ', 2)
+                    headers = {}
+                    for line in header_lines:
+                        if line:
+                            name, _, value = line.partition(':')
+                            headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    self._respond(writer, 400, {'error': 'Некорректный запрос'}, False)
+                    break
+                if length > self.MAX_BODY:
+                    self._respond(writer, 413, {'error': 'Слишком большое тело запроса'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+                if self.token and headers.get('authorization') != f'Bearer {self.token}':
+                    self._respond(writer, 401, {'error': 'Требуется токен доступа'}, keep_alive)
+                    await writer.drain()
+                    if not keep_alive:
+                        break
+                    continue
+                try:
+                    status, result = await self._dispatch(method, target, body)
+                except ValueError as e:
+                    status, result = 400, {'error': str(e)}
+                self._respond(writer, status, result, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def api_request(method, path, body=None, socket_path=None, host='127.0.0.1', port=8765, timeout=None, token=None):
+    """Запрос к API запущенного менеджера (для командной строки и скриптов)"""
+    import http.client
+
+    class UnixHTTPConnection(http.client.HTTPConnection):
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(socket_path)
+
+    if socket_path:
+        connection = UnixHTTPConnection('localhost', timeout=timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        connection.request(method, path, data, headers)
+        return json.loads(connection.getresponse().read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+# Экземпляр менеджера создается при запуске интерфейса или фонового режима
+manager = None
+API_FUNCTIONS = {}
+
+
+def expose(function):
+    """Регистрация функции для интерфейса (eel) и HTTP API"""
+    API_FUNCTIONS[function.__name__] = function
+    return function
+
+
+def push_to_ui(event, payload):
+    """Передача события менеджера в интерфейс (JS функция on_<event>, если она объявлена)"""
+    js_function = getattr(eel, f'on_{event}', None)
+    if js_function:
+        js_function(payload)
+
+
+# Функции интерфейса и API
+@expose
+def get_servers():
+    return manager.get_servers()
+
+
+@expose
+def get_changes(since_version=0, session=None):
+    return manager.get_changes(since_version, session)
+
+
+@expose
+def add_server(name, bat_path, description, icon_path=None, stop_method='stop_command', display_cmd=False,
+               icon_position='left', server_ip='localhost', server_port=None, launch_mode='console',
+               depends_on=None, restart_policy='never', cpu_affinity=None, cpu_cores=1, nice=None, io_priority=None,
+               memory_limit_mb=None, open_files_limit=None, probe_protocol='minecraft'):
+    log.debug('api_call', f"Вызов add_server: {name}, {bat_path}", function='add_server')
+    return manager.add_server(name, bat_path, description, icon_path, stop_method, display_cmd, icon_position,
+                              server_ip, server_port, launch_mode, depends_on, restart_policy, cpu_affinity,
+                              cpu_cores, nice, io_priority, memory_limit_mb, open_files_limit, probe_protocol)
+
+
+@expose
+def update_server(server_id, name, bat_path, description, icon_path, stop_method, display_cmd, icon_position, server_ip,
+                  server_port, launch_mode=None, depends_on=None, restart_policy=None, restart_max=None,
+                  restart_window=None, cpu_affinity=None, cpu_cores=None, nice=None, io_priority=None,
+                  memory_limit_mb=None, open_files_limit=None, probe_protocol=None):
+    log.debug('api_call', f"Вызов update_server для сервера {server_id}", function='update_server')
+    return manager.update_server(server_id, name, bat_path, description, icon_path, stop_method, display_cmd,
+                                 icon_position, server_ip, server_port, launch_mode, depends_on, restart_policy,
+                                 restart_max, restart_window, cpu_affinity, cpu_cores, nice, io_priority,
+                                 memory_limit_mb, open_files_limit, probe_protocol)
+
+
+@expose
+def remove_server(server_id):
+    log.debug('api_call', f"Вызов remove_server для сервера {server_id}", function='remove_server')
+    return manager.remove_server(server_id)
+
+
+@expose
+def start_server(server_id):
+    log.debug('api_call', f"Вызов start_server для сервера {server_id}", function='start_server')
+    return manager.start_server(server_id)
+
+
+@expose
+def stop_server(server_id):
+    log.debug('api_call', f"Вызов stop_server для сервера {server_id}", function='stop_server')
+    return manager.stop_server(server_id)
+
+
+def run_bulk_in_background(method, *args, event='bulk_done'):
+    """Запуск долгой операции в фоне, результат приходит событием event"""
+    def worker():
+        result = method(*args)
+        manager.emit(event, result)
+
+    threading.Thread(target=worker, daemon=True).start()
+    return {'success': True}
+
+
+@expose
+def start_many(server_ids=None, max_parallel=4, stagger=0):
+    log.debug('api_call', f"Вызов start_many для серверов {server_ids}", function='start_many')
+    return run_bulk_in_background(manager.start_many, server_ids, max_parallel, stagger)
+
+
+@expose
+def stop_many(server_ids=None, max_parallel=16, stagger=0):
+    log.debug('api_call', f"Вызов stop_many для серверов {server_ids}", function='stop_many')
+    return run_bulk_in_background(manager.stop_many, server_ids, max_parallel, stagger)
+
+
+@expose
+def select_file(file_type):
+    log.debug('api_call', f"Вызов select_file для типа: {file_type}", function='select_file')
+    return manager.select_file_dialog(file_type)
+
+
+@expose
+def get_server_info(server_id):
+    server = manager.get_server(server_id)
+    if server:
+        return {
+            'server': server.to_dict(),
+            'game': manager.get_game_metrics(server_id),
+            'system_info': manager.get_system_info()
+        }
+    return None
+
+
+@expose
+def preflight_server(server_id):
+    return manager.preflight_server(server_id)
+
+
+@expose
+def allocate_port(start=None, end=None):
+    return manager.allocate_port(start, end)
+
+
+@expose
+def get_port_map():
+    return manager.get_port_map()
+
+
+@expose
+def register_template(name, path, bat_name, immutable_patterns=None):
+    return manager.register_template(name, path, bat_name, immutable_patterns)
+
+
+@expose
+def get_templates():
+    return manager.get_templates()
+
+
+@expose
+def remove_template(name):
+    return manager.remove_template(name)
+
+
+@expose
+def provision_from_template(template_name, count=1):
+    log.debug('api_call', f"Вызов provision_from_template для шаблона {template_name}",
+              function='provision_from_template')
+    return manager.provision_from_template(template_name, count)
+
+
+@expose
+def destroy_instance(server_id):
+    log.debug('api_call', f"Вызов destroy_instance для сервера {server_id}", function='destroy_instance')
+    return manager.destroy_instance(server_id)
+
+
+@expose
+def send_command(server_id, command, timeout=0, until=None):
+    log.debug('api_call', f"Вызов send_command для сервера {server_id}", function='send_command')
+    return manager.send_command(server_id, command, timeout, until)
+
+
+@expose
+def broadcast(command, selector=None, timeout=0, until=None):
+    log.debug('api_call', f"Вызов broadcast: {command}", function='broadcast')
+    return manager.broadcast(command, selector, timeout, until)
+
+
+@expose
+def get_command_reply(server_id, command_id):
+    return manager.get_command_reply(server_id, command_id)
+
+
+@expose
+def add_schedule(name, action, target=None, cron=None, interval=None, jitter=0, command=None):
+    log.debug('api_call', f"Вызов add_schedule: {name}", function='add_schedule')
+    return manager.add_schedule(name, action, target, cron, interval, jitter, command)
+
+
+@expose
+def remove_schedule(schedule_id):
+    return manager.remove_schedule(schedule_id)
+
+
+@expose
+def set_schedule_enabled(schedule_id, enabled):
+    return manager.set_schedule_enabled(schedule_id, enabled)
+
+
+@expose
+def get_schedules():
+    return manager.get_schedules()
+
+
+@expose
+def get_nodes():
+    return manager.get_nodes()
+
+
+@expose
+def get_catalogue():
+    return manager.get_catalogue()
+
+
+@expose
+def federated_batch(commands):
+    log.debug('api_call', f"Вызов federated_batch: {len(commands)} команд", function='federated_batch')
+    return manager.federated_batch(commands, API_FUNCTIONS)
+
+
+@expose
+def create_snapshot(server_id, io_rate_mb=None):
+    log.debug('api_call', f"Вызов create_snapshot для сервера {server_id}", function='create_snapshot')
+    return run_bulk_in_background(manager.create_snapshot, server_id, io_rate_mb, event='snapshot_done')
+
+
+@expose
+def list_snapshots(server_id):
+    return manager.list_snapshots(server_id)
+
+
+@expose
+def restore_snapshot(server_id, snapshot_id, target=None, clean=False):
+    log.debug('api_call', f"Вызов restore_snapshot {snapshot_id} для сервера {server_id}", function='restore_snapshot')
+    return run_bulk_in_background(manager.restore_snapshot, server_id, snapshot_id, target, clean,
+                                 event='snapshot_restored')
+
+
+@expose
+def prune_snapshots(server_id, keep_last=5):
+    return manager.prune_snapshots(server_id, keep_last)
+
+
+@expose
+def get_incidents(server_id):
+    return manager.get_incidents(server_id)
+
+
+@expose
+def get_console_tail(server_id, since_seq=0):
+    return manager.get_console_tail(server_id, since_seq)
+
+
+@expose
+def get_server_metrics(server_id, resolution='raw'):
+    return manager.get_server_metrics(server_id, resolution)
+
+
+@expose
+def search_logs(server_id, start=None, end=None, pattern=None, limit=10000):
+    """Поиск по архиву журнала, результаты приходят пачками событием log_search_results"""
+    search_id = next(manager.operation_counter)
+
+    def worker():
+        batch = []
+        found = 0
+        try:
+            for ts, line in manager.search_logs(server_id, start, end, pattern):
+                batch.append([ts, line])
+                found += 1
+                if len(batch) >= 500:
+                    manager.emit('log_search_results', {'search_id': search_id, 'lines': batch, 'done': False})
+                    batch = []
+                if found >= limit:
+                    break
+            manager.emit('log_search_results', {'search_id': search_id, 'lines': batch, 'done': True})
+        except Exception as e:
+            manager.emit('log_search_results', {'search_id': search_id, 'lines': batch, 'done': True,
+                                                 'error': str(e)})
+
+    threading.Thread(target=worker, daemon=True).start()
+    return {'search_id': search_id}
+
+
+@expose
+def get_diagnostics():
+    return manager.get_diagnostics()
+
+
+@expose
+def get_app_settings():
+    return manager.get_app_settings()
+
+
+@expose
+def save_app_settings(settings):
+    return manager.save_app_settings(settings)
+
+
+@expose
+def get_app_version():
+    return {
+        'version': '1.2.0',
+        'credits': '0vfx, deepseek'
+    }
+
+
+def start_metrics_listener(manager, port):
+    """GET /metrics на 127.0.0.1:port в отдельном потоке (для режима с интерфейсом)"""
+    server = ApiServer(manager, {}, host='127.0.0.1', port=port, metrics_only=True)
+
+    def serve():
+        try:
+            asyncio.run(server.serve())
+        except OSError as e:
+            log.error('metrics_listen_failed', f"Не удалось открыть /metrics на порту {port}: {e}")
+
+    threading.Thread(target=serve, name='metrics', daemon=True).start()
+    return server
+
+
+def run_gui():
+    """Запуск менеджера с интерфейсом в окне браузера"""
+    global manager
+    eel.init(abspath('web'))
+    manager = ServerManager()
+    for function in manager.instrument_functions(API_FUNCTIONS).values():
+        eel.expose(function)
+    manager.add_listener(push_to_ui)
+    metrics_port = manager.get_app_settings()['metrics_port']
+    metrics_server = None
+    if manager.metrics is not None and metrics_port:
+        metrics_server = start_metrics_listener(manager, metrics_port)
+    try:
+        eel.start('index.html', size=(1000, 700), mode='chrome', port=8000)
+    except Exception as e:
+        log.error('gui_failed', f"Ошибка запуска: {e}")
+    finally:
+        if metrics_server:
+            metrics_server.stop()
+        manager.shutdown()
+
+
+def run_headless(socket_path=None, host='127.0.0.1', port=8765, token=None):
+    """Запуск менеджера без интерфейса, управление через HTTP API (он же агент узла)"""
+    global manager
+    manager = ServerManager()
+    server = ApiServer(manager, manager.instrument_functions(API_FUNCTIONS), socket_path, host, port, token=token)
+
+    async def serve():
+        if os.name != 'nt':
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, server.stop)
+        await server.serve()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.shutdown()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Менеджер серверов Minecraft')
+    parser.add_argument('--headless', action='store_true', help='запуск без интерфейса с HTTP API')
+    parser.add_argument('--socket', help='Unix сокет API (по умолчанию api_socket из настроек)')
+    parser.add_argument('--host', help='адрес API вместо Unix сокета')
+    parser.add_argument('--port', type=int, help='порт API вместо Unix сокета')
+    parser.add_argument('--call', nargs='+', metavar=('FUNCTION', 'ARG'),
+                        help='вызвать функцию запущенного менеджера (аргументы в формате JSON)')
+    args = parser.parse_args(argv)
+
+    settings = load_app_settings()
+    host = args.host or settings['api_host']
+    port = args.port or settings['api_port']
+    socket_path = args.socket or settings['api_socket']
+    if os.name == 'nt' or ((args.host or args.port) and not args.socket):
+        socket_path = None
+
+    if args.call:
+        function, *raw_args = args.call
+        call_args = []
+        for raw in raw_args:
+            try:
+                call_args.append(json.loads(raw))
+            except ValueError:
+                call_args.append(raw)
+        response = api_request('POST', f'/call/{function}', call_args, socket_path, host, port,
+                               token=settings['api_token'])
+        print(json.dumps(response, ensure_ascii=False, indent=2))
+        return 1 if 'error' in response else 0
+
+    print("=" * 50)
+    print("Запуск менеджера серверов Minecraft v1.2.0")
+    print("Разработчики: 0vfx, deepseek")
+    print("=" * 50)
+
+    listener = configure_logging(settings)
+    try:
+        if args.headless and not socket_path and not settings['api_token'] and not ApiServer.is_loopback(host):
+            log.error('api_token_required', f"API на адресе {host} доступен из сети, запуск без api_token "
+                      f"в app_settings.json запрещен")
+            return 2
+        if args.headless:
+            run_headless(socket_path, host, port, settings['api_token'])
+        else:
+            run_gui()
+        log.info('app_stopped', "Приложение завершено")
+    finally:
+        listener.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def make_manager(tmp_path, monkeypatch):
+    """ServerManager во временном каталоге; настройки поверх тихих значений по умолчанию"""
+    monkeypatch.chdir(tmp_path)
+    managers = []
+
+    def create(**settings):
+        settings = {'health_probe': False, 'log_archive': False, 'log_file': '', 'log_console': False,
+                    'save_interval': 0.05, **settings}
+        with open(tmp_path / 'app_settings.json', 'w', encoding='utf-8') as f:
+            json.dump(settings, f)
+        manager = main.ServerManager()
+        managers.append(manager)
+        return manager
+
+    yield create
+    for manager in managers:
+        for entry in list(manager.processes.values()):
+            entry.signal_tree(force=True)
+        manager.shutdown()
+
+
+@pytest.fixture
+def script(tmp_path):
+    """Сценарий запуска сервера с заданным телом"""
+    def create(name, body):
+        path = tmp_path / f'{name}.sh'
+        path.write_text(body, encoding='utf-8')
+        return str(path)
+
+    return create
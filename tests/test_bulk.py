@@ -0,0 +1,48 @@
+import threading
+
+
+def run_ordered(manager, deps, failing=(), max_parallel=4):
+    order = []
+    lock = threading.Lock()
+
+    def worker(server_id):
+        with lock:
+            order.append(server_id)
+        if server_id in failing:
+            return {'success': False, 'error': 'сбой'}
+        return {'success': True}
+
+    progress = []
+    summary = manager._run_ordered('start', deps, worker, max_parallel, 0, progress.append)
+    assert [item['done'] for item in progress] == list(range(1, len(deps) + 1))
+    return summary, order
+
+
+def test_dependencies_run_first(make_manager):
+    manager = make_manager()
+    deps = {1: set(), 2: {1}, 3: {1, 2}, 4: set()}
+    summary, order = run_ordered(manager, deps)
+    assert summary['success']
+    assert order.index(1) < order.index(2) < order.index(3)
+
+
+def test_failure_skips_transitive_dependents(make_manager):
+    manager = make_manager()
+    deps = {1: set(), 2: {1}, 3: {2}, 4: {3}, 5: set(), 6: {5}}
+    summary, order = run_ordered(manager, deps, failing={1})
+    results = summary['results']
+    assert not summary['success']
+    assert sorted(order) == [1, 5, 6]
+    assert results[1] == {'success': False, 'error': 'сбой'}
+    for server_id, failed_dep in ((2, 1), (3, 2), (4, 3)):
+        assert results[server_id]['skipped'] is True
+        assert results[server_id]['error'] == f'Пропущен: не выполнено для зависимости {failed_dep}'
+    assert results[5]['success'] and results[6]['success']
+
+
+def test_cycle_reported(make_manager):
+    manager = make_manager()
+    summary, order = run_ordered(manager, {1: set(), 2: {3}, 3: {2}})
+    assert order == [1]
+    assert summary['results'][2]['error'] == 'Циклическая зависимость'
+    assert summary['results'][3]['error'] == 'Циклическая зависимость'
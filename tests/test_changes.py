@@ -0,0 +1,99 @@
+import threading
+
+import main
+
+
+def add(manager, name, script):
+    return manager.add_server(name, script, '')['server']['id']
+
+
+def names(servers):
+    return sorted(server['name'] for server in servers)
+
+
+def test_incremental_changes(make_manager, script):
+    manager = make_manager()
+    path = script('srv', 'exec sleep 60\n')
+    first = manager.get_changes(0, manager.session_id)
+    assert first['full'] and first['servers'] == []
+    version, session = first['version'], first['session']
+
+    alpha = add(manager, 'alpha', path)
+    beta = add(manager, 'beta', path)
+    changes = manager.get_changes(version, session)
+    assert not changes['full'] and changes['version'] == version + 2
+    assert names(changes['added']) == ['alpha', 'beta']
+    assert changes['modified'] == [] and changes['removed'] == []
+    version = changes['version']
+
+    assert manager.get_changes(version, session) == {'session': session, 'version': version, 'full': False,
+                                                    'added': [], 'modified': [], 'removed': []}
+
+    manager.update_server(alpha, description='обновлен')
+    gamma = add(manager, 'gamma', path)
+    manager.update_server(gamma, description='новый')
+    manager.remove_server(beta)
+    delta = add(manager, 'delta', path)
+    manager.remove_server(delta)
+    changes = manager.get_changes(version, session)
+    assert [server['description'] for server in changes['modified']] == ['обновлен']
+    # Добавленный и сразу измененный сервер остается добавленным, добавленный и удаленный - не виден
+    assert [(server['name'], server['description']) for server in changes['added']] == [('gamma', 'новый')]
+    assert changes['removed'] == [beta]
+
+
+def test_full_list_for_other_session_or_unknown_version(make_manager, script):
+    manager = make_manager()
+    add(manager, 'alpha', script('srv', 'exec sleep 60\n'))
+    version = manager.state_version
+    for since, session in ((version - 1, None), (version - 1, 'прошлый процесс'), (version + 5, manager.session_id)):
+        changes = manager.get_changes(since, session)
+        assert changes['full'] and names(changes['servers']) == ['alpha']
+        assert changes['session'] == manager.session_id and changes['version'] == version
+
+
+def test_full_list_after_gap_in_change_log(make_manager, script):
+    manager = make_manager(changelog_size=5)
+    path = script('srv', 'exec sleep 60\n')
+    version = manager.state_version
+    server_id = add(manager, 'alpha', path)
+    for i in range(4):
+        manager.update_server(server_id, description=f'v{i}')
+    # Все 5 изменений еще в журнале
+    assert not manager.get_changes(version, manager.session_id)['full']
+    manager.update_server(server_id, description='v5')
+    # Первое изменение вытеснено: клиент с версией до него получает полный список
+    changes = manager.get_changes(version, manager.session_id)
+    assert changes['full'] and changes['servers'][0]['description'] == 'v5'
+    assert not manager.get_changes(version + 1, manager.session_id)['full']
+
+
+def test_client_copy_follows_pushed_changes(make_manager, script):
+    manager = make_manager(changelog_size=3)
+    path = script('srv', 'exec sleep 60\n')
+    client = main.NodeClient('local', '127.0.0.1', 0)
+    client._apply_changes(manager.get_changes(0))
+    pushed = []
+    received = threading.Condition()
+
+    def on_event(event, payload):
+        if event == 'changes':
+            with received:
+                pushed.append(payload)
+                received.notify_all()
+
+    manager.add_listener(on_event)
+    ids = [add(manager, name, path) for name in ('alpha', 'beta', 'gamma')]
+    manager.update_server(ids[0], description='изменен')
+    manager.remove_server(ids[1])
+    with received:
+        assert received.wait_for(lambda: pushed and pushed[-1]['version'] == manager.state_version, 5)
+    for changes in pushed:
+        # Как NodeClient: пакет применяется, только если продолжает известную версию, иначе синхронизация
+        if changes['session'] == client.session and changes['since_version'] == client.version:
+            client._apply_changes(changes)
+        else:
+            client._apply_changes(manager.get_changes(client.version, client.session))
+    assert sorted(client.servers) == sorted(server['id'] for server in manager.get_servers())
+    assert client.servers[ids[0]]['description'] == 'изменен'
+    assert client.version == manager.state_version
@@ -0,0 +1,161 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import psutil
+import pytest
+
+import main
+
+
+MAIN = os.path.abspath(main.__file__)
+TOKEN = 's3cret'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class Agent:
+    """Менеджер в режиме --headless в отдельном каталоге и процессе"""
+
+    def __init__(self, directory, port):
+        self.directory = directory
+        self.port = port
+        self.process = None
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'app_settings.json'), 'w', encoding='utf-8') as f:
+            json.dump({'health_probe': False, 'log_archive': False, 'log_file': '', 'api_token': TOKEN}, f)
+        self.script = os.path.join(directory, 'srv.sh')
+        with open(self.script, 'w', encoding='utf-8') as f:
+            f.write('#!/bin/sh\nwhile read line; do echo "$line"; done\n')
+        os.chmod(self.script, 0o755)
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, MAIN, '--headless', '--host', '127.0.0.1',
+                                         '--port', str(self.port)], cwd=self.directory,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        assert wait_for(self.answers), 'агент не запустился'
+
+    def answers(self):
+        try:
+            return 'result' in self.call('get_servers')
+        except OSError:
+            return False
+
+    def call(self, function, *args):
+        return main.api_request('POST', f'/call/{function}', list(args), None, '127.0.0.1', self.port, token=TOKEN)
+
+    def kill(self):
+        """Аварийное завершение агента вместе с запущенными им серверами"""
+        try:
+            children = psutil.Process(self.process.pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            children = []
+        for process in [self.process, *children]:
+            try:
+                process.kill()
+            except (psutil.NoSuchProcess, ProcessLookupError):
+                pass
+        self.process.wait(10)
+        psutil.wait_procs(children, timeout=10)
+
+
+@pytest.fixture
+def agents(tmp_path):
+    created = [Agent(str(tmp_path / name), free_port()) for name in ('a', 'b')]
+    for agent in created:
+        agent.start()
+    yield created
+    for agent in created:
+        if agent.process.poll() is None:
+            agent.kill()
+
+
+@pytest.fixture
+def nodes(agents):
+    events = []
+    clients = [main.NodeClient(name, '127.0.0.1', agent.port, TOKEN, timeout=5,
+                               on_event=lambda *event: events.append(event))
+               for name, agent in zip(('a', 'b'), agents)]
+    for client in clients:
+        client.start()
+    assert wait_for(lambda: all(client.status == 'online' for client in clients))
+    yield clients
+    for client in clients:
+        client.stop()
+
+
+def names(client):
+    with client.lock:
+        return sorted(server['name'] for server in client.servers.values())
+
+
+def test_catalogue_follows_agents(agents, nodes):
+    a, b = agents
+    node_a, node_b = nodes
+    assert a.call('add_server', 'alpha', a.script, '')['result']['success']
+    assert b.call('add_server', 'beta', b.script, '')['result']['success']
+    assert wait_for(lambda: names(node_a) == ['alpha'] and names(node_b) == ['beta'])
+
+    server_id = next(iter(node_a.servers))
+    assert a.call('remove_server', server_id)['result'] is True
+    assert wait_for(lambda: names(node_a) == [])
+    assert names(node_b) == ['beta']
+
+
+def test_batch_goes_to_agent(agents, nodes):
+    a, _ = agents
+    node_a, _ = nodes
+    a.call('add_server', 'alpha', a.script, '')
+    replies = node_a.batch([{'method': 'get_servers', 'args': []}, {'method': 'no_such_function', 'args': []}])
+    assert [server['name'] for server in replies[0]['result']] == ['alpha']
+    assert 'error' in replies[1]
+
+
+def test_agent_restart_replaces_catalogue(agents, nodes):
+    _, b = agents
+    _, node_b = nodes
+    assert b.call('add_server', 'old', b.script, '')['result']['success']
+    assert wait_for(lambda: names(node_b) == ['old'])
+    session = node_b.session
+
+    # После перезапуска с пустым каталогом id и номера версий начинаются заново,
+    # поэтому по ним одним клиент не отличил бы новый каталог от старого
+    b.kill()
+    assert wait_for(lambda: node_b.status == 'offline')
+    assert names(node_b) == ['old']
+    for name in ('servers.json', 'servers.db'):
+        if os.path.exists(os.path.join(b.directory, name)):
+            os.remove(os.path.join(b.directory, name))
+    b.start()
+    assert b.call('add_server', 'new', b.script, '')['result']['success']
+
+    assert wait_for(lambda: node_b.status == 'online' and names(node_b) == ['new'], timeout=30)
+    assert node_b.session != session
+    assert next(iter(node_b.servers)) == 1
+
+    # Поток событий работает уже в новой сессии агента
+    assert b.call('add_server', 'newer', b.script, '')['result']['success']
+    assert wait_for(lambda: names(node_b) == ['new', 'newer'])
+
+
+def test_agent_rejects_wrong_token(agents):
+    a, _ = agents
+    client = main.NodeClient('a', '127.0.0.1', a.port, 'wrong', timeout=5)
+    with pytest.raises(PermissionError):
+        client.request('POST', '/call/get_servers', [])
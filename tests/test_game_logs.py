@@ -0,0 +1,86 @@
+import time
+
+import main
+
+
+def batch(*texts, start=None):
+    start = time.time() if start is None else start
+    return [(i + 1, start + i * 0.001, text) for i, text in enumerate(texts)]
+
+
+def test_startup_time():
+    parser = main.GameLogParser()
+    parser.start_session(1)
+    lines = batch('[12:00:00] [Server thread/INFO]: Preparing level "world"',
+                  '[12:00:05] [Server thread/INFO]: Done (5.123s)! For help, type "help"')
+    parser.feed(1, lines)
+    stats = parser.get(1)
+    assert stats['startup_seconds'] == 5.123
+    assert stats['started_at'] == lines[1][1]
+    assert stats['lines_total'] == 2
+
+    # Новый запуск сбрасывает время старта
+    parser.start_session(1)
+    assert parser.get(1)['startup_seconds'] is None
+
+
+def test_joins_and_leaves():
+    parser = main.GameLogParser()
+    parser.feed(1, batch('[12:00:01] [Server thread/INFO]: Steve joined the game',
+                         '[12:00:02] [Server thread/INFO]: Alex_2 joined the game',
+                         '[12:00:03] [Server thread/INFO]: <Steve> Notch joined the game',
+                         '[12:00:04] [Server thread/INFO]: [Not Secure] <Alex_2> Herobrine left the game',
+                         '[12:00:05] [Server thread/INFO]: Steve left the game'))
+    stats = parser.get(1)
+    assert stats['players'] == ['Alex_2']
+    assert stats['joins_total'] == 2
+
+    # Вход и выход в одном пакете применяются по порядку строк
+    parser.feed(1, batch('[12:01:00] [Server thread/INFO]: Steve joined the game',
+                         '[12:01:01] [Server thread/INFO]: Steve left the game',
+                         '[12:01:02] [Server thread/INFO]: Notch joined the game'))
+    assert parser.get(1)['players'] == ['Alex_2', 'Notch']
+    parser.end_session(1)
+    assert parser.get(1)['players_online'] == 0 and parser.get(1)['joins_total'] == 4
+
+
+def test_lag_lines():
+    parser = main.GameLogParser()
+    parser.feed(1, batch("[12:00:01] [Server thread/WARN]: Can't keep up! Is the server overloaded? "
+                         "Running 2503ms or 50 ticks behind",
+                         "[12:00:09] [Server thread/WARN]: Can't keep up! Is the server overloaded? "
+                         "Running 5000ms or 100 ticks behind",
+                         '[12:00:10] [Server thread/INFO]: <Steve> Can\'t keep up with you'))
+    stats = parser.get(1)
+    assert stats['lag_events_total'] == 2
+    assert stats['lag_ticks_total'] == 150
+    assert stats['lag_events_per_minute'] == 2
+
+    parser.feed(2, batch("[11:00:00] [Server thread/WARN]: Can't keep up! Running 2000ms or 40 ticks behind",
+                         start=time.time() - 3600))
+    stats = parser.get(2)
+    assert stats['lag_events_total'] == 1 and stats['lag_events_per_minute'] == 0
+
+
+def test_exception_types():
+    parser = main.GameLogParser()
+    parser.feed(1, batch('[12:00:01] [Server thread/ERROR]: Encountered an unexpected exception',
+                         'java.lang.NullPointerException: Cannot invoke "Object.toString()"',
+                         '\tat net.minecraft.server.MinecraftServer.tick(MinecraftServer.java:100)',
+                         'Caused by: java.io.IOException: Broken pipe',
+                         '[12:00:02] [Netty Epoll Server IO #1/ERROR]: Error: io.netty.handler.codec.DecoderException',
+                         'java.lang.NullPointerException',
+                         '[12:00:03] [Server thread/INFO]: <Steve> I got an Exception yesterday'))
+    stats = parser.get(1)
+    assert stats['exception_types'] == {'java.lang.NullPointerException': 2,
+                                        'io.netty.handler.codec.DecoderException': 1}
+    assert stats['exceptions_total'] == 3 and stats['exceptions_per_minute'] == 3
+
+
+def test_servers_are_separate_and_unknown_is_none():
+    parser = main.GameLogParser()
+    parser.feed(1, batch('[12:00:01] [Server thread/INFO]: Steve joined the game'))
+    parser.feed(2, batch('[12:00:01] [Server thread/INFO]: plain line'))
+    assert parser.get(1)['players'] == ['Steve']
+    assert parser.get(2)['players'] == [] and parser.get(2)['lines_total'] == 1
+    assert parser.get(3) is None
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import struct
+import threading
+import time
+
+import pytest
+
+import main
+
+
+STATUS = {
+    'version': {'name': '1.20.4', 'protocol': 765},
+    'players': {'online': 3, 'max': 20},
+    'description': {'text': 'Привет', 'extra': [{'text': ', мир'}]}
+}
+
+
+async def read_packet(reader):
+    length = await main.read_varint(reader)
+    return await reader.readexactly(length)
+
+
+class FakeServer:
+    """Сервер Minecraft в отдельном цикле событий: отвечает на Server List Ping или молча закрывает соединение"""
+
+    def __init__(self, slp=True):
+        self.slp = slp
+        self.loop = asyncio.new_event_loop()
+        self.handshakes = []
+        started = threading.Event()
+
+        async def serve():
+            self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+            self.port = self.server.sockets[0].getsockname()[1]
+            started.set()
+
+        self.loop.create_task(serve())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        started.wait(5)
+
+    async def handle(self, reader, writer):
+        try:
+            if not self.slp:
+                return
+            self.handshakes.append(await read_packet(reader))
+            await read_packet(reader)
+            body = json.dumps(STATUS).encode('utf-8')
+            writer.write(main.encode_packet(0x00, main.encode_varint(len(body)) + body))
+            ping = await read_packet(reader)
+            writer.write(main.encode_packet(0x01, ping[1:]))
+            await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def create(slp=True):
+        server = FakeServer(slp)
+        servers.append(server)
+        return server
+
+    yield create
+    for server in servers:
+        server.close()
+
+
+def test_server_list_ping_reads_status(fake_server):
+    server = fake_server()
+    result = asyncio.run(main.server_list_ping('127.0.0.1', server.port, timeout=2))
+    assert result['tcp'] and result['slp']
+    assert result['version'] == '1.20.4'
+    assert result['protocol'] == 765
+    assert (result['players_online'], result['players_max']) == (3, 20)
+    assert result['motd'] == 'Привет, мир'
+    assert result['latency_ms'] >= 0
+    # Рукопожатие: id пакета, версия протокола -1, адрес, порт и следующее состояние status
+    handshake = server.handshakes[0]
+    assert handshake[:2] == b'\x00' + main.encode_varint(-1)[:1]
+    assert handshake.endswith(struct.pack('>H', server.port) + b'\x01')
+
+
+def test_server_list_ping_without_minecraft_protocol(fake_server):
+    server = fake_server(slp=False)
+    result = asyncio.run(main.server_list_ping('127.0.0.1', server.port, timeout=2))
+    assert result['tcp'] is True
+    assert result['slp'] is False
+
+
+def test_server_list_ping_refused():
+    server = FakeServer()
+    port = server.port
+    server.close()
+    time.sleep(0.1)
+    with pytest.raises(OSError):
+        asyncio.run(main.server_list_ping('127.0.0.1', port, timeout=2))
+
+
+class Entry:
+    def __init__(self, server_id):
+        self.server_id = server_id
+        self.exited = threading.Event()
+        self.stop_requested = False
+
+
+def test_health_prober_reports_until_exit(fake_server):
+    server = fake_server()
+    results = []
+    reported = threading.Condition()
+
+    def on_result(entry, result):
+        with reported:
+            results.append((entry.server_id, result))
+            reported.notify_all()
+
+    prober = main.HealthProber(on_result, interval_starting=0.05, interval_ready=0.05, timeout=2)
+    prober.start()
+    try:
+        entry = Entry(1)
+        prober.watch(entry, '127.0.0.1', server.port)
+        with reported:
+            assert reported.wait_for(lambda: len(results) >= 2, 5)
+        assert all(server_id == 1 and result['slp'] for server_id, result in results)
+        assert results[0][1]['players_online'] == 3
+
+        entry.exited.set()
+        time.sleep(0.2)
+        count = len(results)
+        time.sleep(0.2)
+        assert len(results) == count
+    finally:
+        prober.stop()
+
+
+def test_health_prober_reports_closed_port():
+    server = FakeServer()
+    port = server.port
+    server.close()
+    results = []
+    done = threading.Event()
+
+    def on_result(entry, result):
+        results.append(result)
+        done.set()
+
+    prober = main.HealthProber(on_result, interval_starting=0.05, timeout=1)
+    prober.start()
+    try:
+        entry = Entry(2)
+        prober.watch(entry, '127.0.0.1', port)
+        assert done.wait(5)
+        assert results[0]['tcp'] is False
+        assert results[0]['error']
+        entry.exited.set()
+        time.sleep(0.2)
+    finally:
+        prober.stop()
+
+
+TCP_ONLY = {'tcp': True, 'connect_ms': 1.0, 'slp': False}
+SLP = {'tcp': True, 'connect_ms': 1.0, 'slp': True, 'latency_ms': 1.0, 'players_online': 0, 'players_max': 20}
+
+
+@pytest.mark.parametrize('protocol, ready_after', [('minecraft', SLP), ('tcp', TCP_ONLY)])
+def test_ready_requires_server_list_ping(make_manager, script, protocol, ready_after):
+    manager = make_manager()
+    server_id = manager.add_server('srv', script('srv', 'exec sleep 60\n'), '', probe_protocol=protocol)['server']['id']
+    assert manager.start_server(server_id)['success']
+    entry = manager.processes[server_id]
+    server = manager.servers[server_id]
+
+    manager.on_probe_result(entry, {'tcp': False, 'slp': False, 'error': 'Connection refused'})
+    assert server.health == 'starting'
+    if protocol == 'minecraft':
+        # Порт уже открыт, но мир еще загружается
+        manager.on_probe_result(entry, TCP_ONLY)
+        assert server.health == 'starting' and server.time_to_ready is None
+        assert not manager.wait_ready(server_id, 0)
+
+    manager.on_probe_result(entry, ready_after)
+    assert server.health == 'ready' and server.time_to_ready is not None
+    assert manager.wait_ready(server_id, 0)
+
+    manager.on_probe_result(entry, {'tcp': False, 'slp': False, 'error': 'timeout'})
+    assert server.health == 'unreachable'
@@ -0,0 +1,48 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def cgroup(tmp_path, monkeypatch):
+    mount = tmp_path / 'cgroup'
+    base = mount / 'serwhat'
+    base.mkdir(parents=True)
+    (mount / 'cgroup.controllers').write_text('cpu memory pids\n')
+    (base / 'cgroup.subtree_control').write_text('cpu\n')
+    monkeypatch.setattr(main.ServerManager, 'CGROUP_MOUNT', str(mount))
+    return base
+
+
+def test_cgroup_untouched_without_memory_limit(make_manager, script, cgroup):
+    manager = make_manager(cgroup_root=str(cgroup))
+    server_id = manager.add_server('srv', script('srv', 'exec sleep 60\n'), '')['server']['id']
+    assert manager.start_server(server_id)['success']
+    assert (cgroup / 'cgroup.subtree_control').read_text() == 'cpu\n'
+    assert manager.cgroup_base is None
+
+
+def test_memory_limit_enables_controller_on_first_use(make_manager, script, cgroup):
+    manager = make_manager(cgroup_root=str(cgroup))
+    assert (cgroup / 'cgroup.subtree_control').read_text() == 'cpu\n'
+    server_id = manager.add_server('srv', script('srv', 'exec sleep 60\n'), '',
+                                   memory_limit_mb=512)['server']['id']
+    assert manager.start_server(server_id)['success']
+    assert (cgroup / 'cgroup.subtree_control').read_text() == '+memory'
+    group = cgroup / f'serwhat-server-{server_id}'
+    assert (group / 'memory.max').read_text() == str(512 * 1024 * 1024)
+    assert (group / 'cgroup.procs').read_text() == str(manager.processes[server_id].pid)
+
+
+def test_unavailable_cgroup_falls_back_to_rlimit_once(make_manager, script, cgroup, monkeypatch):
+    manager = make_manager(cgroup_root=str(cgroup / 'missing'))
+    calls = []
+    detect = manager._detect_cgroup_base
+    monkeypatch.setattr(manager, '_detect_cgroup_base', lambda root: calls.append(root) or detect(root))
+    path = script('srv', 'exec sleep 60\n')
+    for name in ('first', 'second'):
+        server_id = manager.add_server(name, path, '', memory_limit_mb=4096)['server']['id']
+        assert manager.start_server(server_id)['success']
+        limit = manager.processes[server_id].get_ps_process().rlimit(main.psutil.RLIMIT_AS)
+        assert limit == (4096 * 1024 * 1024, 4096 * 1024 * 1024)
+    assert len(calls) == 1 and manager.cgroup_base is None
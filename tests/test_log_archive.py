@@ -0,0 +1,149 @@
+import gzip
+import json
+import os
+import threading
+
+import pytest
+
+import main
+
+
+START = 1_700_000_000.0
+
+
+def make_lines(count, start=START, step=0.01, first_seq=1):
+    return [(first_seq + i, start + i * step, f'[Server thread/INFO]: строка {i} ' + 'x' * 30) for i in range(count)]
+
+
+def texts(results):
+    return [text for _, text in results]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archives = []
+
+    def create(**kwargs):
+        archive = main.LogArchive(str(tmp_path / 'logs'), **kwargs)
+        archives.append(archive)
+        return archive
+
+    yield create
+    for archive in archives:
+        archive.close()
+
+
+@pytest.fixture
+def held_sealer(monkeypatch):
+    """Сжатие сегментов ждет release.set()"""
+    release = threading.Event()
+    seal = main.LogArchive._seal
+    monkeypatch.setattr(main.LogArchive, '_seal', lambda self, path: (release.wait(10), seal(self, path)))
+    yield release
+    release.set()
+
+
+def test_sealed_segments_are_indexed_gzip_members(archive, tmp_path):
+    logs = archive(segment_bytes=256 * 1024)
+    lines = make_lines(20000)
+    for i in range(0, len(lines), 500):
+        logs.append(7, lines[i:i + 500])
+    logs.close()
+
+    directory = tmp_path / 'logs' / '7'
+    names = sorted(os.listdir(directory))
+    assert not [name for name in names if name.endswith('.log')]
+    indexes = [name for name in names if name.endswith('.idx')]
+    assert len(indexes) >= 3
+    for name in indexes:
+        base = str(directory / name[:-len('.idx')])
+        with open(base + '.idx', encoding='utf-8') as f:
+            index = json.load(f)
+        assert len(index['blocks']) > 1
+        assert [block[1] for block in index['blocks']] == sorted(block[1] for block in index['blocks'])
+        # Каждый блок - отдельный gzip member, читаемый с его смещения
+        with open(base + '.log.gz', 'rb') as f:
+            f.seek(index['blocks'][1][1])
+            first_line = gzip.GzipFile(fileobj=f).readline()
+        assert float(first_line.split(b'\t')[0]) == pytest.approx(index['blocks'][1][0], abs=0.001)
+
+
+def test_search_by_time_and_pattern(archive):
+    logs = archive(segment_bytes=256 * 1024)
+    lines = make_lines(20000)
+    logs.append(7, lines[:10000])
+    logs.rotate(7)
+    logs.append(7, lines[10000:])
+    logs.close()
+
+    logs = archive(segment_bytes=256 * 1024)
+    assert texts(logs.search(7)) == [text for _, _, text in lines]
+    window = list(logs.search(7, START + 50, START + 60))
+    assert texts(window) == [text for _, ts, text in lines if START + 50 <= round(ts, 3) <= START + 60]
+    assert len(window) == 1001
+    assert texts(logs.search(7, pattern=r'строка 1999\d ')) == [f'[Server thread/INFO]: строка 1999{d} ' + 'x' * 30
+                                                                for d in range(10)]
+    assert list(logs.search(8)) == []
+
+
+def test_search_sees_active_and_unsealed_segments(archive, held_sealer):
+    logs = archive()
+    lines = make_lines(3000)
+    logs.append(7, lines[:1000])
+    logs.rotate(7)
+    logs.append(7, lines[1000:2000])
+    logs.rotate(7)
+    logs.append(7, lines[2000:])
+    # Два сегмента ждут сжатия, третий активен
+    assert texts(logs.search(7)) == [text for _, _, text in lines]
+    assert len(list(logs.search(7, START + 15, START + 25))) == 1001
+
+    held_sealer.set()
+    logs.close()
+    assert texts(archive().search(7)) == [text for _, _, text in lines]
+
+
+def test_segment_sealed_during_search(archive, held_sealer, monkeypatch):
+    logs = archive()
+    lines = make_lines(2000)
+    logs.append(7, lines[:1000])
+    logs.rotate(7)
+    logs.append(7, lines[1000:])
+    stale = logs._segments(7)
+    held_sealer.set()
+    logs._sealer.submit(lambda: None).result()
+    assert any(not os.path.exists(path) for _, _, path, _, _ in stale)
+    # Поиск со списком сегментов, снятым до сжатия, берет сжатый сегмент
+    monkeypatch.setattr(logs, '_segments', lambda server_id: stale)
+    assert texts(logs.search(7)) == [text for _, _, text in lines]
+
+
+def test_index_written_after_archive(archive, monkeypatch):
+    published = []
+    write = main.write_file_atomic
+
+    def check_order(path, data):
+        if path.endswith('.idx'):
+            published.append(os.path.exists(path[:-len('.idx')] + '.log.gz'))
+        return write(path, data)
+
+    monkeypatch.setattr(main, 'write_file_atomic', check_order)
+    logs = archive()
+    logs.append(7, make_lines(100))
+    logs.close()
+    assert published == [True]
+
+
+def test_crashed_segment_recovered_at_startup(archive, tmp_path):
+    lines = make_lines(500)
+    directory = tmp_path / 'logs' / '7'
+    directory.mkdir(parents=True)
+    # Сегмент, оставшийся открытым после аварийного завершения (последняя строка оборвана)
+    data = ''.join(f'{ts:.3f}\t{text}\n' for _, ts, text in lines) + f'{START + 10:.3f}\tоборв'
+    (directory / f'{int(START * 1000)}.log').write_text(data, encoding='utf-8')
+
+    logs = archive()
+    assert texts(logs.search(7)) == [text for _, _, text in lines]
+    logs._sealer.submit(lambda: None).result()
+    assert sorted(os.listdir(directory)) == [f'{int(START * 1000)}.idx', f'{int(START * 1000)}.log.gz']
+    assert texts(logs.search(7)) == [text for _, _, text in lines]
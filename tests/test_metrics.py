@@ -0,0 +1,79 @@
+import threading
+
+import main
+
+
+def test_rollups_average_and_max_rss():
+    series = main.MetricSeries(raw_size=3)
+    for second, (cpu, rss) in enumerate([(10, 100), (30, 300), (20, 200)]):
+        series.add((120 + second, cpu, rss, 0, 0, 1, 1))
+    series.add((180, 50, 50, 0, 0, 1, 1))
+
+    raw = series.get()
+    assert raw['columns'][0] == 'time'
+    assert [point[0] for point in raw['points']] == [121, 122, 180]
+
+    minutes = series.get('1m')
+    assert minutes['columns'][-1] == 'rss_max'
+    closed, current = minutes['points']
+    assert closed[0] == 120 and closed[1] == 20 and closed[2] == 200 and closed[-1] == 300
+    assert current[0] == 180 and current[1] == 50
+
+
+def test_concurrent_add_and_get():
+    series = main.MetricSeries(raw_size=2000)
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            try:
+                for resolution in ('raw', '1m', '1h'):
+                    series.get(resolution)
+            except RuntimeError as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for i in range(30000):
+        series.add((i, 1.0, 100, 0, 0, 1, 1))
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert errors == []
+
+
+def test_metrics_listener_serves_only_metrics(make_manager):
+    import http.client
+    import socket
+
+    from conftest import wait_for
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    manager = make_manager()
+    server = main.start_metrics_listener(manager, port)
+
+    def get(path):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            return response.status, response.getheader('Content-Type'), response.read().decode('utf-8')
+        except OSError:
+            return None
+        finally:
+            connection.close()
+
+    try:
+        assert wait_for(lambda: get('/metrics') is not None)
+        status, content_type, body = get('/metrics')
+        assert status == 200 and content_type.startswith('text/plain')
+        assert '# TYPE serwhat_servers gauge' in body
+        assert get('/methods')[0] == 404
+        assert get('/events?since=0')[0] == 404
+        assert manager.listeners == []
+    finally:
+        server.stop()
@@ -0,0 +1,87 @@
+import struct
+import zipfile
+
+import pytest
+
+import main
+
+
+def make_jar(path, main_class, class_major=61):
+    with zipfile.ZipFile(path, 'w') as jar:
+        jar.writestr('META-INF/MANIFEST.MF', f'Manifest-Version: 1.0\nMain-Class: {main_class}\n')
+        jar.writestr(main_class.replace('.', '/') + '.class', b'\xca\xfe\xba\xbe' + struct.pack('>HH', 0, class_major))
+
+
+@pytest.fixture
+def server_dir(tmp_path):
+    java = tmp_path / 'java'
+    java.write_text('#!/bin/sh\necho \'openjdk version "17.0.2" 2022-01-18\' >&2\n')
+    java.chmod(0o755)
+    return tmp_path
+
+
+def check(directory, command):
+    script = directory / 'start.sh'
+    script.write_text(f'#!/bin/sh\n# запуск сервера\n{command}\n')
+    return main.LaunchPreflight().check(str(script), str(directory))
+
+
+def test_vanilla_requires_eula(server_dir):
+    make_jar(server_dir / 'server.jar', 'net.minecraft.bundler.Main')
+    report = check(server_dir, 'java -Xmx2G -jar server.jar nogui')
+    assert report['java_version'] == '17.0.2'
+    assert report['required_java'] == 17
+    assert report['eula_required'] is True
+    assert report['errors'] == ['EULA не принята: укажите eula=true в eula.txt']
+
+    (server_dir / 'eula.txt').write_text('#By changing the setting below to TRUE\neula=true\n')
+    report = check(server_dir, 'java -Xmx2G -jar server.jar nogui')
+    assert report['errors'] == [] and report['eula'] is True
+
+
+def test_proxy_without_eula_is_a_warning(server_dir):
+    make_jar(server_dir / 'velocity.jar', 'com.velocitypowered.proxy.Velocity')
+    report = check(server_dir, 'java -Xms512M -jar velocity.jar')
+    assert report['eula_required'] is False
+    assert report['errors'] == []
+    assert len(report['warnings']) == 1 and report['eula'] is False
+
+
+def test_server_properties_requires_eula(server_dir):
+    make_jar(server_dir / 'custom.jar', 'com.example.Launcher')
+    (server_dir / 'server.properties').write_text('server-port=25565\n')
+    report = check(server_dir, 'java -jar custom.jar')
+    assert report['eula_required'] is True
+    assert report['errors'] == ['EULA не принята: укажите eula=true в eula.txt']
+
+
+def test_forge_args_file_requires_eula(server_dir):
+    report = check(server_dir, 'java @user_jvm_args.txt @libraries/net/minecraftforge/forge/1.20.1-47.2.0/'
+                               'unix_args.txt "$@"')
+    assert report['jar'] is None
+    assert report['eula_required'] is True
+    assert report['errors'] == ['EULA не принята: укажите eula=true в eula.txt']
+
+
+def test_newer_class_file_than_java(server_dir):
+    make_jar(server_dir / 'server.jar', 'io.papermc.paperclip.Main', class_major=65)
+    (server_dir / 'eula.txt').write_text('eula=true\n')
+    report = check(server_dir, 'java -jar server.jar')
+    assert report['errors'] == ['Jar требует Java 21, а найдена Java 17']
+
+
+def test_missing_jar(server_dir):
+    report = check(server_dir, 'java -jar missing.jar')
+    assert report['errors'][0].startswith('Jar файл не найден')
+
+
+def test_results_cached_until_file_changes(server_dir):
+    make_jar(server_dir / 'server.jar', 'net.minecraft.server.Main')
+    (server_dir / 'eula.txt').write_text('eula=true\n')
+    script = server_dir / 'start.sh'
+    script.write_text('java -jar server.jar\n')
+    preflight = main.LaunchPreflight()
+    assert preflight.check(str(script), str(server_dir))['errors'] == []
+    misses = preflight.misses
+    assert preflight.check(str(script), str(server_dir))['errors'] == []
+    assert preflight.misses == misses and preflight.hits > 0
@@ -0,0 +1,119 @@
+import errno
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+import main
+from conftest import wait_for
+
+
+READS_STOP = 'while read line; do [ "$line" = stop ] && exit 0; done\n'
+IGNORES_STOP = 'exec sleep 60\n'
+IGNORES_TERM = "trap '' TERM\nwhile true; do sleep 0.1; done\n"
+
+
+def add(manager, path, stop_timeout=0.5):
+    server = manager.add_server('srv', path, '')['server']
+    manager.servers[server['id']].stop_timeout = stop_timeout
+    return server['id']
+
+
+def stop_and_wait(manager, server_id):
+    entry = manager.processes[server_id]
+    started = time.monotonic()
+    assert manager.stop_server(server_id) == {'success': True, 'status': 'stopping'}
+    assert wait_for(lambda: server_id not in manager.processes)
+    return entry, time.monotonic() - started
+
+
+def test_stop_command_exits_without_signals(make_manager, script):
+    manager = make_manager(kill_timeout=0.5)
+    server_id = add(manager, script('srv', READS_STOP), stop_timeout=5)
+    assert manager.start_server(server_id)['success']
+    entry, elapsed = stop_and_wait(manager, server_id)
+    assert entry.returncode == 0
+    assert elapsed < 2
+    assert manager.servers[server_id].status == 'stopped'
+
+
+def test_stop_escalates_to_sigterm(make_manager, script):
+    manager = make_manager(kill_timeout=5)
+    server_id = add(manager, script('srv', IGNORES_STOP))
+    assert manager.start_server(server_id)['success']
+    entry, elapsed = stop_and_wait(manager, server_id)
+    assert entry.returncode == -signal.SIGTERM
+    assert 0.5 <= elapsed < 3
+
+
+def test_stop_escalates_to_sigkill(make_manager, script):
+    manager = make_manager(kill_timeout=0.5)
+    server_id = add(manager, script('srv', IGNORES_TERM))
+    assert manager.start_server(server_id)['success']
+    time.sleep(0.2)
+    entry, elapsed = stop_and_wait(manager, server_id)
+    assert entry.returncode == -signal.SIGKILL
+    assert 1.0 <= elapsed < 4
+    assert manager.servers[server_id].status == 'stopped'
+
+
+def test_start_rejected_while_running_or_stopping(make_manager, script):
+    manager = make_manager(kill_timeout=0.5)
+    server_id = add(manager, script('srv', IGNORES_STOP), stop_timeout=1)
+    assert manager.start_server(server_id)['success']
+    entry = manager.processes[server_id]
+
+    result = manager.start_server(server_id)
+    assert not result['success'] and result['status'] == 'running'
+
+    manager.stop_server(server_id)
+    result = manager.start_server(server_id)
+    assert not result['success'] and result['status'] == 'stopping'
+    assert manager.processes[server_id] is entry
+
+    assert wait_for(lambda: server_id not in manager.processes)
+    assert manager.start_server(server_id)['success']
+    assert manager.processes[server_id] is not entry
+
+
+@pytest.mark.parametrize('error', [errno.ENOSYS, errno.EPERM])
+def test_supervisor_falls_back_when_pidfd_unavailable(monkeypatch, error):
+    def pidfd_open(pid):
+        raise OSError(error, os.strerror(error))
+
+    monkeypatch.setattr(os, 'pidfd_open', pidfd_open, raising=False)
+    exits = []
+    supervisor = main.ProcessSupervisor(exits.append)
+    supervisor.use_pidfd = True
+    supervisor.start()
+    process = subprocess.Popen(['sleep', '60'])
+    try:
+        entry = main.ManagedProcess(1, process)
+        supervisor.watch(entry)
+        time.sleep(0.2)
+        assert exits == [] and not entry.exited.is_set()
+        assert supervisor.use_pidfd is False
+
+        process.kill()
+        assert wait_for(lambda: exits == [entry])
+        assert entry.returncode == -signal.SIGKILL
+    finally:
+        process.kill()
+        process.wait()
+        supervisor.stop()
+
+
+@pytest.mark.skipif(not hasattr(os, 'pidfd_open'), reason='нет pidfd')
+def test_supervisor_finishes_already_exited_process():
+    exits = []
+    supervisor = main.ProcessSupervisor(exits.append)
+    supervisor.start()
+    process = subprocess.Popen(['true'])
+    process.wait()
+    entry = main.ManagedProcess(1, process)
+    supervisor.watch(entry)
+    supervisor.stop()
+    assert exits == [entry]
+    assert entry.returncode == 0
@@ -0,0 +1,126 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import main
+from conftest import wait_for
+
+
+def next_after(expression, moment):
+    return main.CronSchedule(expression).next_after(datetime.fromisoformat(moment))
+
+
+@pytest.mark.parametrize('expression, moment, expected', [
+    ('*/15 * * * *', '2026-10-16 10:07:30', '2026-10-16 10:15'),
+    ('*/15 * * * *', '2026-10-16 10:45:00', '2026-10-16 11:00'),
+    # Строго после moment, даже если moment сам подходит
+    ('*/15 * * * *', '2026-10-16 10:15:00', '2026-10-16 10:30'),
+    ('5,35 * * * *', '2026-10-16 10:06:00', '2026-10-16 10:35'),
+    # Диапазон с шагом и будни: после вечера пятницы - утро понедельника
+    ('0 9-17/4 * * 1-5', '2026-10-16 18:00:00', '2026-10-19 09:00'),
+    ('0 9-17/4 * * 1-5', '2026-10-19 09:00:00', '2026-10-19 13:00'),
+    # 7 и 0 - воскресенье
+    ('0 12 * * 7', '2026-10-16 00:00:00', '2026-10-18 12:00'),
+    ('0 12 * * 0', '2026-10-16 00:00:00', '2026-10-18 12:00'),
+    # Только день месяца: переход через конец месяца и года
+    ('30 4 1 * *', '2026-01-31 12:00:00', '2026-02-01 04:30'),
+    ('0 0 1 1 *', '2026-10-17 00:00:00', '2027-01-01 00:00'),
+    ('0 0 29 2 *', '2026-03-01 00:00:00', '2028-02-29 00:00'),
+    ('0 0 31 * *', '2026-11-01 00:00:00', '2026-12-31 00:00'),
+    ('0 0 * 2-3 *', '2026-10-17 00:00:00', '2027-02-01 00:00'),
+])
+def test_next_after(expression, moment, expected):
+    assert next_after(expression, moment) == datetime.fromisoformat(expected)
+
+
+def test_day_of_month_or_day_of_week():
+    # Заданы оба поля: 13-е число или пятница, что раньше
+    expression = '0 0 13 * 5'
+    assert next_after(expression, '2026-11-01 00:00:00') == datetime(2026, 11, 6)
+    assert next_after(expression, '2026-11-06 00:00:00') == datetime(2026, 11, 13)
+    assert next_after(expression, '2026-11-13 00:00:00') == datetime(2026, 11, 20)
+    # Ограничено только одно поле: второе не расширяет набор дней
+    assert next_after('0 0 13 * *', '2026-11-01 00:00:00') == datetime(2026, 11, 13)
+    assert next_after('0 0 * * 5', '2026-11-07 00:00:00') == datetime(2026, 11, 13)
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '* 24 * * *', '5-1 * * * *', '*/0 * * * *',
+                                        'a * * * *', '0 0 0 * *', '0 0 * 13 *', '0 0 * * 8'])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        main.CronSchedule(expression)
+
+
+def test_never_firing_expression():
+    with pytest.raises(ValueError):
+        next_after('0 0 31 2 *', '2026-01-01 00:00:00')
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = main.TaskScheduler(max_workers=4)
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+def test_calls_fire_in_deadline_order(scheduler):
+    fired = []
+    done = threading.Event()
+    scheduler.call_later(0.3, lambda: (fired.append('late'), done.set()))
+    scheduler.call_later(0.2, fired.append, 'middle')
+    # Новый ближайший вызов будит поток, который спит до 0.3 с
+    scheduler.call_later(0.05, fired.append, 'early')
+    assert done.wait(2)
+    assert fired == ['early', 'middle', 'late']
+
+
+def test_cancelled_call_does_not_fire(scheduler):
+    fired = []
+    call = scheduler.call_later(0.05, fired.append, 'cancelled')
+    scheduler.call_later(0.1, fired.append, 'kept')
+    call.cancel()
+    assert wait_for(lambda: fired, 2)
+    time.sleep(0.1)
+    assert fired == ['kept']
+
+
+def test_slow_callback_does_not_delay_others(scheduler):
+    release = threading.Event()
+    fired = threading.Event()
+    scheduler.call_later(0, release.wait, 5)
+    scheduler.call_later(0.05, fired.set)
+    try:
+        assert fired.wait(1)
+    finally:
+        release.set()
+
+
+def test_failing_callback_keeps_scheduler_running(scheduler):
+    fired = threading.Event()
+    scheduler.call_later(0, lambda: 1 / 0)
+    scheduler.call_later(0.05, fired.set)
+    assert fired.wait(1)
+
+
+def test_interval_schedule_rearms_after_firing(make_manager):
+    manager = make_manager()
+    schedule = manager.add_schedule('tick', 'start', target=[], interval=0.2)['schedule']
+    first = schedule['next_run']
+    assert wait_for(lambda: schedule['last_run'] is not None, 3)
+    assert wait_for(lambda: schedule['next_run'] > first + 0.15, 3)
+    fired_once = schedule['last_run']
+    assert wait_for(lambda: schedule['last_run'] > fired_once, 3)
+
+
+def test_cron_rearm_skips_the_minute_that_fired(make_manager, monkeypatch):
+    manager = make_manager()
+    schedule = manager.add_schedule('minute', 'start', target=[], cron='* * * * *')['schedule']
+    fired_at = schedule['next_run']
+    # Таймер по monotonic сработал на полсекунды раньше срока по настенным часам
+    monkeypatch.setattr(main.time, 'time', lambda: fired_at - 0.5)
+    manager._arm_schedule(schedule, fired_at=fired_at)
+    assert schedule['next_run'] == fired_at + 60
+    manager.remove_schedule(schedule['id'])
@@ -0,0 +1,26 @@
+import json
+
+import main
+
+
+def test_save_keeps_keys_unknown_to_the_ui(make_manager, tmp_path):
+    manager = make_manager(storage='sqlite', api_token='s3cret',
+                           nodes=[{'name': 'a', 'host': '10.0.0.2', 'port': 8765}])
+    assert manager.save_app_settings({'language': 'en', 'theme': 'light'})
+
+    with open(tmp_path / 'app_settings.json', encoding='utf-8') as f:
+        stored = json.load(f)
+    assert stored['language'] == 'en' and stored['theme'] == 'light'
+    assert stored['storage'] == 'sqlite' and stored['api_token'] == 's3cret'
+    assert stored['nodes'][0]['host'] == '10.0.0.2'
+
+    settings = main.load_app_settings(str(tmp_path / 'app_settings.json'))
+    assert settings['storage'] == 'sqlite' and settings['language'] == 'en'
+
+
+def test_save_creates_missing_file(make_manager, tmp_path):
+    manager = make_manager()
+    (tmp_path / 'app_settings.json').unlink()
+    assert manager.save_app_settings({'theme': 'light'})
+    with open(tmp_path / 'app_settings.json', encoding='utf-8') as f:
+        assert json.load(f) == {'theme': 'light'}
@@ -0,0 +1,136 @@
+import json
+import os
+import random
+
+import pytest
+
+import main
+
+
+def read_tree(root, skip=()):
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            if relative not in skip:
+                with open(path, 'rb') as f:
+                    tree[relative] = f.read()
+    return tree
+
+
+@pytest.fixture
+def world(tmp_path):
+    rng = random.Random(1234)
+    root = tmp_path / 'server'
+    (root / 'world' / 'region').mkdir(parents=True)
+    for name in ('r.0.0.mca', 'r.0.1.mca'):
+        (root / 'world' / 'region' / name).write_bytes(rng.randbytes(1024 * 1024))
+    (root / 'world' / 'level.dat').write_bytes(rng.randbytes(3000))
+    (root / 'world' / 'session.lock').write_bytes(b'lock')
+    (root / 'server.properties').write_text('server-port=25565\n')
+    (root / 'start.sh').write_text('java -jar server.jar\n')
+    os.chmod(root / 'start.sh', 0o755)
+    return root
+
+
+@pytest.fixture
+def store(tmp_path):
+    return main.SnapshotStore(str(tmp_path / 'snapshots'))
+
+
+def test_repeat_snapshot_reuses_unchanged_files(store, world):
+    first = store.create(1, str(world))
+    assert first['stats']['files'] == 5
+    assert 'world/session.lock' not in first['files']
+    assert first['stats']['new_chunks'] > 0
+
+    second = store.create(1, str(world))
+    assert second['stats']['unchanged'] == 5
+    assert second['stats']['read_bytes'] == 0 and second['stats']['new_chunks'] == 0
+    assert int(second['id']) > int(first['id'])
+    assert store.list(1) == [first['id'], second['id']]
+
+
+def test_changed_file_stores_only_changed_chunks(store, world):
+    first = store.create(1, str(world))
+    region = world / 'world' / 'region' / 'r.0.0.mca'
+    data = bytearray(region.read_bytes())
+    data[500000:500004] = b'edit'
+    region.write_bytes(bytes(data))
+    second = store.create(1, str(world))
+    old_chunks = first['files']['world/region/r.0.0.mca']['chunks']
+    new_chunks = second['files']['world/region/r.0.0.mca']['chunks']
+    assert second['stats']['read_bytes'] == len(data)
+    assert second['stats']['new_chunks'] <= 2
+    assert len(set(new_chunks) - set(old_chunks)) == second['stats']['new_chunks']
+
+    # Вставка в начало сдвигает данные, но границы по содержимому восстанавливаются
+    region.write_bytes(b'prefix' + bytes(data))
+    third = store.create(1, str(world))
+    assert third['stats']['new_chunks'] <= 3
+    assert len(third['files']['world/region/r.0.0.mca']['chunks']) > 4
+
+
+def test_restore_round_trip(store, world, tmp_path):
+    manifest = store.create(1, str(world))
+    target = tmp_path / 'restored'
+    result = store.restore(1, manifest['id'], str(target))
+    assert result == {'files': 5, 'removed': 0}
+    assert read_tree(target) == read_tree(world, skip={'world/session.lock'})
+    start = os.stat(target / 'start.sh')
+    assert start.st_mode & 0o777 == 0o755
+    assert start.st_mtime_ns == os.stat(world / 'start.sh').st_mtime_ns
+
+
+def test_restore_clean_removes_extra_files(store, world):
+    original = read_tree(world)
+    manifest = store.create(1, str(world))
+    (world / 'world' / 'level.dat').write_bytes(b'corrupted')
+    (world / 'server.properties').unlink()
+    (world / 'world' / 'region' / 'r.9.9.mca').write_bytes(b'new region')
+
+    kept = store.restore(1, manifest['id'], str(world))
+    assert kept['removed'] == 0
+    assert (world / 'world' / 'region' / 'r.9.9.mca').exists()
+
+    cleaned = store.restore(1, manifest['id'], str(world), clean=True)
+    assert cleaned['removed'] == 1
+    # session.lock не попадает в снимок и не удаляется при восстановлении
+    assert read_tree(world) == original
+
+
+def test_restore_rejects_paths_outside_target(store, world, tmp_path):
+    manifest = store.create(1, str(world))
+    path = os.path.join(store._manifest_dir(1), f"{manifest['id']}.json")
+    manifest['files']['../escape'] = manifest['files']['server.properties']
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError):
+        store.restore(1, manifest['id'], str(tmp_path / 'restored'))
+    assert not (tmp_path / 'escape').exists()
+
+
+def test_prune_keeps_chunks_still_referenced(store, world, tmp_path):
+    first = store.create(1, str(world))
+    (world / 'world' / 'level.dat').write_bytes(b'level v2' * 1000)
+    second = store.create(1, str(world))
+    store.create(2, str(world))
+
+    # Освобождается только старый level.dat, остальные куски нужны второму снимку
+    result = store.prune(1, keep_last=1)
+    assert result['removed_snapshots'] == [first['id']]
+    assert result['freed_chunks'] == 1 and result['freed_bytes'] > 0
+    assert store.list(1) == [second['id']]
+
+    # Все куски сервера 1 есть и в снимке сервера 2
+    result = store.prune(1, keep_last=0)
+    assert result['removed_snapshots'] == [second['id']] and result['freed_chunks'] == 0
+
+    target = tmp_path / 'restored'
+    store.restore(2, store.list(2)[-1], str(target))
+    assert read_tree(target) == read_tree(world, skip={'world/session.lock'})
+
+    result = store.prune(2, keep_last=0)
+    assert result['freed_chunks'] > 0
+    assert read_tree(store.root + '/chunks') == {}